@@ -1,7 +1,12 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
-from scripts import transactions, cnae, chat, maturity, userCrud
+from werkzeug.utils import secure_filename
+from scripts import transactions, counterparties, cnae, chat, maturity, search, cube, userCrud, metrics, profiling, llm_gateway, chat_history, aggregates, warmup, deadlines, delta
 from datetime import datetime
+import hmac
+import os
+import threading
+import time
 
 app = Flask(__name__)
 
@@ -18,6 +23,8 @@ CORS(app, resources={
     r"/transactions/*": {"origins": local_origins, "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]},
     r"/cnae/*": {"origins": local_origins, "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]},
     r"/maturity/*": {"origins": local_origins, "methods": ["GET", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]},
+    r"/analytics/*": {"origins": local_origins, "methods": ["GET", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]},
+    r"/search": {"origins": local_origins, "methods": ["GET", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]},
     r"/api/*": {"origins": local_origins, "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]},
     r"/auth/*": {"origins": local_origins, "methods": ["POST", "OPTIONS"], "allow_headers": ["Content-Type"]}
 }, supports_credentials=True)
@@ -26,9 +33,160 @@ CORS(app, resources={
 # Preserve the order of keys in JSON responses
 app.json.sort_keys = False
 
-# Instantiate the chat agent globally
+# Instantiate the chat agent globally (its OpenAI client is created on first use)
 chat_agent = chat.ChatAgentSimples()
 
+def create_app():
+    """
+    Entry point of the API: starts the background warm-up (OpenAI client, schema checks, page cache
+    and global aggregates; /ready reports when it is done) and returns the app. Importing this
+    module starts nothing, so scripts and tests can import it without touching the databases.
+    Set WARMUP=0 to skip the warm-up. Under a WSGI server: gunicorn "main:create_app()".
+    """
+    if os.getenv("WARMUP", "1") != "0":
+        warmup.start([('openai_client', lambda: chat_agent.client)])
+    return app
+
+# --- LOAD SHEDDING ---
+
+# Requests handled at once; past this, new requests get 503 right away instead of queueing
+# for a worker. 0 disables the limit. Probes and metrics are never shed.
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "64"))
+UNSHED_ENDPOINTS = {'/ready', '/metrics'}
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+def _admit():
+    """Takes an in-flight slot for the current request; False if the limit is reached."""
+    global _in_flight
+    with _in_flight_lock:
+        if MAX_IN_FLIGHT and _in_flight >= MAX_IN_FLIGHT:
+            return False
+        _in_flight += 1
+        metrics.http_in_flight.set(value=_in_flight)
+    return True
+
+def _release():
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+        metrics.http_in_flight.set(value=_in_flight)
+
+def _endpoint():
+    # Route pattern (e.g. /transactions/list), never the raw URL, to keep metric cardinality bounded
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+# --- METRICS ---
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    endpoint = _endpoint()
+    if endpoint not in UNSHED_ENDPOINTS:
+        if not _admit():
+            metrics.http_shed_requests.inc(endpoint)
+            response = jsonify({'error': 'Servidor sobrecarregado. Tente novamente em alguns segundos.'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        g.admitted = True
+    # Every SQLite statement of the request stops once the endpoint's time budget is spent
+    deadlines.start(deadlines.budget_for(endpoint))
+    # Admins can profile a single request by sending `X-Profile: 1` with their token
+    if request.headers.get('X-Profile') == '1' and _is_admin():
+        g.profiler = profiling.SamplingProfiler(threading.get_ident())
+        g.profiler.start()
+
+@app.teardown_request
+def end_request(error=None):
+    # Runs after streamed bodies are sent too, so an export holds its slot until it ends
+    deadlines.clear()
+    if g.pop('admitted', False):
+        _release()
+
+@app.errorhandler(deadlines.DeadlineExceeded)
+def deadline_exceeded(error):
+    """A query ran past the endpoint's time budget and was interrupted."""
+    metrics.http_deadline_exceeded.inc(_endpoint())
+    response = jsonify({'error': 'A consulta excedeu o tempo limite. Tente novamente com mais filtros ou mais tarde.'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+@app.after_request
+def record_request_metrics(response):
+    """Records latency, status code and size of every request. Streamed bodies are timed until the headers are sent."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = _endpoint()
+        metrics.http_request_duration.observe(time.perf_counter() - started, endpoint, request.method)
+        metrics.http_requests.inc(endpoint, request.method, str(response.status_code))
+        if response.content_length is not None:
+            metrics.http_response_size.observe(response.content_length, endpoint)
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        response.headers['X-Profile-Id'] = profiling.store_profile(profiler, request.method, request.full_path)
+    return response
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 once the startup warm-up finished, 503 while it runs."""
+    data = warmup.status()
+    if data['ready']:
+        return jsonify(data)
+    response = jsonify(data)
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Endpoint exposing request, SQLite and OpenAI metrics in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# --- ADMIN ENDPOINTS ---
+
+# Admin endpoints and request profiling are disabled unless ADMIN_TOKEN is set.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def _is_admin():
+    """Checks the `X-Admin-Token` header against ADMIN_TOKEN."""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+@app.route('/admin/slow-queries', methods=['GET'])
+def admin_slow_queries():
+    """Endpoint to list the most recent slow SQL statements with their parameters and query plans."""
+    if not _is_admin():
+        return jsonify({'error': 'Acesso negado'}), 403
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'thresholdMs': profiling.SLOW_QUERY_MS,
+        'queries': profiling.get_slow_queries(limit)
+    })
+
+@app.route('/admin/profiles', methods=['GET'])
+def admin_profiles():
+    """Endpoint to list the stored request profiles."""
+    if not _is_admin():
+        return jsonify({'error': 'Acesso negado'}), 403
+    return jsonify(profiling.list_profiles())
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+def admin_profile(profile_id):
+    """Endpoint to get one request profile, as hotspots (JSON) or collapsed stacks (`format=collapsed`)."""
+    if not _is_admin():
+        return jsonify({'error': 'Acesso negado'}), 403
+    if request.args.get('format') == 'collapsed':
+        data = profiling.get_profile_collapsed(profile_id)
+        if data is None:
+            return jsonify({'error': 'Perfil não encontrado'}), 404
+        return Response(data, mimetype='text/plain')
+    data = profiling.get_profile(profile_id, top=request.args.get('top', 30, type=int))
+    if data is None:
+        return jsonify({'error': 'Perfil não encontrado'}), 404
+    return jsonify(data)
+
 # --- AUTHENTICATION API ENDPOINTS ---
 
 @app.route('/auth/signUp', methods=['POST'])
@@ -60,6 +218,30 @@ def login():
 
 # --- DATA API ENDPOINTS ---
 
+def _parse_date(value):
+    """Parses a YYYY-MM-DD query parameter (invalid values are ignored, like other typed parameters)."""
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def _is_month(value):
+    """Whether a query parameter is a month as AAAA-MM."""
+    try:
+        datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        return False
+    return len(value) == 7
+
+def _get_transaction_filters():
+    """Parses the transaction filter parameters shared by the list and export endpoints."""
+    date_str = request.args.get('date')
+    type_str = request.args.get('type')
+    return {
+        'date': [int(m) for m in date_str.split(',')] if date_str else None,
+        'type': type_str.split(',') if type_str else None,
+        'inOut': request.args.get('inOut', type=int),
+        'customProv': request.args.get('customProv'),
+        'dateFrom': request.args.get('dateFrom', type=_parse_date),
+        'dateTo': request.args.get('dateTo', type=_parse_date)
+    }
 
 @app.route('/transactions/overview', methods=['GET'])
 def transactions_overview():
@@ -78,19 +260,44 @@ def transactions_list():
         return jsonify({'error': 'O parâmetro "id" do cliente é obrigatório'}), 400
 
     # Get filter parameters from request
-    date_str = request.args.get('date')
-    date = [int(m) for m in date_str.split(',')] if date_str else None
-    type_str = request.args.get('type')
-    type = type_str.split(',') if type_str else None
-    inOut = request.args.get('inOut', type=int)
-    customProv = request.args.get('customProv')
+    filters = _get_transaction_filters()
     page = request.args.get('page', 1, type=int)
+    facets = request.args.get('facets', 0, type=int) == 1
 
-    data = transactions.get_transactions_list(id, date=date, type=type, inOut=inOut, customProv=customProv, page=page)
+    data = transactions.get_transactions_list(id, page=page, facets=facets, **filters)
     if data is None:
         return jsonify({'error': 'Cliente não encontrado'}), 404
     return jsonify(data)
 
+@app.route('/transactions/export', methods=['GET'])
+def transactions_export():
+    """Endpoint to download every filtered transaction of a client as CSV or NDJSON."""
+    id = request.args.get('id')
+    if not id:
+        return jsonify({'error': 'O parâmetro "id" do cliente é obrigatório'}), 400
+
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'O parâmetro "format" deve ser "csv" ou "ndjson"'}), 400
+    compress = request.args.get('gzip', 0, type=int) == 1
+
+    stream = transactions.export_transactions(id, fmt=fmt, compress=compress, **_get_transaction_filters())
+    if stream is None:
+        return jsonify({'error': 'Cliente não encontrado'}), 404
+
+    # The ID comes straight from the query string; keep quotes and line breaks out of the header
+    filename = secure_filename(f"transacoes_{id}.{fmt}")
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    return Response(
+        stream_with_context(stream),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @app.route('/transactions/graphs/barChart', methods=['GET'])
 def transactions_bar_chart():
     """Endpoint to get monthly income/expense data for a bar chart."""
@@ -100,10 +307,25 @@ def transactions_bar_chart():
     data = transactions.get_transactions_barChart(id)
     return jsonify(data)
 
+@app.route('/transactions/counterparties', methods=['GET'])
+def transactions_counterparties():
+    """Endpoint to get a client's top customers and suppliers."""
+    id = request.args.get('id')
+    if not id:
+        return jsonify({'error': 'O parâmetro "id" do cliente é obrigatório'}), 400
+
+    top = request.args.get('top', 10, type=int)
+    by = request.args.get('by', 'total')
+    if by not in counterparties.RANKINGS:
+        return jsonify({'error': 'O parâmetro "by" deve ser "total", "in" ou "out"'}), 400
+
+    data = counterparties.get_counterparties(id, top=top, by=by)
+    return jsonify(data)
+
 @app.route('/cnae/graphs/pieChart', methods=['GET'])
 def cnae_pie_chart():
     """Endpoint to get data for a CNAE pie chart."""
-    data = cnae.get_cnae_pieChart()
+    data = aggregates.get('cnae_pieChart')
     return jsonify(data)
 
 @app.route('/cnae/list', methods=['GET'])
@@ -121,7 +343,14 @@ def cnae_list():
 @app.route('/maturity/overview', methods=['GET'])
 def maturity_overview():
     """Endpoint to get an overview of company maturity stages."""
-    data = maturity.get_maturity_overview()
+    data = aggregates.get('maturity_overview')
+    return jsonify(data)
+
+@app.route('/maturity/crosstab', methods=['GET'])
+def maturity_crosstab():
+    """Endpoint to get the number of companies per CNAE and maturity stage."""
+    cnae_param = request.args.get('cnae')
+    data = maturity.get_maturity_crosstab(cnae=cnae_param)
     return jsonify(data)
 
 @app.route('/maturity/list', methods=['GET'])
@@ -134,6 +363,38 @@ def maturity_list():
     data = maturity.get_maturity_list(state=state, page=page)
     return jsonify(data)
 
+@app.route('/analytics/cube', methods=['GET'])
+def analytics_cube():
+    """Endpoint for slice, dice and roll-up queries over the CNAE x stage x cohort x month cube."""
+    dimensions_str = request.args.get('dimensions', '')
+    dimensions = [d.strip() for d in dimensions_str.split(',') if d.strip()]
+    invalid = [d for d in dimensions if d not in cube.DIMENSIONS]
+    if invalid or len(set(dimensions)) != len(dimensions):
+        return jsonify({'error': f'O parâmetro "dimensions" aceita {", ".join(cube.DIMENSIONS)}, sem repetição'}), 400
+
+    # Filters repeat the parameter (?stage=Madura&stage=Declínio): CNAE descriptions contain commas
+    filters = {d: request.args.getlist(d) for d in cube.DIMENSIONS if request.args.getlist(d)}
+    month_from = request.args.get('monthFrom')
+    month_to = request.args.get('monthTo')
+    for month in [month_from, month_to] + filters.get('month', []):
+        if month is not None and not _is_month(month):
+            return jsonify({'error': 'Meses devem estar no formato AAAA-MM'}), 400
+    limit = request.args.get('limit', 1000, type=int)
+
+    data = cube.query(dimensions, filters, month_from=month_from, month_to=month_to, limit=limit)
+    return jsonify(data)
+
+
+@app.route('/search', methods=['GET'])
+def search_endpoint():
+    """Endpoint for typeahead search over CNAE descriptions and company IDs."""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'O parâmetro "q" é obrigatório'}), 400
+    limit = request.args.get('limit', 10, type=int)
+
+    data = search.search(q, limit=limit)
+    return jsonify(data)
 
 # --- CHATBOT API ENDPOINTS ---
 
@@ -151,7 +412,16 @@ def handle_chat():
             }), 400
         
         # Processar pergunta
-        resposta = chat_agent.perguntar_ia(pergunta)
+        try:
+            resposta = chat_agent.perguntar_ia(pergunta)
+        except llm_gateway.UpstreamError as e:
+            status_code = 504 if isinstance(e, llm_gateway.UpstreamTimeoutError) else 503
+            response = jsonify({
+                'success': False,
+                'error': 'Assistente indisponível no momento. Tente novamente em alguns segundos.'
+            })
+            response.headers['Retry-After'] = str(e.retry_after or 1)
+            return response, status_code
         
         return jsonify({
             'success': True,
@@ -168,17 +438,34 @@ def handle_chat():
 
 @app.route('/api/atualizar-dados', methods=['POST'])
 def atualizar_dados():
-    """Atualiza dados da tela atual (quando usuário muda filtros, página, etc.)"""
+    """Atualiza dados da tela atual com um delta (quando usuário muda filtros, página, etc.)"""
     try:
         data = request.json
-        novos_dados = data.get('dados', {})
         
-        success = chat_agent.atualizar_dados_tela(novos_dados)
+        try:
+            alterado, versao, hash_dados = chat_agent.atualizar_dados_tela(
+                data.get('dados'),
+                patch=data.get('patch'),
+                versao_base=data.get('versao'),
+                substituir=data.get('substituir', False)
+            )
+        except chat.ConflitoVersao as e:
+            # The client's base is stale: it should resend the full state with `substituir`
+            return jsonify({
+                'success': False,
+                'error': 'Versão dos dados desatualizada. Reenvie os dados completos.',
+                'versao': e.versao,
+                'hash': e.hash_dados
+            }), 409
+        except delta.PatchError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
+        # Only the new version goes back; the full data is available from /api/status
         return jsonify({
-            'success': success,
-            'message': 'Dados atualizados com sucesso!',
-            'dados_atuais': chat_agent.current_data
+            'success': True,
+            'alterado': alterado,
+            'versao': versao,
+            'hash': hash_dados
         })
         
     except Exception as e:
@@ -194,23 +481,26 @@ def status():
         'success': True,
         'status': 'API funcionando',
         'dados_atuais': chat_agent.current_data,
-        'total_conversas': len(chat_agent.conversation_history),
+        'versao_dados': chat_agent.versao_dados,
+        'total_conversas': chat_history.count(),
+        'fila_ia': chat_agent.gateway.stats(),
         'ultima_atualizacao': datetime.now().isoformat()
     })
 
 @app.route('/api/historico', methods=['GET'])
 def historico():
-    """Retorna histórico das conversas do chat"""
+    """Retorna histórico das conversas do chat, paginado por cursor (mais antigas primeiro em cada página)"""
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', 10, type=int)
     return jsonify({
         'success': True,
-        'historico': chat_agent.conversation_history[-10:],  # Últimas 10
-        'total': len(chat_agent.conversation_history)
+        **chat_history.get_page(before=before, limit=limit)
     })
 
 @app.route('/api/limpar-historico', methods=['POST'])
 def limpar_historico():
     """Limpa histórico de conversas do chat"""
-    chat_agent.conversation_history = []
+    chat_history.clear()
     return jsonify({
         'success': True,
         'message': 'Histórico limpo com sucesso!'
@@ -224,10 +514,10 @@ def configurar_sistema():
         if 'site_info' in data:
             chat_agent.site_info = data['site_info']
         if 'current_data' in data:
-            chat_agent.current_data = data['current_data']
+            chat_agent.atualizar_dados_tela(data['current_data'], substituir=True)
         return jsonify({'success': True, 'message': 'Sistema configurado com sucesso!'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
+    create_app().run(debug=True, port=5001)
@@ -0,0 +1,52 @@
+import os
+import threading
+from scripts import cnae, maturity, sharding, transactions
+
+# Global (client-independent) results that every dashboard load asks for. They only change
+# when the data does, so each is computed once per data version and served from memory.
+AGGREGATES = {
+    'cnae_pieChart': cnae.get_cnae_pieChart,
+    'maturity_overview': maturity.get_maturity_overview
+}
+
+_results = {}
+_locks = {name: threading.Lock() for name in AGGREGATES}
+
+def data_version():
+    """
+    Cheap version of the stored data: the modification time and size of the database
+    files (and their WAL). Any write changes it, invalidating cached results.
+    """
+    paths = sharding.shard_paths() if sharding.enabled() else [transactions.DB_PATH]
+    version = []
+    for path in paths:
+        for file_path in (path, path + '-wal'):
+            try:
+                stat = os.stat(file_path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                version.append(None)
+    return tuple(version)
+
+def get(name):
+    """
+    Returns the aggregate `name`, recomputing it only if the data changed since it was cached.
+    Concurrent requests for a stale aggregate wait for a single recomputation.
+    """
+    version = data_version()
+    cached = _results.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _locks[name]:
+        cached = _results.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        result = AGGREGATES[name]()
+        _results[name] = (version, result)
+        return result
+
+def refresh_all():
+    """Computes every stale aggregate (used to pre-warm them at startup)."""
+    for name in AGGREGATES:
+        get(name)
@@ -1,17 +1,37 @@
-import openai
 import json
 from datetime import datetime
 import os
+import threading
+from scripts import chat_history, chat_tools, delta, llm_gateway
+
+# Model used for every chat completion.
+MODEL = "gpt-3.5-turbo"
+# Maximum model turns spent on tool calls before a final answer is required.
+MAX_TOOL_ROUNDS = 3
+
+def _criar_cliente_openai():
+    # openai takes most of the API's import time, so it is only imported when the client is first needed
+    import openai
+    # It's recommended to load the API key from an environment variable
+    # for better security, e.g., os.getenv("OPENAI_API_KEY").
+    return openai.OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY", ""),
+        # Retries, deadlines and concurrency are handled by the gateway
+        max_retries=0
+    )
+
+class ConflitoVersao(Exception):
+    """O delta foi calculado sobre uma versão dos dados da tela que não é mais a atual."""
+
+    def __init__(self, versao, hash_dados):
+        super().__init__(f"Versão atual dos dados é {versao}")
+        self.versao = versao
+        self.hash_dados = hash_dados
 
 class ChatAgentSimples:
-    def __init__(self):
-        # It's recommended to load the API key from an environment variable
-        # for better security, e.g., os.getenv("OPENAI_API_KEY")
-        self.client = openai.OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY", "")
-        )
-        
-        self.conversation_history = []
+    def __init__(self, client=None):
+        # Any object with the same `chat.completions.create` interface can be injected (e.g., a fake model)
+        self.gateway = llm_gateway.Gateway(client=client, client_factory=_criar_cliente_openai)
         
         # CONFIGURE AQUI O QUE SUA IA DEVE SABER SOBRE O SITE/SISTEMA
         self.site_info = """
@@ -84,6 +104,12 @@ CONTATOS DE SUPORTE:
                 "Novo produto de investimento disponível"
             ]
         }
+        # Version of current_data: bumped only when an update actually changes its content
+        self.versao_dados = 1
+        self.hash_dados = delta.content_hash(self.current_data)
+        self._dados_lock = threading.Lock()
+        # JSON of current_data rendered for the prompt, reused while the version doesn't change
+        self._dados_formatados = (None, None)
 
     def perguntar_ia(self, pergunta_usuario):
         """Processa pergunta do usuário"""
@@ -93,7 +119,7 @@ CONTATOS DE SUPORTE:
 {self.site_info}
 
 DADOS ATUAIS NA TELA:
-{json.dumps(self.current_data, indent=2, ensure_ascii=False)}
+{self._formatar_dados()}
 
 HISTÓRICO DA CONVERSA:
 {self._formatar_historico()}
@@ -123,50 +149,120 @@ REGRAS:
 - Se não souber algo específico, diga "Não tenho essa informação" e ofereça alternativa
 - Sempre termine perguntando se precisa de mais ajuda
 
+FERRAMENTAS:
+- Você pode consultar dados reais do banco com as ferramentas disponíveis
+- Use-as sempre que a pergunta for sobre um cliente, setor (CNAE) ou maturidade das empresas
+- Se precisar de várias consultas independentes, peça todas de uma vez
+- Para dados de um cliente, é necessário o ID; se não souber, pergunte ao usuário
+
 FORMATO DE RESPOSTA:
 - Resposta direta à pergunta
 - Informação adicional útil (se relevante)
 - Pergunta se precisa de mais ajuda
 """
 
+        messages = [
+            {"role": "system", "content": system_prompt + "\n\nCONTEXTO DO SISTEMA:\n" + contexto_completo},
+            {"role": "user", "content": pergunta_usuario}
+        ]
+
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt + "\n\nCONTEXTO DO SISTEMA:\n" + contexto_completo},
-                    {"role": "user", "content": pergunta_usuario}
-                ],
-                max_tokens=800,
-                temperature=0.7
-            )
-            
-            resposta = response.choices[0].message.content
+            for rodada in range(MAX_TOOL_ROUNDS + 1):
+                # On the last round tools are withheld, so the model has to answer
+                message = self._completar(messages, usar_ferramentas=rodada < MAX_TOOL_ROUNDS)
+                if not message.tool_calls:
+                    break
+                messages.append({
+                    "role": "assistant",
+                    "content": message.content,
+                    "tool_calls": [
+                        {"id": call.id, "type": "function",
+                         "function": {"name": call.function.name, "arguments": call.function.arguments}}
+                        for call in message.tool_calls
+                    ]
+                })
+                # Independent tool calls of the same turn run concurrently
+                messages.extend(chat_tools.run_tool_calls(message.tool_calls))
+
+            resposta = message.content
             
-            # Salvar no histórico
-            self.conversation_history.append({
-                'timestamp': datetime.now().strftime('%H:%M:%S'),
-                'usuario': pergunta_usuario,
-                'assistente': resposta
-            })
+            # Salvar no histórico (gravado em lote, fora do caminho da requisição)
+            chat_history.append(pergunta_usuario, resposta)
             
             return resposta
             
+        except llm_gateway.UpstreamError:
+            # Overload and deadline errors are surfaced to the endpoint, which answers 503/504
+            raise
         except Exception as e:
             return f"Desculpe, ocorreu um erro técnico. Tente novamente em alguns segundos. Se persistir, entre em contato com o suporte TI: (11) 4004-3535"
 
+    @property
+    def client(self):
+        """Cliente OpenAI (criado no primeiro uso)"""
+        return self.gateway.client
+
+    def _completar(self, messages, usar_ferramentas=True):
+        """Chama o modelo uma vez (via gateway) e retorna a mensagem gerada"""
+        kwargs = {"tools": chat_tools.TOOLS} if usar_ferramentas else {}
+        response = self.gateway.complete(
+            model=MODEL,
+            messages=messages,
+            max_tokens=800,
+            temperature=0.7,
+            **kwargs
+        )
+        return response.choices[0].message
+
     def _formatar_historico(self):
         """Formata histórico das últimas conversas"""
-        if not self.conversation_history:
+        ultimas = chat_history.recent(3)  # Últimas 3 interações
+        if not ultimas:
             return "Primeira conversa."
         
         historico = ""
-        for item in self.conversation_history[-3:]:  # Últimas 3 interações
+        for item in ultimas:
             historico += f"[{item['timestamp']}] Usuário: {item['usuario']}\n"
             historico += f"Assistente: {item['assistente']}\n\n"
         
         return historico
 
-    def atualizar_dados_tela(self, novos_dados):
-        """Atualiza dados da tela atual"""
-        self.current_data.update(novos_dados)
-        return True
\ No newline at end of file
+    def _formatar_dados(self):
+        """Dados da tela em JSON para o prompt, recalculados só quando a versão muda"""
+        with self._dados_lock:
+            versao, texto = self._dados_formatados
+            if versao != self.versao_dados:
+                texto = json.dumps(self.current_data, indent=2, ensure_ascii=False)
+                self._dados_formatados = (self.versao_dados, texto)
+            return texto
+
+    def atualizar_dados_tela(self, novos_dados=None, patch=None, versao_base=None, substituir=False):
+        """
+        Atualiza dados da tela atual com um delta: `novos_dados` é um JSON Merge Patch (RFC 7396;
+        objetos são mesclados e `null` remove a chave), `patch` uma lista de operações JSON Patch
+        (RFC 6902) e, com `substituir`, `novos_dados` troca os dados inteiros.
+
+        Com `versao_base`, o delta só é aplicado se os dados ainda estiverem nessa versão
+        (senão levanta ConflitoVersao). Retorna (alterado, versao, hash); uma atualização que
+        não muda o conteúdo mantém a versão, e com ela o contexto já formatado para o prompt.
+        """
+        with self._dados_lock:
+            if versao_base is not None and versao_base != self.versao_dados:
+                raise ConflitoVersao(self.versao_dados, self.hash_dados)
+
+            if substituir:
+                dados = novos_dados if isinstance(novos_dados, dict) else {}
+            else:
+                dados = delta.merge_patch(self.current_data, novos_dados or {})
+            if patch is not None:
+                dados = delta.apply_patch(dados, patch)
+            if not isinstance(dados, dict):
+                raise delta.PatchError("Os dados da tela devem ser um objeto")
+
+            hash_dados = delta.content_hash(dados)
+            if hash_dados == self.hash_dados:
+                return False, self.versao_dados, self.hash_dados
+            self.current_data = dados
+            self.versao_dados += 1
+            self.hash_dados = hash_dados
+            return True, self.versao_dados, self.hash_dados
\ No newline at end of file
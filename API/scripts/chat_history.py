@@ -0,0 +1,237 @@
+import argparse
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from scripts import metrics
+
+# Construct an absolute path to the database file.
+# This goes up two directories from `scripts` to the project root.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The history has its own file: every write to banco.db changes its data version and would
+# invalidate the cached aggregates and tool results (see `aggregates.data_version`).
+DB_PATH = os.path.join(PROJECT_ROOT, 'chat_history.db')
+
+# Pending messages are written at most this often (seconds), or sooner once a batch fills up.
+FLUSH_INTERVAL = 0.5
+BATCH_SIZE = 100
+# Retention: messages older than this many days, or beyond the newest HISTORY_MAX_ROWS, are deleted.
+RETENTION_DAYS = int(os.getenv("CHAT_HISTORY_RETENTION_DAYS", "30"))
+HISTORY_MAX_ROWS = int(os.getenv("CHAT_HISTORY_MAX_ROWS", "100000"))
+# How often the background writer applies the retention policy (seconds).
+COMPACT_INTERVAL = 3600
+# Upper bound for the `limit` parameter of /api/historico.
+MAX_PAGE_SIZE = 100
+
+# Append-only log of the chat. ID_MSG only grows (AUTOINCREMENT never reuses deleted ids),
+# so it orders the messages and serves as a stable paging cursor even while compaction runs.
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS HISTORICO_CHAT (
+        ID_MSG INTEGER PRIMARY KEY AUTOINCREMENT, -- Identificador (cursor de paginação)
+        DT_REFE TEXT NOT NULL,                -- Data e hora da pergunta
+        DS_PERG TEXT NOT NULL,                -- Pergunta do usuário
+        DS_RESP TEXT NOT NULL                 -- Resposta da assistente
+    );
+
+    CREATE INDEX IF NOT EXISTS IX_HISTORICO_CHAT_DT_REFE ON HISTORICO_CHAT (DT_REFE);
+"""
+
+# Messages accepted but not written yet. They stay here until their batch is committed,
+# so this worker's reads see them; `_flush_lock` keeps readers from seeing a batch twice.
+_pending = []
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wake = threading.Event()
+_writer = None
+_last_compaction = 0.0
+
+def _init_history_if_needed(conn):
+    """Internal function to create the chat history table if it doesn't exist."""
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='HISTORICO_CHAT'")
+    if cur.fetchone() is None:
+        print("HISTORICO_CHAT table not found. Creating it...")
+        cur.executescript(SCHEMA)
+        conn.commit()
+
+def get_db(path=None):
+    conn = sqlite3.connect(path or DB_PATH, timeout=10, factory=metrics.InstrumentedConnection)
+    # Ensure the table exists before proceeding
+    _init_history_if_needed(conn)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _format_message(row):
+    """Converts a HISTORICO_CHAT row (or pending message) into the shape returned by the API."""
+    created = datetime.strptime(row['DT_REFE'], '%Y-%m-%d %H:%M:%S')
+    return {
+        'id': row['ID_MSG'],
+        'data': created.strftime('%d/%m/%Y'),
+        'timestamp': created.strftime('%H:%M:%S'),
+        'usuario': row['DS_PERG'],
+        'assistente': row['DS_RESP']
+    }
+
+def append(pergunta, resposta):
+    """
+    Queues a question/answer pair to be stored. The write happens on the background
+    writer thread, in batches, so the request doesn't wait for the disk.
+    """
+    global _writer
+    message = {
+        'ID_MSG': None,
+        'DT_REFE': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'DS_PERG': pergunta,
+        'DS_RESP': resposta
+    }
+    with _pending_lock:
+        _pending.append(message)
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name='chat-history-writer', daemon=True)
+            _writer.start()
+        if len(_pending) >= BATCH_SIZE:
+            _wake.set()
+
+def flush():
+    """Writes every pending message now. Returns the number of messages written."""
+    with _flush_lock:
+        with _pending_lock:
+            batch = _pending[:]
+        if not batch:
+            return 0
+        conn = get_db()
+        with conn:
+            conn.executemany(
+                "INSERT INTO HISTORICO_CHAT (DT_REFE, DS_PERG, DS_RESP) VALUES (?, ?, ?)",
+                [(m['DT_REFE'], m['DS_PERG'], m['DS_RESP']) for m in batch])
+        conn.close()
+        with _pending_lock:
+            del _pending[:len(batch)]
+        return len(batch)
+
+def _write_loop():
+    global _last_compaction
+    while True:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            flush()
+            if time.monotonic() - _last_compaction >= COMPACT_INTERVAL:
+                _last_compaction = time.monotonic()
+                compact()
+        except sqlite3.Error as e:
+            # Pending messages are kept and retried on the next pass
+            print(f"Chat history write failed: {e}")
+
+# Don't lose the last batch on a clean shutdown
+atexit.register(flush)
+
+def _pending_messages():
+    with _pending_lock:
+        return [dict(m) for m in _pending]
+
+def recent(limit):
+    """Returns the last `limit` messages, oldest first (including this worker's pending ones)."""
+    with _flush_lock:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM HISTORICO_CHAT ORDER BY ID_MSG DESC LIMIT ?", (limit,))
+        rows = cur.fetchall()
+        conn.close()
+        pending = _pending_messages()
+    messages = [_format_message(row) for row in reversed(rows)] + [_format_message(m) for m in pending]
+    return messages[-limit:] if limit else []
+
+def get_page(before=None, limit=10):
+    """
+    Returns a page of the history, oldest first: the `limit` messages preceding the `before`
+    cursor (or the newest ones), plus the cursor of the next (older) page, or None on the last page.
+    Messages still waiting to be written have no ID to page by, so they are served from memory on
+    the newest page (all of them, even beyond `limit`). Reading never writes.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # Same lock as flush(), so a batch being written is counted once: in the table or in memory
+    with _flush_lock:
+        conn = get_db()
+        cur = conn.cursor()
+        if before is not None:
+            cur.execute("SELECT * FROM HISTORICO_CHAT WHERE ID_MSG < ? ORDER BY ID_MSG DESC LIMIT ?", (before, limit + 1))
+        else:
+            cur.execute("SELECT * FROM HISTORICO_CHAT ORDER BY ID_MSG DESC LIMIT ?", (limit + 1,))
+        rows = cur.fetchall()
+        cur.execute("SELECT COUNT(*) as total FROM HISTORICO_CHAT")
+        total = cur.fetchone()['total']
+        conn.close()
+        pending = _pending_messages()
+
+    total += len(pending)
+    if before is not None:
+        pending = []
+    shown = rows[:max(limit - len(pending), 0)]
+    # Rows left out (the extra one, or those displaced by pending messages) mean an older page exists.
+    # A page of pending messages only hands out a cursor just past the newest stored row.
+    has_more = len(rows) > len(shown)
+    return {
+        'historico': [_format_message(row) for row in reversed(shown)] + [_format_message(m) for m in pending],
+        'total': total,
+        'nextCursor': (shown[-1]['ID_MSG'] if shown else rows[0]['ID_MSG'] + 1) if has_more else None
+    }
+
+def count():
+    """Number of stored messages (including this worker's pending ones)."""
+    with _flush_lock:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) as total FROM HISTORICO_CHAT")
+        total = cur.fetchone()['total']
+        conn.close()
+        return total + len(_pending_messages())
+
+def clear():
+    """Deletes the whole history, including messages not written yet."""
+    with _flush_lock:
+        with _pending_lock:
+            _pending.clear()
+        conn = get_db()
+        with conn:
+            conn.execute("DELETE FROM HISTORICO_CHAT")
+        conn.close()
+
+def compact(retention_days=None, max_rows=None):
+    """
+    Applies the retention policy: deletes messages older than `retention_days` and keeps at most
+    `max_rows` of the newest ones. Freed pages are reused by later inserts. Returns the rows deleted.
+    """
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    max_rows = HISTORY_MAX_ROWS if max_rows is None else max_rows
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    conn = get_db()
+    with conn:
+        # Both deletes are range scans: one over IX_HISTORICO_CHAT_DT_REFE, one over the primary key
+        deleted = conn.execute("DELETE FROM HISTORICO_CHAT WHERE DT_REFE < ?", (cutoff,)).rowcount
+        deleted += conn.execute("""
+            DELETE FROM HISTORICO_CHAT
+            WHERE ID_MSG <= (SELECT ID_MSG FROM HISTORICO_CHAT ORDER BY ID_MSG DESC LIMIT 1 OFFSET ?)
+        """, (max_rows,)).rowcount
+    conn.close()
+    return deleted
+
+def main():
+    parser = argparse.ArgumentParser(description="Applies the retention policy to the chat history.")
+    parser.add_argument('--retention-days', type=int, default=RETENTION_DAYS, help="Delete messages older than this.")
+    parser.add_argument('--max-rows', type=int, default=HISTORY_MAX_ROWS, help="Keep at most this many messages.")
+    parser.add_argument('--vacuum', action='store_true', help="Also rebuild the database file to return freed space to the OS.")
+    args = parser.parse_args()
+    deleted = compact(args.retention_days, args.max_rows)
+    print(f"Deleted {deleted} chat history messages.")
+    if args.vacuum:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("VACUUM")
+        conn.close()
+        print("Database vacuumed.")
+
+if __name__ == '__main__':
+    main()
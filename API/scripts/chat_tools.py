@@ -0,0 +1,122 @@
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from scripts import aggregates, deadlines, transactions
+
+# Maximum number of memoized tool results.
+CACHE_SIZE = 256
+# Tool calls of one model turn run concurrently on this pool.
+MAX_PARALLEL_TOOLS = 4
+
+_CLIENT_ID_PARAMETERS = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "string", "description": "Identificador do cliente (ID)."}
+    },
+    "required": ["id"]
+}
+_NO_PARAMETERS = {"type": "object", "properties": {}}
+
+# Tool definitions in the OpenAI function-calling format.
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_transactions_overview",
+            "description": "Resumo de um cliente: quantos clientes pagaram para ele, total de transações e saldo (receitas - despesas).",
+            "parameters": _CLIENT_ID_PARAMETERS
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_transactions_barChart",
+            "description": "Receitas e despesas mensais de um cliente.",
+            "parameters": _CLIENT_ID_PARAMETERS
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_cnae_pieChart",
+            "description": "Os 5 setores (CNAE) com maior faturamento e a quantidade de contas de cada um.",
+            "parameters": _NO_PARAMETERS
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_maturity_overview",
+            "description": "Quantidade de empresas em cada estágio de maturidade (Iniciante, Expansão, Madura, Declínio).",
+            "parameters": _NO_PARAMETERS
+        }
+    }
+]
+
+TOOL_FUNCTIONS = {
+    "get_transactions_overview": lambda args: transactions.get_transactions_overview(args["id"]),
+    "get_transactions_barChart": lambda args: transactions.get_transactions_barChart(args["id"]),
+    "get_cnae_pieChart": lambda args: aggregates.get('cnae_pieChart'),
+    "get_maturity_overview": lambda args: aggregates.get('maturity_overview')
+}
+
+# Parameter schema of each tool, to check the model's arguments before running it.
+TOOL_PARAMETERS = {tool["function"]["name"]: tool["function"]["parameters"] for tool in TOOLS}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_TOOLS, thread_name_prefix='chat-tool')
+
+def run_tool(name, arguments, version=None):
+    """
+    Runs one tool and returns its result serialized as JSON. Results are memoized per
+    (tool, arguments, data version), so repeated questions don't query SQLite again.
+    """
+    function = TOOL_FUNCTIONS.get(name)
+    if function is None:
+        return json.dumps({"error": f"Ferramenta desconhecida: {name}"}, ensure_ascii=False)
+    if not isinstance(arguments, dict):
+        return json.dumps({"error": "Os argumentos devem ser um objeto JSON"}, ensure_ascii=False)
+    missing = [p for p in TOOL_PARAMETERS[name].get("required", []) if arguments.get(p) in (None, "")]
+    if missing:
+        return json.dumps({"error": f"Argumento obrigatório ausente: {', '.join(missing)}"}, ensure_ascii=False)
+
+    key = (name, json.dumps(arguments, sort_keys=True), version if version is not None else aggregates.data_version())
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    try:
+        result = json.dumps(function(arguments), ensure_ascii=False)
+    except Exception as e:
+        # Errors are returned to the model (and not memoized) so it can explain or retry
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+def run_tool_calls(tool_calls):
+    """
+    Runs the tool calls requested in one model turn concurrently.
+    Returns the `tool` messages to send back to the model, in the same order.
+    """
+    version = aggregates.data_version()
+
+    def run(tool_call):
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError:
+            return json.dumps({"error": "Argumentos inválidos"}, ensure_ascii=False)
+        return run_tool(tool_call.function.name, arguments, version)
+
+    # The pool threads run the tools' queries under the deadline of the request that asked for them
+    results = list(_executor.map(deadlines.bind(run), tool_calls))
+    return [
+        {"role": "tool", "tool_call_id": tool_call.id, "content": result}
+        for tool_call, result in zip(tool_calls, results)
+    ]
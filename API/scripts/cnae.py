@@ -1,15 +1,29 @@
 import sqlite3
 import os
 import math
+import heapq
+import itertools
 from datetime import datetime
+from scripts import metrics, sharding
 
 # Construct an absolute path to the database file.
 # This goes up two directories from `scripts` to the project root.
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DB_PATH = os.path.join(PROJECT_ROOT, 'banco.db')
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# This CTE identifies the most recent row for each ID within the specified CNAE
+LATEST_BY_CNAE = """
+    FROM ID
+    WHERE (ID, DT_REFE) IN (
+        SELECT ID, MAX(DT_REFE)
+        FROM ID
+        WHERE DS_CNAE = ?
+        GROUP BY ID
+    )
+"""
+
+def get_db(path=None):
+    conn = sqlite3.connect(path or DB_PATH, factory=metrics.InstrumentedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -17,6 +31,9 @@ def get_cnae_pieChart():
     """
     Fetches data for a pie chart of the top 5 CNAEs by total faturamento.
     """
+    if sharding.enabled():
+        return _get_cnae_pieChart_sharded()
+
     conn = get_db()
     cur = conn.cursor()
 
@@ -70,19 +87,13 @@ def get_cnae_list(cnae, page=1):
     Fetches a paginated list of accounts for a given CNAE.
     For each account, only the most recent entry based on DT_REFE is considered.
     """
+    if sharding.enabled():
+        return _get_cnae_list_sharded(cnae, page)
+
     conn = get_db()
     cur = conn.cursor()
 
-    # This CTE identifies the most recent row for each ID within the specified CNAE
-    base_query_cte = """
-        FROM ID
-        WHERE (ID, DT_REFE) IN (
-            SELECT ID, MAX(DT_REFE)
-            FROM ID
-            WHERE DS_CNAE = ?
-            GROUP BY ID
-        )
-    """
+    base_query_cte = LATEST_BY_CNAE
 
     # --- Get total count for pagination ---
     count_query = f"SELECT COUNT(*) as total {base_query_cte}"
@@ -108,19 +119,92 @@ def get_cnae_list(cnae, page=1):
 
     cur.execute(select_query, (cnae, items_per_page, offset))
 
-    processed_accounts = []
-    for row in cur.fetchall():
-        # Format the opening date
-        opening_date = datetime.strptime(row['DT_ABRT'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
-
-        processed_accounts.append({
-            "account": row['ID'],
-            "invoicing": f"R${row['VL_FATU']}",
-            "date": opening_date
-        })
+    processed_accounts = [_format_account(row) for row in cur.fetchall()]
 
     conn.close()
     return {
         "totalPages": total_pages,
         "accounts": processed_accounts
-    }
\ No newline at end of file
+    }
+
+def _format_account(row):
+    """Converts an ID row into the shape returned by the CNAE list."""
+    # Format the opening date
+    opening_date = datetime.strptime(row['DT_ABRT'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
+
+    return {
+        "account": row['ID'],
+        "invoicing": f"R${row['VL_FATU']}",
+        "date": opening_date
+    }
+
+# --- SHARDED LAYOUT ---
+# Each shard computes a partial result over the clients it owns and the partials are merged here.
+
+def _cnae_pieChart_partial(path):
+    """Per-shard part of the pie chart: the top 100 VL_FATU of each CNAE and its account count."""
+    conn = get_db(path)
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT DS_CNAE, VL_FATU
+        FROM (
+            SELECT DS_CNAE, VL_FATU, ROW_NUMBER() OVER(PARTITION BY DS_CNAE ORDER BY VL_FATU DESC) as rn
+            FROM ID
+        )
+        WHERE rn <= 100 AND VL_FATU IS NOT NULL
+    """)
+    top_values = {}
+    for row in cur.fetchall():
+        top_values.setdefault(row['DS_CNAE'], []).append(row['VL_FATU'])
+
+    cur.execute("SELECT DS_CNAE, COUNT(ID) as accounts FROM ID GROUP BY DS_CNAE")
+    accounts = {row['DS_CNAE']: row['accounts'] for row in cur.fetchall()}
+    conn.close()
+    return top_values, accounts
+
+def _get_cnae_pieChart_sharded():
+    top_values = {}
+    accounts = {}
+    for shard_top_values, shard_accounts in sharding.fan_out(_cnae_pieChart_partial):
+        for cnae, values in shard_top_values.items():
+            top_values.setdefault(cnae, []).extend(values)
+        for cnae, count in shard_accounts.items():
+            accounts[cnae] = accounts.get(cnae, 0) + count
+
+    # The global top 100 of a CNAE is always contained in the union of each shard's top 100
+    top100_sums = {cnae: sum(heapq.nlargest(100, values)) for cnae, values in top_values.items()}
+    top5 = heapq.nlargest(5, top100_sums, key=top100_sums.get)
+
+    pie_chart_data = [{"cnae": cnae, "accounts": accounts[cnae]} for cnae in top5]
+    return sorted(pie_chart_data, key=lambda x: x['accounts'], reverse=True)
+
+def _cnae_list_partial(cnae, limit, path):
+    """Per-shard part of the CNAE list: the account count and the first `limit` accounts by ID."""
+    conn = get_db(path)
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) as total {LATEST_BY_CNAE}", (cnae,))
+    total_items = cur.fetchone()['total']
+    cur.execute(f"SELECT ID, VL_FATU, DT_ABRT {LATEST_BY_CNAE} ORDER BY ID LIMIT ?", (cnae, limit))
+    rows = [dict(row) for row in cur.fetchall()]
+    conn.close()
+    return total_items, rows
+
+def _get_cnae_list_sharded(cnae, page):
+    items_per_page = 12
+    # SQLite treats a negative OFFSET as 0, so the unsharded path serves page 1 for page <= 0
+    page = max(1, page)
+    offset = (page - 1) * items_per_page
+
+    # Each shard returns its first `offset + items_per_page` accounts; merging these
+    # sorted runs gives the exact global page.
+    partials = sharding.fan_out(lambda path: _cnae_list_partial(cnae, offset + items_per_page, path))
+    total_items = sum(total for total, _ in partials)
+    if total_items == 0:
+        return {"totalPages": 0, "accounts": []}
+
+    merged = heapq.merge(*(rows for _, rows in partials), key=lambda row: row['ID'])
+    page_rows = list(itertools.islice(merged, offset, offset + items_per_page))
+    return {
+        "totalPages": math.ceil(total_items / items_per_page),
+        "accounts": [_format_account(row) for row in page_rows]
+    }
@@ -0,0 +1,167 @@
+import sqlite3
+import os
+from datetime import datetime
+from scripts import deadlines, interning, metrics, partitioning, sharding
+
+# Construct an absolute path to the database file.
+# This goes up two directories from `scripts` to the project root.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_PATH = os.path.join(PROJECT_ROOT, 'banco.db')
+
+# Upper bound for the `top` parameter of the counterparties endpoint.
+MAX_TOP = 100
+
+# Ranking column (or expression) for each `by` option. Each one is backed by an index
+# on (ID_CLIE, <expression> DESC), so a top-N read only touches N index entries.
+RANKINGS = {
+    'total': 'VL_ENTR + VL_SAID',
+    'in': 'VL_ENTR',
+    'out': 'VL_SAID'
+}
+
+# Aggregate of all transactions between a client and each of its counterparties.
+# The triggers keep it in sync with every INSERT/DELETE on TRANSACOES.
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS CONTRAPARTES (
+        ID_CLIE TEXT NOT NULL,                -- ID do cliente
+        ID_CTPT TEXT NOT NULL,                -- ID da contraparte (cliente ou fornecedor)
+        VL_ENTR INTEGER NOT NULL DEFAULT 0,   -- Total recebido da contraparte
+        VL_SAID INTEGER NOT NULL DEFAULT 0,   -- Total pago à contraparte
+        QT_ENTR INTEGER NOT NULL DEFAULT 0,   -- Quantidade de recebimentos
+        QT_SAID INTEGER NOT NULL DEFAULT 0,   -- Quantidade de pagamentos
+        DT_ULTM DATE,                         -- Data da última transação entre os dois
+        PRIMARY KEY (ID_CLIE, ID_CTPT)
+    );
+
+    CREATE INDEX IF NOT EXISTS IX_CONTRAPARTES_TOTAL ON CONTRAPARTES (ID_CLIE, (VL_ENTR + VL_SAID) DESC);
+    CREATE INDEX IF NOT EXISTS IX_CONTRAPARTES_ENTR ON CONTRAPARTES (ID_CLIE, VL_ENTR DESC);
+    CREATE INDEX IF NOT EXISTS IX_CONTRAPARTES_SAID ON CONTRAPARTES (ID_CLIE, VL_SAID DESC);
+
+    CREATE TRIGGER IF NOT EXISTS TG_CONTRAPARTES_INSERT AFTER INSERT ON TRANSACOES
+    BEGIN
+        INSERT INTO CONTRAPARTES (ID_CLIE, ID_CTPT, VL_ENTR, QT_ENTR, DT_ULTM)
+        VALUES (NEW.ID_RCBE, NEW.ID_PGTO, NEW.VL, 1, NEW.DT_REFE)
+        ON CONFLICT (ID_CLIE, ID_CTPT) DO UPDATE SET
+            VL_ENTR = VL_ENTR + excluded.VL_ENTR,
+            QT_ENTR = QT_ENTR + 1,
+            DT_ULTM = MAX(COALESCE(DT_ULTM, ''), excluded.DT_ULTM);
+
+        INSERT INTO CONTRAPARTES (ID_CLIE, ID_CTPT, VL_SAID, QT_SAID, DT_ULTM)
+        VALUES (NEW.ID_PGTO, NEW.ID_RCBE, NEW.VL, 1, NEW.DT_REFE)
+        ON CONFLICT (ID_CLIE, ID_CTPT) DO UPDATE SET
+            VL_SAID = VL_SAID + excluded.VL_SAID,
+            QT_SAID = QT_SAID + 1,
+            DT_ULTM = MAX(COALESCE(DT_ULTM, ''), excluded.DT_ULTM);
+    END;
+
+    -- DT_ULTM is not rolled back on delete; run `rebuild_counterparties` after bulk deletes.
+    CREATE TRIGGER IF NOT EXISTS TG_CONTRAPARTES_DELETE AFTER DELETE ON TRANSACOES
+    BEGIN
+        UPDATE CONTRAPARTES SET VL_ENTR = VL_ENTR - OLD.VL, QT_ENTR = QT_ENTR - 1
+        WHERE ID_CLIE = OLD.ID_RCBE AND ID_CTPT = OLD.ID_PGTO;
+
+        UPDATE CONTRAPARTES SET VL_SAID = VL_SAID - OLD.VL, QT_SAID = QT_SAID - 1
+        WHERE ID_CLIE = OLD.ID_PGTO AND ID_CTPT = OLD.ID_RCBE;
+
+        DELETE FROM CONTRAPARTES
+        WHERE ID_CLIE IN (OLD.ID_PGTO, OLD.ID_RCBE) AND ID_CTPT IN (OLD.ID_PGTO, OLD.ID_RCBE)
+          AND QT_ENTR <= 0 AND QT_SAID <= 0;
+    END;
+"""
+
+def _schema(conn):
+    """SCHEMA, with the client columns declared INTEGER on an interned database (they hold CLIENTES codes)."""
+    if interning.is_interned(conn):
+        return SCHEMA.replace("ID_CLIE TEXT", "ID_CLIE INTEGER").replace("ID_CTPT TEXT", "ID_CTPT INTEGER")
+    return SCHEMA
+
+def _init_counterparties_if_needed(conn):
+    """
+    Internal function to create the CONTRAPARTES table and its triggers if they don't exist,
+    backfilling it from the transactions already stored.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='CONTRAPARTES'")
+    if cur.fetchone() is None:
+        print("CONTRAPARTES table not found. Building counterparty aggregates...")
+        # A one-time build, even when a request with a time budget triggers it
+        with deadlines.suspended():
+            cur.executescript(_schema(conn))
+            _backfill(cur)
+            conn.commit()
+        print("Counterparty aggregates built successfully.")
+
+def _backfill(cur):
+    """Recomputes every (client, counterparty) aggregate from TRANSACOES (and its partitions, if any)."""
+    # Computed before the DELETE: the archive file can't be attached inside a transaction
+    source = partitioning.transactions_source(cur.connection)
+    cur.execute("DELETE FROM CONTRAPARTES")
+    cur.execute(f"""
+        INSERT INTO CONTRAPARTES (ID_CLIE, ID_CTPT, VL_ENTR, VL_SAID, QT_ENTR, QT_SAID, DT_ULTM)
+        SELECT ID_CLIE, ID_CTPT, SUM(VL_ENTR), SUM(VL_SAID), SUM(QT_ENTR), SUM(QT_SAID), MAX(DT_REFE)
+        FROM (
+            SELECT ID_RCBE as ID_CLIE, ID_PGTO as ID_CTPT, VL as VL_ENTR, 0 as VL_SAID, 1 as QT_ENTR, 0 as QT_SAID, DT_REFE
+            FROM {source}
+            UNION ALL
+            SELECT ID_PGTO, ID_RCBE, 0, VL, 0, 1, DT_REFE
+            FROM {source}
+        )
+        GROUP BY ID_CLIE, ID_CTPT
+    """)
+
+def get_db(id=None):
+    # With sharding enabled, each shard holds the aggregates of the clients it owns
+    path = sharding.client_db_path(id, DB_PATH) if id is not None else DB_PATH
+    conn = sqlite3.connect(path, factory=metrics.InstrumentedConnection)
+    # Ensure the aggregate table exists before proceeding
+    _init_counterparties_if_needed(conn)
+    conn.row_factory = sqlite3.Row
+    conn.clients = interning.for_path(path)
+    return conn
+
+def rebuild_counterparties(db_path=None):
+    """Drops and recomputes the counterparty aggregates (e.g., after bulk deletes or updates)."""
+    with sqlite3.connect(db_path or DB_PATH) as conn:
+        cur = conn.cursor()
+        cur.executescript(_schema(conn))
+        _backfill(cur)
+        conn.commit()
+        print(f"Rebuilt {cur.rowcount} counterparty aggregates.")
+
+def get_counterparties(id, top=10, by='total'):
+    """
+    Fetches a client's top counterparties ranked by total volume, income ('in') or expense ('out').
+    Customers are counterparties the client received from; suppliers are the ones it paid.
+    """
+    ranking = RANKINGS.get(by, RANKINGS['total'])
+    top = max(1, min(top, MAX_TOP))
+
+    conn = get_db(id)
+    cur = conn.cursor()
+    query = f"""
+        SELECT ID_CTPT, VL_ENTR, VL_SAID, QT_ENTR, QT_SAID, DT_ULTM
+        FROM CONTRAPARTES
+        WHERE ID_CLIE = ?
+        ORDER BY {ranking} DESC
+        LIMIT ?
+    """
+    cur.execute(query, (conn.clients.encode(id), top))
+
+    counterparties = []
+    for row in cur.fetchall():
+        last_activity = datetime.strptime(row['DT_ULTM'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
+
+        counterparties.append({
+            "counterparty": conn.clients.decode(row['ID_CTPT']),
+            "totalIn": row['VL_ENTR'],
+            "totalOut": row['VL_SAID'],
+            "countIn": row['QT_ENTR'],
+            "countOut": row['QT_SAID'],
+            "lastActivity": last_activity
+        })
+
+    conn.close()
+    return counterparties
+
+if __name__ == '__main__':
+    rebuild_counterparties()
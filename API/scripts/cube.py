@@ -0,0 +1,280 @@
+# cube.py
+
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime
+from scripts import deadlines, interning, metrics, partitioning, sharding
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_PATH = os.path.join(PROJECT_ROOT, 'banco.db')
+
+# Pre-aggregated cube over CNAE x maturity stage x opening-year cohort x month. A company's CNAE
+# and opening date come from its most recent ID record, its stage from MATURIDADE (NULL if it
+# wasn't classified). Each transaction counts as income in the receiver's cell and as expense in
+# the payer's; clients without an ID record are left out. Rebuilt after every classification and
+# load, so it only reflects the transactions present at its last build (see CUBO_CONSTRUCAO).
+CUBE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS CUBO_TRANSACOES (
+        DS_CNAE TEXT,                         -- Descrição CNAE
+        MATU TEXT,                            -- Estágio de maturidade
+        AA_COORT TEXT,                        -- Ano de abertura da empresa (coorte)
+        AA_MES TEXT NOT NULL,                 -- Mês das transações (AAAA-MM)
+        VL_ENTR INTEGER NOT NULL,             -- Valor recebido pelas empresas da célula
+        VL_SAID INTEGER NOT NULL,             -- Valor pago pelas empresas da célula
+        QT_ENTR INTEGER NOT NULL,             -- Quantidade de transações recebidas
+        QT_SAID INTEGER NOT NULL,             -- Quantidade de transações pagas
+        QT_EMPR_ATIV INTEGER NOT NULL         -- Empresas com alguma transação no mês
+    );
+
+    CREATE INDEX IF NOT EXISTS IX_CUBO_TRANSACOES_MES ON CUBO_TRANSACOES (AA_MES);
+
+    CREATE TABLE IF NOT EXISTS CUBO_EMPRESAS (
+        DS_CNAE TEXT,                         -- Descrição CNAE
+        MATU TEXT,                            -- Estágio de maturidade
+        AA_COORT TEXT,                        -- Ano de abertura da empresa (coorte)
+        QT_EMPR INTEGER NOT NULL              -- Quantidade de empresas
+    );
+
+    CREATE TABLE IF NOT EXISTS CUBO_CONSTRUCAO (
+        DT_CONS TEXT NOT NULL,                -- Data e hora da última construção
+        QT_LINH INTEGER NOT NULL,             -- Linhas de CUBO_TRANSACOES
+        MS_CONS REAL NOT NULL                 -- Duração da construção, em milissegundos
+    );
+"""
+
+# Dimensions accepted by `query`, with their cube columns.
+DIMENSIONS = {
+    'cnae': 'DS_CNAE',
+    'stage': 'MATU',
+    'cohort': 'AA_COORT',
+    'month': 'AA_MES'
+}
+
+# Additive measures of CUBO_TRANSACOES: they can be summed over any dimension.
+MEASURES = {
+    'income': 'VL_ENTR',
+    'expense': 'VL_SAID',
+    'incomeCount': 'QT_ENTR',
+    'expenseCount': 'QT_SAID'
+}
+
+MAX_ROWS = 10000
+
+def _create_schema(cur):
+    for statement in CUBE_SCHEMA.split(';'):
+        if statement.strip():
+            cur.execute(statement)
+
+def refresh_cube(conn, source="TRANSACOES"):
+    """
+    Recomputes the cube tables from ID, MATURIDADE and the transactions in `source` (what to put
+    after FROM; see `partitioning.transactions_source`). Doesn't commit, so callers can run it in
+    the same transaction as the change that made it necessary.
+    """
+    started = time.perf_counter()
+    cur = conn.cursor()
+    _create_schema(cur)
+
+    # Attributes of each company keyed by what TRANSACOES stores: the text ID, or its CLIENTES code
+    interned = interning.is_interned(conn)
+    cur.execute("DROP TABLE IF EXISTS temp.CUBO_ATRIBUTOS")
+    cur.execute(f"""
+        CREATE TEMP TABLE CUBO_ATRIBUTOS (
+            CHAVE {'INTEGER' if interned else 'TEXT'} PRIMARY KEY,
+            DS_CNAE TEXT,
+            MATU TEXT,
+            AA_COORT TEXT
+        )
+    """)
+    cur.execute(f"""
+        INSERT INTO temp.CUBO_ATRIBUTOS (CHAVE, DS_CNAE, MATU, AA_COORT)
+        SELECT {'C.CD_CLIE' if interned else 'L.ID'}, L.DS_CNAE, M.MATU, STRFTIME('%Y', L.DT_ABRT)
+        FROM (
+            SELECT ID, DS_CNAE, DT_ABRT, ROW_NUMBER() OVER(PARTITION BY ID ORDER BY DT_REFE DESC) as rn
+            FROM ID
+        ) L
+        {'JOIN CLIENTES C ON C.ID = L.ID' if interned else ''}
+        LEFT JOIN MATURIDADE M ON M.ID = L.ID
+        WHERE L.rn = 1
+    """)
+
+    cur.execute("DELETE FROM CUBO_EMPRESAS")
+    cur.execute("""
+        INSERT INTO CUBO_EMPRESAS (DS_CNAE, MATU, AA_COORT, QT_EMPR)
+        SELECT DS_CNAE, MATU, AA_COORT, COUNT(*)
+        FROM temp.CUBO_ATRIBUTOS
+        GROUP BY DS_CNAE, MATU, AA_COORT
+    """)
+
+    # One pass per side of the transaction. On a shard, the counterparty of another shard has no
+    # ID row there, so each side is counted once, in its owner's shard, and the shards add up.
+    cur.execute("DELETE FROM CUBO_TRANSACOES")
+    cur.execute(f"""
+        INSERT INTO CUBO_TRANSACOES (DS_CNAE, MATU, AA_COORT, AA_MES, VL_ENTR, VL_SAID, QT_ENTR, QT_SAID, QT_EMPR_ATIV)
+        SELECT A.DS_CNAE, A.MATU, A.AA_COORT, L.AA_MES,
+               SUM(L.VL_ENTR), SUM(L.VL_SAID), SUM(L.QT_ENTR), SUM(L.QT_SAID), COUNT(DISTINCT L.CHAVE)
+        FROM (
+            SELECT ID_RCBE AS CHAVE, STRFTIME('%Y-%m', DT_REFE) AS AA_MES,
+                   SUM(VL) AS VL_ENTR, 0 AS VL_SAID, COUNT(*) AS QT_ENTR, 0 AS QT_SAID
+            FROM {source}
+            GROUP BY ID_RCBE, AA_MES
+            UNION ALL
+            SELECT ID_PGTO, STRFTIME('%Y-%m', DT_REFE), 0, SUM(VL), 0, COUNT(*)
+            FROM {source}
+            GROUP BY ID_PGTO, STRFTIME('%Y-%m', DT_REFE)
+        ) L
+        JOIN temp.CUBO_ATRIBUTOS A ON A.CHAVE = L.CHAVE
+        GROUP BY A.DS_CNAE, A.MATU, A.AA_COORT, L.AA_MES
+    """)
+    rows = cur.rowcount
+    cur.execute("DROP TABLE temp.CUBO_ATRIBUTOS")
+
+    cur.execute("DELETE FROM CUBO_CONSTRUCAO")
+    cur.execute(
+        "INSERT INTO CUBO_CONSTRUCAO (DT_CONS, QT_LINH, MS_CONS) VALUES (?, ?, ?)",
+        (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), rows, (time.perf_counter() - started) * 1000)
+    )
+    return rows
+
+def rebuild_cube(db_path):
+    """Rebuilds the cube of one database file in its own transaction. Run it after loading data."""
+    conn = sqlite3.connect(db_path)
+    # Archive partitions are attached outside the transaction: ATTACH can't run inside one
+    source = partitioning.transactions_source(conn)
+    rows = refresh_cube(conn, source)
+    conn.commit()
+    conn.close()
+    return rows
+
+def _init_cube_if_needed(conn):
+    """
+    Internal function to build the cube tables if they don't exist yet
+    (databases created before they were introduced).
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='CUBO_CONSTRUCAO'")
+    if cur.fetchone() is None:
+        print("Cube tables not found. Building them from ID, MATURIDADE and TRANSACOES...")
+        source = partitioning.transactions_source(conn)
+        # A one-time build, even when a request with a time budget triggers it
+        with deadlines.suspended():
+            refresh_cube(conn, source)
+            conn.commit()
+
+def get_db_connection(path=None):
+    """Establishes and returns a connection with the database (or with one shard, given its path)."""
+    conn = sqlite3.connect(path or DB_PATH, factory=metrics.InstrumentedConnection)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _where(filters, month_range):
+    """WHERE clause and parameters of the filters: {dimension: [values]} plus a (from, to) month range."""
+    clauses, params = [], []
+    for dimension, values in filters.items():
+        clauses.append(f"{DIMENSIONS[dimension]} IN ({','.join('?' for _ in values)})")
+        params.extend(values)
+    month_from, month_to = month_range
+    if month_from:
+        clauses.append("AA_MES >= ?")
+        params.append(month_from)
+    if month_to:
+        clauses.append("AA_MES <= ?")
+        params.append(month_to)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def _cube_partial(dimensions, filters, month_range, with_companies, path=None):
+    """Rolls the cube of one database up to `dimensions`. Returns ({key: measures}, built at)."""
+    conn = get_db_connection(path)
+    _init_cube_if_needed(conn)
+    cur = conn.cursor()
+    columns = [DIMENSIONS[d] for d in dimensions]
+    select = ''.join(f"{column}, " for column in columns)
+    group_by = f" GROUP BY {', '.join(columns)}" if columns else ""
+
+    where, params = _where(filters, month_range)
+    cur.execute(f"""
+        SELECT {select}{', '.join(f'SUM({column})' for column in MEASURES.values())}, SUM(QT_EMPR_ATIV)
+        FROM CUBO_TRANSACOES{where}{group_by}
+    """, params)
+    cells = {}
+    for row in cur.fetchall():
+        key = tuple(row[:len(columns)])
+        values = row[len(columns):]
+        if values[0] is None:
+            # A grand total over no rows
+            continue
+        cells[key] = dict(zip(list(MEASURES) + ['activeCompanies'], values))
+
+    if with_companies:
+        where, params = _where(filters, (None, None))
+        cur.execute(f"SELECT {select}SUM(QT_EMPR) FROM CUBO_EMPRESAS{where}{group_by}", params)
+        for row in cur.fetchall():
+            if row[-1] is not None:
+                cells.setdefault(tuple(row[:-1]), dict.fromkeys(list(MEASURES) + ['activeCompanies'], 0))['companies'] = row[-1]
+
+    cur.execute("SELECT DT_CONS FROM CUBO_CONSTRUCAO")
+    built = cur.fetchone()
+    conn.close()
+    return cells, built['DT_CONS'] if built else None
+
+def query(dimensions=(), filters=None, month_from=None, month_to=None, limit=1000):
+    """
+    Answers a slice/dice/roll-up query from the cube: sums the measures over every dimension not in
+    `dimensions`, keeping the cells that match `filters` ({dimension: [values]}) and the inclusive
+    month range (AAAA-MM).
+
+    `activeCompanies` (companies with transactions in the month) only adds up within one month, so it
+    is returned when the result is per month or restricted to a single month. `companies` (every
+    company, active or not) doesn't depend on the month, so it is returned when no month is involved.
+    """
+    filters = filters or {}
+    month_range = (month_from, month_to)
+    single_month = 'month' in dimensions or len(filters.get('month', ())) == 1 \
+        or (month_from is not None and month_from == month_to)
+    with_companies = 'month' not in dimensions and 'month' not in filters and not (month_from or month_to)
+
+    partial = lambda path=None: _cube_partial(tuple(dimensions), filters, month_range, with_companies, path)
+    # Clients are partitioned across shards and each shard counts only its own, so cells simply add up
+    partials = sharding.fan_out(partial) if sharding.enabled() else [partial()]
+
+    cells, built_at = {}, None
+    for partial_cells, partial_built_at in partials:
+        built_at = min(filter(None, (built_at, partial_built_at)), default=None)
+        for key, values in partial_cells.items():
+            cell = cells.setdefault(key, {})
+            for measure, value in values.items():
+                cell[measure] = cell.get(measure, 0) + value
+
+    rows = []
+    # NULL members (unclassified companies, unknown opening date) sort last
+    for key in sorted(cells, key=lambda key: [(value is None, value or '') for value in key]):
+        row = dict(zip(dimensions, key))
+        values = cells[key]
+        row.update({measure: values.get(measure, 0) for measure in MEASURES})
+        if single_month:
+            row['activeCompanies'] = values.get('activeCompanies', 0)
+        if with_companies:
+            row['companies'] = values.get('companies', 0)
+        rows.append(row)
+
+    return {
+        "dimensions": list(dimensions),
+        "totalRows": len(rows),
+        "rows": rows[:max(1, min(limit, MAX_ROWS))],
+        "builtAt": built_at
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuilds the CNAE x stage x cohort x month cube.")
+    parser.add_argument('--db', action='append', help="Database to rebuild (repeatable). Default: banco.db, or every shard when SHARD_COUNT is set.")
+    args = parser.parse_args()
+    paths = args.db or (sharding.shard_paths() if sharding.enabled() else [DB_PATH])
+    for path in paths:
+        started = time.perf_counter()
+        rows = rebuild_cube(path)
+        print(f"{path}: {rows} cube rows in {time.perf_counter() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()
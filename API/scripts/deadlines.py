@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+def _parse_budgets(value):
+    """Parses 'rule=ms,rule=ms' (e.g. "/transactions/list=1500,/cnae/list=800") into a dict."""
+    budgets = {}
+    for item in filter(None, value.split(',')):
+        rule, ms = item.rsplit('=', 1)
+        budgets[rule.strip()] = float(ms)
+    return budgets
+
+# Time budget of the SQLite work of one request, in milliseconds. 0 disables it.
+DEFAULT_BUDGET_MS = float(os.getenv("QUERY_BUDGET_MS", "5000"))
+# Per-endpoint budgets, by route pattern, overridable through QUERY_BUDGETS. Streamed exports have
+# none: once the body has started the client can't get a 503, so the export would be truncated.
+ENDPOINT_BUDGETS_MS = {
+    '/transactions/export': 0,
+    **_parse_budgets(os.getenv("QUERY_BUDGETS", ""))
+}
+
+# SQLite VM instructions between two deadline checks: frequent enough to stop within about
+# a millisecond, rare enough that the Python callback costs nothing measurable.
+CHECK_INTERVAL = 10000
+# Suggested wait, in seconds, for clients whose request ran out of time.
+RETRY_AFTER = 2
+
+class DeadlineExceeded(Exception):
+    """A statement was interrupted because its request ran out of time."""
+
+    def __init__(self, message, retry_after=RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+_local = threading.local()
+
+def budget_for(endpoint):
+    """Budget of an endpoint, in seconds, or None if its queries aren't bounded."""
+    ms = ENDPOINT_BUDGETS_MS.get(endpoint, DEFAULT_BUDGET_MS)
+    return ms / 1000 if ms > 0 else None
+
+def start(budget):
+    """Starts the deadline of the current thread's request; `budget` in seconds (None for no deadline)."""
+    _local.deadline = time.monotonic() + budget if budget else None
+    _local.suspended = 0
+
+def clear():
+    _local.deadline = None
+
+def current():
+    return getattr(_local, 'deadline', None)
+
+def expired():
+    deadline = current()
+    return deadline is not None and time.monotonic() >= deadline
+
+@contextmanager
+def suspended():
+    """
+    Lifts the deadline for one-off work that must be allowed to finish, such as building a
+    derived table on first use: interrupting it would roll it back, for every request after.
+    """
+    _local.suspended = getattr(_local, 'suspended', 0) + 1
+    try:
+        yield
+    finally:
+        _local.suspended -= 1
+
+def _check():
+    # Non-zero aborts the running statement with "interrupted"
+    deadline = getattr(_local, 'deadline', None)
+    return deadline is not None and not _local.suspended and time.monotonic() >= deadline
+
+def install(conn):
+    """
+    Makes the connection's statements abort once the deadline of the thread running them passes.
+    The deadline is read on every check, so the connection follows the request that uses it.
+    """
+    conn.set_progress_handler(_check, CHECK_INTERVAL)
+
+def bind(fn):
+    """Wraps `fn` to run under the calling thread's deadline, e.g. in a worker pool."""
+    deadline = current()
+
+    def run(*args, **kwargs):
+        _local.deadline = deadline
+        _local.suspended = 0
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.deadline = None
+    return run
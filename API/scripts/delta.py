@@ -0,0 +1,136 @@
+import copy
+import hashlib
+import json
+
+# Operations of RFC 6902 (JSON Patch) accepted by `apply_patch`.
+PATCH_OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+class PatchError(ValueError):
+    """The patch can't be applied to the document (bad path, unknown operation or failed test)."""
+
+def content_hash(document):
+    """Stable hash of a JSON document: equal content gives the same hash, whatever the key order."""
+    canonical = json.dumps(document, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+def merge_patch(target, patch):
+    """
+    Applies an RFC 7396 JSON Merge Patch and returns the result, leaving `target` untouched:
+    objects are merged key by key, `null` removes a key and any other value replaces it.
+    """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+def _pointer(path):
+    """Splits a JSON Pointer ('/filtros_ativos/regiao') into its unescaped tokens."""
+    if path == '':
+        return []
+    if not isinstance(path, str) or not path.startswith('/'):
+        raise PatchError(f"Caminho inválido: {path!r}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in path[1:].split('/')]
+
+def _child(container, token, path):
+    if isinstance(container, dict):
+        if token not in container:
+            raise PatchError(f"Caminho não encontrado: {path}")
+        return container[token]
+    if isinstance(container, list):
+        if not token.isdigit() or int(token) >= len(container):
+            raise PatchError(f"Índice inválido em {path}")
+        return container[int(token)]
+    raise PatchError(f"Caminho não encontrado: {path}")
+
+def _get(document, path):
+    """Value at a JSON Pointer."""
+    current = document
+    for token in _pointer(path):
+        current = _child(current, token, path)
+    return current
+
+def _apply(document, op, path, value=None):
+    """
+    Applies one add, remove or replace at `path`, in place. Returns the document (a new one when
+    `path` is the root) and the value removed or replaced (None for add).
+    """
+    tokens = _pointer(path)
+    if not tokens:
+        if op == 'remove':
+            raise PatchError("Não é possível remover o documento inteiro")
+        return value, document
+
+    parent = document
+    for token in tokens[:-1]:
+        parent = _child(parent, token, path)
+    last = tokens[-1]
+
+    if isinstance(parent, dict):
+        if op != 'add' and last not in parent:
+            raise PatchError(f"Caminho não encontrado: {path}")
+        old = parent.get(last)
+        if op == 'remove':
+            del parent[last]
+        else:
+            parent[last] = value
+        return document, old
+    if isinstance(parent, list):
+        if op == 'add' and last == '-':
+            parent.append(value)
+            return document, None
+        limit = len(parent) + (1 if op == 'add' else 0)
+        if not last.isdigit() or int(last) >= limit:
+            raise PatchError(f"Índice inválido em {path}")
+        index = int(last)
+        if op == 'add':
+            parent.insert(index, value)
+            return document, None
+        old = parent[index]
+        if op == 'remove':
+            del parent[index]
+        else:
+            parent[index] = value
+        return document, old
+    raise PatchError(f"Caminho não encontrado: {path}")
+
+def apply_patch(document, operations):
+    """
+    Applies an RFC 6902 JSON Patch (add, remove, replace, move, copy and test operations) and
+    returns the result, leaving `document` untouched. Raises PatchError if any operation fails,
+    in which case none of them is applied.
+    """
+    if not isinstance(operations, list):
+        raise PatchError("O patch deve ser uma lista de operações")
+    result = copy.deepcopy(document)
+    for operation in operations:
+        op = operation.get('op') if isinstance(operation, dict) else None
+        if op not in PATCH_OPERATIONS:
+            raise PatchError(f"Operação não suportada: {op!r}")
+        path = operation.get('path')
+        _pointer(path)
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise PatchError(f"Operação {op} sem 'value' em {path}")
+        source = operation.get('from')
+        if op in ('move', 'copy') and source is None:
+            raise PatchError(f"Operação {op} sem 'from' em {path}")
+
+        if op == 'test':
+            if _get(result, path) != operation['value']:
+                raise PatchError(f"Teste falhou em {path}")
+        elif op == 'move':
+            source_tokens = _pointer(source)
+            # A location can't be moved into one of its own children
+            if path != source and _pointer(path)[:len(source_tokens)] == source_tokens:
+                raise PatchError(f"Não é possível mover {source} para dentro de si mesmo")
+            result, value = _apply(result, 'remove', source)
+            result, _ = _apply(result, 'add', path, value)
+        elif op == 'copy':
+            result, _ = _apply(result, 'add', path, copy.deepcopy(_get(result, source)))
+        else:
+            result, _ = _apply(result, op, path, copy.deepcopy(operation.get('value')))
+    return result
@@ -0,0 +1,190 @@
+# intern.py
+
+import argparse
+import re
+import sqlite3
+import statistics
+import time
+from scripts import counterparties, interning, partitioning, sharding
+
+# Client ID columns turned into CLIENTES codes, per table.
+CLIENT_COLUMNS = {
+    'CONTRAPARTES': ('ID_CLIE', 'ID_CTPT'),
+    'TRANSACOES': ('ID_PGTO', 'ID_RCBE')
+}
+
+# Per-client queries of the overview and list routes, timed on the most active client before and
+# after the migration (:id is the client's key in the layout being timed)
+TIMED_QUERIES = {
+    'overview balance': """
+        SELECT SUM(CASE WHEN ID_RCBE = :id THEN VL WHEN ID_PGTO = :id THEN -VL ELSE 0 END)
+        FROM TRANSACOES WHERE ID_PGTO = :id OR ID_RCBE = :id
+    """,
+    'list count': "SELECT COUNT(*) FROM TRANSACOES WHERE (ID_PGTO = :id OR ID_RCBE = :id)",
+    'list page': "SELECT * FROM TRANSACOES WHERE (ID_PGTO = :id OR ID_RCBE = :id) ORDER BY DT_REFE DESC LIMIT 20"
+}
+TIMING_RUNS = 5
+
+def _sizes(conn):
+    """Bytes used by each table and index (dbstat), the file size and the free pages."""
+    sizes = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    sizes['(file)'] = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+    sizes['(free)'] = conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+    return sizes
+
+def _report(conn, before, after):
+    objects = conn.execute(f"""
+        SELECT name, type FROM sqlite_master
+        WHERE tbl_name IN ({','.join('?' for _ in CLIENT_COLUMNS)}, 'CLIENTES') AND type IN ('table', 'index')
+        ORDER BY tbl_name, type DESC, name
+    """, tuple(CLIENT_COLUMNS)).fetchall()
+    names = [name for name, _ in objects]
+    # Automatic indexes (PRIMARY KEY / UNIQUE) have no row with SQL but are in dbstat
+    names += sorted(name for name in set(before) | set(after) if name.startswith('sqlite_autoindex_') and name not in names
+                    and any(name.startswith(f'sqlite_autoindex_{table}_') for table in list(CLIENT_COLUMNS) + ['CLIENTES']))
+    print(f"  {'object':<34}{'before MB':>12}{'after MB':>12}")
+    for name in names + ['(file)', '(free)']:
+        print(f"  {name:<34}{before.get(name, 0) / 1e6:>12.2f}{after.get(name, 0) / 1e6:>12.2f}")
+
+def _heaviest_client(conn):
+    """Text ID of the client with the most transactions, or None on an empty database."""
+    row = conn.execute(
+        "SELECT ID_CLIE FROM CONTRAPARTES GROUP BY ID_CLIE ORDER BY SUM(QT_ENTR + QT_SAID) DESC LIMIT 1"
+    ).fetchone()
+    if row is None or not interning.is_interned(conn):
+        return row and row[0]
+    return conn.execute("SELECT ID FROM CLIENTES WHERE CD_CLIE = ?", (row[0],)).fetchone()[0]
+
+def _timings(conn, client_id):
+    """Median milliseconds of each TIMED_QUERIES query for `client_id`, after one warm-up run."""
+    key = client_id
+    if interning.is_interned(conn):
+        key = conn.execute("SELECT CD_CLIE FROM CLIENTES WHERE ID = ?", (client_id,)).fetchone()[0]
+    timings = {}
+    for name, sql in TIMED_QUERIES.items():
+        conn.execute(sql, {'id': key}).fetchall()
+        runs = []
+        for _ in range(TIMING_RUNS):
+            started = time.perf_counter()
+            conn.execute(sql, {'id': key}).fetchall()
+            runs.append((time.perf_counter() - started) * 1000)
+        timings[name] = statistics.median(runs)
+    return timings
+
+def _report_timings(client_id, before, after):
+    print(f"  Median of {TIMING_RUNS} runs for {client_id}, the most active client:")
+    print(f"  {'query':<34}{'before ms':>12}{'after ms':>12}")
+    for name in TIMED_QUERIES:
+        print(f"  {name:<34}{before[name]:>12.2f}{after[name]:>12.2f}")
+
+def _rebuild(conn, table, column_type, references, value_sql):
+    """
+    Rewrites `table` with its client columns declared as `column_type` and their values mapped
+    through `value_sql` (a format string taking the column), keeping every other column, index and
+    row ID. The triggers on TRANSACOES must be dropped beforehand.
+    """
+    create_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+    index_sqls = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,))]
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+    new_sql = create_sql.replace(table, f"{table}_NOVA", 1)
+    for column in CLIENT_COLUMNS[table]:
+        # The declared type sets the column affinity: an INTEGER stored in a TEXT column becomes text
+        new_sql = re.sub(rf'\b({column})\b(\s+\w+(\s*\([^)]*\))?)?(?=\s*[,\s)])', rf'\1 {column_type}', new_sql, count=1)
+    new_sql = re.sub(r'REFERENCES\s+\w+\s*\(\s*\w+\s*\)', f'REFERENCES {references}', new_sql)
+    conn.execute(new_sql)
+
+    select = ', '.join(value_sql.format(column) if column in CLIENT_COLUMNS[table] else column for column in columns)
+    moved = conn.execute(f"INSERT INTO {table}_NOVA ({', '.join(columns)}) SELECT {select} FROM {table}").rowcount
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_NOVA RENAME TO {table}")
+    for sql in index_sqls:
+        conn.execute(sql)
+    print(f"  {table}: {moved} rows rewritten")
+
+def _migrate(db_path, to_codes, vacuum):
+    # Autocommit mode: the rewrite runs in one explicit transaction
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    if partitioning.is_partitioned(conn):
+        conn.close()
+        raise ValueError("TRANSACOES is partitioned. Run `python -m scripts.partition --merge` first.")
+    if interning.is_interned(conn) == to_codes:
+        print(f"{db_path} is already {'interned' if to_codes else 'using text IDs'}.")
+        conn.close()
+        return
+    # The aggregates get rewritten with TRANSACOES, so they must exist first
+    counterparties._init_counterparties_if_needed(conn)
+    before = _sizes(conn)
+    client_id = _heaviest_client(conn)
+    timings_before = client_id and _timings(conn, client_id)
+    started = time.perf_counter()
+    print(f"{'Interning' if to_codes else 'Reverting'} client IDs of {db_path}")
+
+    conn.execute("BEGIN")
+    # Renaming a table checks every trigger, and these reference both rewritten tables
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger' AND tbl_name='TRANSACOES'").fetchall()
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+
+    if to_codes:
+        # execute, not executescript: that would commit the transaction first
+        conn.execute(interning.DICTIONARY_SCHEMA)
+        # Sorted, so the codes 1..N follow ID order and the in-memory dictionary is a sorted list
+        conn.execute("""
+            INSERT INTO CLIENTES (ID)
+            SELECT ID FROM (
+                SELECT ID FROM ID
+                UNION SELECT ID_PGTO FROM TRANSACOES
+                UNION SELECT ID_RCBE FROM TRANSACOES
+            )
+            WHERE ID IS NOT NULL
+            ORDER BY ID
+        """)
+        print(f"  CLIENTES: {conn.execute('SELECT COUNT(*) FROM CLIENTES').fetchone()[0]} clients")
+        for table in CLIENT_COLUMNS:
+            _rebuild(conn, table, 'INTEGER', 'CLIENTES(CD_CLIE)', "(SELECT CD_CLIE FROM CLIENTES WHERE ID = {0})")
+    else:
+        for table in CLIENT_COLUMNS:
+            _rebuild(conn, table, 'TEXT', 'ID(ID)', "(SELECT ID FROM CLIENTES WHERE CD_CLIE = {0})")
+        conn.execute("DROP TABLE CLIENTES")
+
+    for _, sql in triggers:
+        conn.execute(sql)
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    if vacuum:
+        print(f"Vacuuming {db_path}...")
+        conn.execute("VACUUM")
+    print(f"Done in {time.perf_counter() - started:.1f}s.")
+    _report(conn, before, _sizes(conn))
+    if client_id:
+        _report_timings(client_id, timings_before, _timings(conn, client_id))
+    conn.close()
+
+def intern_clients(db_path, vacuum=False):
+    """
+    Replaces the text client IDs of TRANSACOES and CONTRAPARTES with integer codes from a new
+    CLIENTES dictionary, rewriting both tables and their indexes. The API keeps speaking text IDs,
+    translating through the dictionary (see `interning`). Without `vacuum`, the freed pages stay
+    in the file for reuse instead of shrinking it.
+    """
+    _migrate(db_path, True, vacuum)
+
+def revert(db_path, vacuum=False):
+    """Puts the text client IDs back and drops CLIENTES."""
+    _migrate(db_path, False, vacuum)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stores client IDs in TRANSACOES and CONTRAPARTES as integer codes.")
+    parser.add_argument('--db', action='append', help="Database to migrate (repeatable). Default: banco.db, or every shard when SHARD_COUNT is set.")
+    parser.add_argument('--vacuum', action='store_true', help="Vacuum afterwards, so the file shrinks.")
+    parser.add_argument('--revert', action='store_true', help="Go back to text client IDs.")
+    args = parser.parse_args()
+    paths = args.db or (sharding.shard_paths() if sharding.enabled() else [counterparties.DB_PATH])
+    for path in paths:
+        (revert if args.revert else intern_clients)(path, args.vacuum)
+
+if __name__ == '__main__':
+    main()
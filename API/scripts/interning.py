@@ -0,0 +1,131 @@
+import bisect
+import sqlite3
+import sys
+import threading
+
+# Dictionary of client IDs, created by `python -m scripts.intern`. Once a database is interned,
+# TRANSACOES.ID_PGTO / ID_RCBE and CONTRAPARTES.ID_CLIE / ID_CTPT hold the integer CD_CLIE
+# instead of the text ID; ID and MATURIDADE keep the text ID. Codes are assigned in ID order,
+# so the codes of the clients known at migration time are 1..N in sorted order.
+DICTIONARY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS CLIENTES (
+        CD_CLIE INTEGER PRIMARY KEY,          -- Chave substituta do cliente
+        ID TEXT NOT NULL UNIQUE               -- ID do cliente (o mesmo de ID.ID)
+    );
+"""
+
+class ClientDictionary:
+    """
+    In-memory copy of a database's CLIENTES table, translating between the text IDs the API
+    speaks and the integer codes stored in the transaction tables.
+
+    The sorted run of codes 1..N is kept as one list of interned strings: decoding is an index
+    and encoding a binary search, with no per-client dict entry. Clients added after it was
+    loaded are looked up in the database on first use and remembered.
+    """
+
+    interned = True
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._ids = []
+        self._extra_codes = {}
+        self._extra_ids = {}
+        conn = sqlite3.connect(db_path)
+        for code, client_id in conn.execute("SELECT CD_CLIE, ID FROM CLIENTES ORDER BY CD_CLIE"):
+            if code == len(self._ids) + 1 and (not self._ids or client_id > self._ids[-1]):
+                self._ids.append(sys.intern(client_id))
+            else:
+                self._extra_codes[client_id] = code
+                self._extra_ids[code] = client_id
+        conn.close()
+
+    def __len__(self):
+        return len(self._ids) + len(self._extra_ids)
+
+    def _lookup(self, query, value):
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute(query, (value,)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def encode(self, client_id):
+        """Code of a text client ID, or None if the client doesn't exist (so it matches no row)."""
+        if client_id is None:
+            return None
+        index = bisect.bisect_left(self._ids, client_id)
+        if index < len(self._ids) and self._ids[index] == client_id:
+            return index + 1
+        code = self._extra_codes.get(client_id)
+        if code is None:
+            code = self._lookup("SELECT CD_CLIE FROM CLIENTES WHERE ID = ?", client_id)
+            if code is not None:
+                self._extra_codes[client_id] = code
+                self._extra_ids[code] = client_id
+        return code
+
+    def decode(self, code):
+        """Text client ID of a code."""
+        if not isinstance(code, int):
+            # None, or a text ID stored before the migration (or read from ID / MATURIDADE)
+            return code
+        if 0 < code <= len(self._ids):
+            return self._ids[code - 1]
+        client_id = self._extra_ids.get(code)
+        if client_id is None:
+            client_id = self._lookup("SELECT ID FROM CLIENTES WHERE CD_CLIE = ?", code)
+            if client_id is not None:
+                self._extra_ids[code] = client_id
+                self._extra_codes[client_id] = code
+        return client_id
+
+class _TextIds:
+    """Stand-in for databases that weren't interned: the transaction tables already hold text IDs."""
+
+    interned = False
+
+    def __len__(self):
+        return 0
+
+    def encode(self, client_id):
+        return client_id
+
+    def decode(self, code):
+        return code
+
+TEXT_IDS = _TextIds()
+
+_dictionaries = {}
+_lock = threading.Lock()
+
+def is_interned(conn):
+    """
+    Whether `python -m scripts.intern` migrated the database: TRANSACOES then declares its client
+    columns INTEGER. A CLIENTES table alone isn't enough (older definition.sql created it empty).
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='CLIENTES'").fetchone() is None:
+        return False
+    column_types = {row[1]: (row[2] or '').upper() for row in conn.execute("PRAGMA table_info(TRANSACOES)")}
+    return column_types.get('ID_PGTO') == 'INTEGER'
+
+
+def load(db_path):
+    """Reads the client dictionary of a database (TEXT_IDS if it wasn't interned)."""
+    # Read-only: loading a dictionary must not create a missing database file
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    interned = is_interned(conn)
+    conn.close()
+    return ClientDictionary(db_path) if interned else TEXT_IDS
+
+def for_path(db_path):
+    """
+    The client dictionary of a database file, loaded once per process (the warm-up loads it at
+    startup). Restart the API after interning a database or reverting it.
+    """
+    dictionary = _dictionaries.get(db_path)
+    if dictionary is None:
+        with _lock:
+            dictionary = _dictionaries.get(db_path)
+            if dictionary is None:
+                dictionary = _dictionaries[db_path] = load(db_path)
+    return dictionary
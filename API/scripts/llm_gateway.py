@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from scripts import metrics
+
+# Upstream calls allowed at the same time; further calls wait in a queue for a free slot.
+MAX_CONCURRENT_CALLS = int(os.getenv("OPENAI_MAX_CONCURRENT_CALLS", "4"))
+# Calls allowed to wait for a slot. Past this, new calls are rejected right away.
+MAX_QUEUE = int(os.getenv("OPENAI_MAX_QUEUE", "32"))
+# Total time budget of one call, in seconds: queueing, every attempt and the backoff between them.
+CALL_DEADLINE = float(os.getenv("OPENAI_CALL_DEADLINE", "30"))
+# Retries after the first attempt, on 429, 5xx, timeouts and connection errors.
+MAX_RETRIES = 3
+# Exponential backoff: attempt n sleeps a random time in [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n)].
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+class UpstreamError(Exception):
+    """The model couldn't be reached. `retry_after` is a hint, in seconds, for the client."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UpstreamBusyError(UpstreamError):
+    """The call was rejected because the queue is full or no slot freed up before the deadline."""
+
+class UpstreamTimeoutError(UpstreamError):
+    """The call's deadline expired before the model answered."""
+
+def _failure_reason(error):
+    """'timeout', 'connection' or the HTTP status of a retryable error; None if it shouldn't be retried."""
+    # openai is imported here rather than at module level: it is only needed once a call failed
+    import openai
+    if isinstance(error, openai.APITimeoutError):
+        return 'timeout'
+    if isinstance(error, openai.APIConnectionError):
+        return 'connection'
+    status = getattr(error, 'status_code', None)
+    if status == 429 or (status is not None and status >= 500):
+        return str(status)
+    return None
+
+def _retry_after(error):
+    """Seconds the server asked us to wait (Retry-After header), if any."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class _Flight:
+    """One upstream call shared by every identical request made while it runs."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Gateway:
+    """
+    Guards the chat completion calls of a client:
+    - single-flight: identical concurrent requests share one upstream call;
+    - a bounded semaphore with a bounded queue caps concurrent calls;
+    - each call has a deadline covering queueing and retries;
+    - 429/5xx/timeouts are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, client=None, client_factory=None, max_concurrent=MAX_CONCURRENT_CALLS,
+                 max_queue=MAX_QUEUE, deadline=CALL_DEADLINE):
+        # Without a client, `client_factory` builds it on first use (keeping heavy imports off startup)
+        self._client = client
+        self._client_factory = client_factory
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._wait_total = 0.0
+        self._wait_count = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def complete(self, **kwargs):
+        """Same arguments and result as `client.chat.completions.create`."""
+        key = hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        model = kwargs.get('model', '')
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            metrics.openai_coalesced.inc(model)
+            # The leader's call is bounded by the same deadline, so this wait is too
+            flight.done.wait()
+        else:
+            try:
+                flight.result = self._call(model, kwargs)
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _call(self, model, kwargs):
+        deadline = time.monotonic() + self.deadline
+
+        with self._lock:
+            if self._queued >= self.max_queue:
+                metrics.openai_requests.inc(model, 'rejected')
+                raise UpstreamBusyError("Fila de chamadas ao modelo cheia", retry_after=1)
+            self._queued += 1
+            metrics.openai_queue_depth.set(value=self._queued)
+
+        started = time.monotonic()
+        acquired = self._slots.acquire(timeout=max(0.0, deadline - started))
+        waited = time.monotonic() - started
+        with self._lock:
+            self._queued -= 1
+            metrics.openai_queue_depth.set(value=self._queued)
+            self._wait_total += waited
+            self._wait_count += 1
+        metrics.openai_queue_wait.observe(waited)
+        if not acquired:
+            metrics.openai_requests.inc(model, 'rejected')
+            raise UpstreamBusyError("Nenhuma vaga livre antes do prazo da chamada", retry_after=1)
+
+        with self._lock:
+            self._in_flight += 1
+            metrics.openai_in_flight.set(value=self._in_flight)
+        try:
+            # The slot is held during backoff too: on 429 we want less pressure upstream, not more
+            return self._call_with_retries(model, kwargs, deadline)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                metrics.openai_in_flight.set(value=self._in_flight)
+            self._slots.release()
+
+    def _call_with_retries(self, model, kwargs, deadline):
+        for attempt in range(MAX_RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics.openai_requests.inc(model, 'timeout')
+                raise UpstreamTimeoutError("Prazo da chamada ao modelo esgotado")
+
+            started = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(timeout=remaining, **kwargs)
+            except Exception as e:
+                metrics.openai_request_duration.observe(time.perf_counter() - started, model)
+                status = _failure_reason(e)
+                if status is None:
+                    metrics.openai_requests.inc(model, 'error')
+                    raise
+                metrics.openai_requests.inc(model, status)
+
+                backoff = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                backoff = max(backoff, _retry_after(e) or 0)
+                if attempt == MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                    error_class = UpstreamTimeoutError if status == 'timeout' else UpstreamError
+                    raise error_class(f"Modelo indisponível: {e}", retry_after=max(1, round(backoff))) from e
+                metrics.openai_retries.inc(model, status)
+                time.sleep(backoff)
+                continue
+
+            metrics.openai_request_duration.observe(time.perf_counter() - started, model)
+            metrics.openai_requests.inc(model, 'success')
+            if response.usage:
+                metrics.openai_tokens.inc(model, 'prompt', amount=response.usage.prompt_tokens)
+                metrics.openai_tokens.inc(model, 'completion', amount=response.usage.completion_tokens)
+            return response
+
+    def stats(self):
+        """Current load: calls in flight and queued, and the mean time spent waiting for a slot."""
+        with self._lock:
+            return {
+                "inFlight": self._in_flight,
+                "queued": self._queued,
+                "maxConcurrent": self.max_concurrent,
+                "maxQueue": self.max_queue,
+                "avgWaitMs": round(self._wait_total / self._wait_count * 1000, 1) if self._wait_count else 0.0
+            }
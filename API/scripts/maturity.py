@@ -1,47 +1,151 @@
 import sqlite3
 import os
 import math
+import heapq
+import itertools
 from datetime import datetime
+from scripts import deadlines, metrics, sharding
 
 # Construct an absolute path to the database file.
 # This goes up two directories from `scripts` to the project root.
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DB_PATH = os.path.join(PROJECT_ROOT, 'banco.db')
 
-def get_db_connection():
-    """Establishes and returns a connection with the database."""
-    conn = sqlite3.connect(DB_PATH)
+# Company counts per maturity stage and per (CNAE, stage). They are recomputed in the same
+# transaction as every classification update, so reads never scan MATURIDADE.
+COUNTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS MATURIDADE_CONTAGEM (
+        MATU TEXT PRIMARY KEY,                -- Estágio de maturidade
+        QT_EMPR INTEGER NOT NULL              -- Quantidade de empresas no estágio
+    );
+
+    CREATE TABLE IF NOT EXISTS MATURIDADE_CNAE (
+        DS_CNAE TEXT NOT NULL,                -- Descrição CNAE (do registro mais recente da empresa)
+        MATU TEXT NOT NULL,                   -- Estágio de maturidade
+        QT_EMPR INTEGER NOT NULL,             -- Quantidade de empresas
+        PRIMARY KEY (DS_CNAE, MATU)
+    );
+"""
+
+def refresh_maturity_counts(conn):
+    """
+    Recomputes the maturity count tables from MATURIDADE and ID. Doesn't commit, so callers
+    can run it in the same transaction as the MATURIDADE update that made it necessary.
+    """
+    cur = conn.cursor()
+    for statement in COUNTS_SCHEMA.split(';'):
+        if statement.strip():
+            cur.execute(statement)
+    cur.execute("DELETE FROM MATURIDADE_CONTAGEM")
+    cur.execute("""
+        INSERT INTO MATURIDADE_CONTAGEM (MATU, QT_EMPR)
+        SELECT MATU, COUNT(DISTINCT ID)
+        FROM MATURIDADE
+        GROUP BY MATU
+    """)
+    cur.execute("DELETE FROM MATURIDADE_CNAE")
+    cur.execute("""
+        INSERT INTO MATURIDADE_CNAE (DS_CNAE, MATU, QT_EMPR)
+        SELECT L.DS_CNAE, M.MATU, COUNT(DISTINCT M.ID)
+        FROM MATURIDADE M
+        JOIN (
+            SELECT ID, DS_CNAE, ROW_NUMBER() OVER(PARTITION BY ID ORDER BY DT_REFE DESC) as rn
+            FROM ID
+        ) L ON L.ID = M.ID AND L.rn = 1
+        GROUP BY L.DS_CNAE, M.MATU
+    """)
+
+def _init_maturity_counts_if_needed(conn):
+    """
+    Internal function to build the maturity count tables if they don't exist yet (databases
+    created before they were introduced), or are still empty while MATURIDADE has rows
+    (created from definition.sql, then loaded without a classification run).
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='MATURIDADE_CNAE'")
+    exists = cur.fetchone() is not None
+    if exists:
+        cur.execute("""
+            SELECT NOT EXISTS (SELECT 1 FROM MATURIDADE_CONTAGEM) AND EXISTS (SELECT 1 FROM MATURIDADE)
+        """)
+        exists = not cur.fetchone()[0]
+    if not exists:
+        print("Maturity count tables not found or empty. Building them from MATURIDADE...")
+        # A one-time build, even when a request with a time budget triggers it
+        with deadlines.suspended():
+            refresh_maturity_counts(conn)
+            conn.commit()
+
+def get_db_connection(path=None):
+    """Establishes and returns a connection with the database (or with one shard, given its path)."""
+    conn = sqlite3.connect(path or DB_PATH, factory=metrics.InstrumentedConnection)
     # Using row_factory to easily access columns by name
     conn.row_factory = sqlite3.Row
     return conn
 
 def get_maturity_overview():
     """
-    Queries the MATURIDADE table to get the count of companies for each maturity stage.
+    Reads the count of companies for each maturity stage from MATURIDADE_CONTAGEM.
     Returns a single object with maturity stages as keys and their counts as values.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
+    if sharding.enabled():
+        # IDs are partitioned across shards, so per-shard distinct counts simply add up
+        overview_data = {}
+        for partial in sharding.fan_out(_maturity_overview_partial):
+            for stage, count in partial.items():
+                overview_data[stage] = overview_data.get(stage, 0) + count
+        return overview_data
 
-    query = """
-        SELECT MATU, COUNT(DISTINCT ID) as count
-        FROM MATURIDADE
-        GROUP BY MATU
-    """
-    cur.execute(query)
+    return _maturity_overview_partial()
+
+def _maturity_overview_partial(path=None):
+    conn = get_db_connection(path)
+    _init_maturity_counts_if_needed(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT MATU, QT_EMPR FROM MATURIDADE_CONTAGEM")
 
-    overview_data = {row['MATU']: row['count'] for row in cur.fetchall()}
+    overview_data = {row['MATU']: row['QT_EMPR'] for row in cur.fetchall()}
     conn.close()
     return overview_data
 
-def get_maturity_list(state=None, page=1):
+def get_maturity_crosstab(cnae=None):
     """
-    Fetches a paginated list of companies, optionally filtered by maturity state.
-    For each company, only the most recent entry based on DT_REFE is returned.
+    Reads the number of companies per CNAE and maturity stage from MATURIDADE_CNAE.
+    Returns one object per CNAE, ordered by its total number of companies.
     """
-    conn = get_db_connection()
+    partials = sharding.fan_out(lambda path: _maturity_crosstab_partial(cnae, path)) if sharding.enabled() \
+        else [_maturity_crosstab_partial(cnae)]
+
+    crosstab = {}
+    for partial in partials:
+        for row_cnae, stage, count in partial:
+            stages = crosstab.setdefault(row_cnae, {})
+            stages[stage] = stages.get(stage, 0) + count
+
+    crosstab_data = [
+        {"cnae": row_cnae, "total": sum(stages.values()), "stages": stages}
+        for row_cnae, stages in crosstab.items()
+    ]
+    return sorted(crosstab_data, key=lambda x: x['total'], reverse=True)
+
+def _maturity_crosstab_partial(cnae=None, path=None):
+    conn = get_db_connection(path)
+    _init_maturity_counts_if_needed(conn)
     cur = conn.cursor()
+    if cnae:
+        cur.execute("SELECT DS_CNAE, MATU, QT_EMPR FROM MATURIDADE_CNAE WHERE DS_CNAE = ?", (cnae,))
+    else:
+        cur.execute("SELECT DS_CNAE, MATU, QT_EMPR FROM MATURIDADE_CNAE")
 
+    rows = [(row['DS_CNAE'], row['MATU'], row['QT_EMPR']) for row in cur.fetchall()]
+    conn.close()
+    return rows
+
+def _latest_records(state=None):
+    """
+    Builds the query returning the most recent ID record of each company, optionally
+    restricted to a maturity state. Returns the query and its parameters.
+    """
     params = []
     from_clause = "FROM ID"
 
@@ -60,6 +164,20 @@ def get_maturity_list(state=None, page=1):
         )
         SELECT * FROM LatestRecords WHERE rn = 1
     """
+    return base_query_cte, params
+
+def get_maturity_list(state=None, page=1):
+    """
+    Fetches a paginated list of companies, optionally filtered by maturity state.
+    For each company, only the most recent entry based on DT_REFE is returned.
+    """
+    if sharding.enabled():
+        return _get_maturity_list_sharded(state, page)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    base_query_cte, params = _latest_records(state)
 
     # --- Get total count for pagination ---
     count_query = f"SELECT COUNT(*) as total FROM ({base_query_cte})"
@@ -87,23 +205,63 @@ def get_maturity_list(state=None, page=1):
     paged_params = params + [items_per_page, offset]
     cur.execute(select_query, tuple(paged_params))
 
-    processed_accounts = []
-    for row in cur.fetchall():
-        # Format the dates and currency values as requested
-        opening_date = datetime.strptime(row['DT_ABRT'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
-        ref_date = datetime.strptime(row['DT_REFE'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
-
-        processed_accounts.append({
-            "ID": row['ID'],
-            "FATURAMENTO": f"R${row['VL_FATU']}",
-            "SALDO": f"R${row['VL_SLDO']}",
-            "DATA_ABERTURA": opening_date,
-            "CNAE": row['DS_CNAE'],
-            "DATA_REFERENCIA": ref_date
-        })
+    processed_accounts = [_format_account(row) for row in cur.fetchall()]
 
     conn.close()
     return {
         "totalPages": total_pages,
         "accounts": processed_accounts
-    }
\ No newline at end of file
+    }
+
+def _format_account(row):
+    """Converts an ID row into the shape returned by the maturity list."""
+    # Format the dates and currency values as requested
+    opening_date = datetime.strptime(row['DT_ABRT'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
+    ref_date = datetime.strptime(row['DT_REFE'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
+
+    return {
+        "ID": row['ID'],
+        "FATURAMENTO": f"R${row['VL_FATU']}",
+        "SALDO": f"R${row['VL_SLDO']}",
+        "DATA_ABERTURA": opening_date,
+        "CNAE": row['DS_CNAE'],
+        "DATA_REFERENCIA": ref_date
+    }
+
+# --- SHARDED LAYOUT ---
+
+def _maturity_list_partial(state, limit, path):
+    """Per-shard part of the maturity list: the company count and the first `limit` companies by ID."""
+    conn = get_db_connection(path)
+    cur = conn.cursor()
+    base_query_cte, params = _latest_records(state)
+    cur.execute(f"SELECT COUNT(*) as total FROM ({base_query_cte})", tuple(params))
+    total_items = cur.fetchone()['total']
+    cur.execute(f"""
+        SELECT ID, VL_FATU, VL_SLDO, DT_ABRT, DS_CNAE, DT_REFE
+        FROM ({base_query_cte})
+        ORDER BY ID
+        LIMIT ?
+    """, tuple(params + [limit]))
+    rows = [dict(row) for row in cur.fetchall()]
+    conn.close()
+    return total_items, rows
+
+def _get_maturity_list_sharded(state, page):
+    items_per_page = 20
+    # SQLite treats a negative OFFSET as 0, so the unsharded path serves page 1 for page <= 0
+    page = max(1, page)
+    offset = (page - 1) * items_per_page
+
+    # Merging each shard's first `offset + items_per_page` companies gives the exact global page
+    partials = sharding.fan_out(lambda path: _maturity_list_partial(state, offset + items_per_page, path))
+    total_items = sum(total for total, _ in partials)
+    if total_items == 0:
+        return {"totalPages": 0, "accounts": []}
+
+    merged = heapq.merge(*(rows for _, rows in partials), key=lambda row: row['ID'])
+    page_rows = list(itertools.islice(merged, offset, offset + items_per_page))
+    return {
+        "totalPages": math.ceil(total_items / items_per_page),
+        "accounts": [_format_account(row) for row in page_rows]
+    }
@@ -1,6 +1,8 @@
 # maturity_classification.py
 
+import os
 import sqlite3
+import sys
 import pandas as pd
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
@@ -8,10 +10,17 @@ from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 import warnings
 
+# Run as a file (`python maturity_classification.py`), the `scripts` package isn't importable yet
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import cube, interning, maturity, partitioning  # noqa: E402
+
 # Suppress future warnings from scikit-learn for cleaner output
 warnings.filterwarnings('ignore', category=FutureWarning)
 
-DB_PATH = './banco.db'
+# Construct an absolute path to the database file, like the API modules do.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_PATH = os.path.join(PROJECT_ROOT, 'banco.db')
 
 def load_data(db_path: str) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
@@ -21,8 +30,14 @@ def load_data(db_path: str) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     try:
         with sqlite3.connect(db_path) as conn:
             df_id = pd.read_sql_query("SELECT * FROM ID", conn)
-            df_transacoes = pd.read_sql_query("SELECT * FROM TRANSACOES", conn)
+            # Includes every partition, archived ones too, on a partitioned database
+            df_transacoes = pd.read_sql_query(f"SELECT * FROM {partitioning.transactions_source(conn)}", conn)
             df_maturidade = pd.read_sql_query("SELECT * FROM MATURIDADE", conn)
+        # Features are joined on the text ID, so interned client codes are translated back
+        clients = interning.load(db_path)
+        if clients.interned:
+            for column in ('ID_PGTO', 'ID_RCBE'):
+                df_transacoes[column] = df_transacoes[column].map(clients.decode)
         print("Data loaded successfully.")
         return df_id, df_transacoes, df_maturidade
     except sqlite3.Error as e:
@@ -75,11 +90,34 @@ def create_features(df_id: pd.DataFrame, df_transacoes: pd.DataFrame) -> pd.Data
     print("Feature engineering complete.")
     return final_features
 
-def map_clusters_to_maturity(model_results: pd.DataFrame) -> pd.DataFrame:
+def build_pipeline(df_features: pd.DataFrame, k: int, random_state: int = 42) -> Pipeline:
     """
-    Maps K-Means cluster labels to meaningful maturity names based on cluster centroids.
+    Builds the preprocessing + K-Means pipeline for the features of `create_features`.
+    """
+    # Define numeric and categorical features for the preprocessing pipeline
+    numeric_features = df_features.select_dtypes(include=['number']).columns.tolist()
+    categorical_features = ['DS_CNAE']
+
+    # Preprocessor to scale numeric data and one-hot encode categorical data
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', StandardScaler(), numeric_features),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
+        ],
+        remainder='passthrough'
+    )
+
+    # Full pipeline with preprocessing and K-Means clustering
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('kmeans', KMeans(n_clusters=k, random_state=random_state, n_init='auto'))
+    ])
+
+def cluster_stage_map(model_results: pd.DataFrame) -> dict:
+    """
+    Chooses the maturity name of each cluster label from the cluster centroids.
+    With more than 4 clusters, the clusters past the 4 stages are left unmapped.
     """
-    print("\nMapping cluster labels to maturity names...")
     # Analyze the characteristics of each cluster by looking at the mean of its features
     cluster_centroids = model_results.groupby('cluster').mean(numeric_only=True)
     
@@ -104,7 +142,14 @@ def map_clusters_to_maturity(model_results: pd.DataFrame) -> pd.DataFrame:
         # Ensure we don't run out of stages if k is different than 4
         if i < len(other_stages):
             cluster_map[cluster_id] = other_stages[i]
+    return cluster_map
 
+def map_clusters_to_maturity(model_results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Maps K-Means cluster labels to meaningful maturity names based on cluster centroids.
+    """
+    print("\nMapping cluster labels to maturity names...")
+    cluster_map = cluster_stage_map(model_results)
     print("Cluster to Maturity Name Mapping:", cluster_map)
     
     # Apply the mapping to the results DataFrame
@@ -120,13 +165,21 @@ def update_maturity_in_db(results_df: pd.DataFrame, db_path: str):
     
     try:
         with sqlite3.connect(db_path) as conn:
+            # Attaches the archive partitions, which can't be done once the transaction has begun
+            source = partitioning.transactions_source(conn)
             cursor = conn.cursor()
             cursor.executemany(
                 "UPDATE MATURIDADE SET MATU = ? WHERE ID = ?",
                 [(row['nova_MATU'], row['ID']) for index, row in update_data.iterrows()]
             )
+            updated_rows = cursor.rowcount
+            # Refresh the stage and CNAE x stage counts in the same transaction,
+            # so /maturity/overview and /maturity/crosstab never see a partial update
+            maturity.refresh_maturity_counts(conn)
+            # The analytics cube is keyed by stage too, so it is rebuilt along with them
+            cube.refresh_cube(conn, source)
             conn.commit()
-            print(f"Successfully updated {cursor.rowcount} rows in the MATURIDADE table.")
+            print(f"Successfully updated {updated_rows} rows in the MATURIDADE table.")
     except sqlite3.Error as e:
         print(f"Database update failed: {e}")
 
@@ -144,25 +197,7 @@ def run_classification_and_update():
     print(f"Found {k} unique maturity stages. Setting k={k} for K-Means.")
 
     df_features = create_features(df_id, df_transacoes)
-
-    # Define numeric and categorical features for the preprocessing pipeline
-    numeric_features = df_features.select_dtypes(include=['number']).columns.tolist()
-    categorical_features = ['DS_CNAE']
-
-    # Preprocessor to scale numeric data and one-hot encode categorical data
-    preprocessor = ColumnTransformer(
-        transformers=[
-            ('num', StandardScaler(), numeric_features),
-            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
-        ],
-        remainder='passthrough'
-    )
-
-    # Full pipeline with preprocessing and K-Means clustering
-    pipeline = Pipeline(steps=[
-        ('preprocessor', preprocessor),
-        ('kmeans', KMeans(n_clusters=k, random_state=42, n_init='auto'))
-    ])
+    pipeline = build_pipeline(df_features, k)
 
     print("Training K-Means model with preprocessing pipeline...")
     # Fit the model and get cluster assignments
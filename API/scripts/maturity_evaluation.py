@@ -0,0 +1,185 @@
+# maturity_evaluation.py
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.metrics import adjusted_rand_score, davies_bouldin_score, silhouette_score
+from threadpoolctl import threadpool_limits
+from scripts import maturity_classification as classification
+
+# Stages in a fixed order, so each fit's stage assignment is stored as small integer codes.
+STAGES = ['Iniciante', 'Expansão', 'Madura', 'Declínio']
+UNMAPPED = -1
+
+# Features and scoring sample of the sweep, set once per worker process by `_init_worker`.
+_worker = {}
+
+def stratified_sample(df_features: pd.DataFrame, size: int, seed: int = 0) -> np.ndarray:
+    """
+    Row positions of a sample of about `size` companies, stratified by CNAE: each CNAE keeps its
+    share of the population, and at least one company. Silhouette is quadratic in the number
+    of points, so every fit is scored on this sample instead of the full table.
+    """
+    if size >= len(df_features):
+        return np.arange(len(df_features))
+    rng = np.random.default_rng(seed)
+    positions = []
+    for rows in df_features.groupby('DS_CNAE', sort=True).indices.values():
+        take = max(1, round(size * len(rows) / len(df_features)))
+        positions.append(rng.choice(rows, size=min(take, len(rows)), replace=False))
+    return np.sort(np.concatenate(positions))
+
+def _init_worker(df_features, sample):
+    # One process per core: K-Means' own threads would only oversubscribe the CPUs
+    threadpool_limits(1)
+    _worker['features'] = df_features
+    _worker['sample'] = sample
+
+def _fit_candidate(candidate):
+    """Fits one (k, seed) pipeline on every company and scores it on the sample."""
+    k, seed = candidate
+    df_features = _worker['features']
+
+    started = time.perf_counter()
+    pipeline = classification.build_pipeline(df_features, k, random_state=seed)
+    labels = pipeline.fit_predict(df_features)
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sample = _worker['sample']
+    points = pipeline[:-1].transform(df_features.iloc[sample])
+    if hasattr(points, 'toarray'):
+        # The one-hot CNAE columns can come out sparse; Davies-Bouldin needs a dense matrix
+        points = points.toarray()
+    sample_labels = labels[sample]
+    scored = len(set(sample_labels)) > 1
+    silhouette = float(silhouette_score(points, sample_labels)) if scored else None
+    davies_bouldin = float(davies_bouldin_score(points, sample_labels)) if scored else None
+    score_seconds = time.perf_counter() - started
+
+    cluster_map = classification.cluster_stage_map(df_features.assign(cluster=labels))
+    codes_by_cluster = np.array([STAGES.index(cluster_map[c]) if c in cluster_map else UNMAPPED for c in range(k)], dtype=np.int8)
+    stages = codes_by_cluster[labels]
+
+    return {
+        'k': k,
+        'seed': seed,
+        'silhouette': silhouette,
+        'daviesBouldin': davies_bouldin,
+        'inertia': float(pipeline[-1].inertia_),
+        'fitSeconds': fit_seconds,
+        'scoreSeconds': score_seconds,
+        'stageShares': {STAGES[code]: float(np.mean(stages == code)) for code in sorted(set(codes_by_cluster) - {UNMAPPED})},
+        'unmappedShare': float(np.mean(stages == UNMAPPED)),
+        'labels': labels.astype(np.int16),
+        'stages': stages
+    }
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return float(np.mean(values)) if values else None
+
+def _stability(fits):
+    """
+    Agreement between the fits of one k across seeds, averaged over every pair: the adjusted
+    Rand index of the cluster labels, and the share of companies that get the same stage from
+    `map_clusters_to_maturity` (stage names don't depend on label numbering, so no matching is needed).
+    """
+    pairs = list(itertools.combinations(fits, 2))
+    if not pairs:
+        return None, None
+    ari = _mean([adjusted_rand_score(a['labels'], b['labels']) for a, b in pairs])
+    agreement = _mean([float(np.mean(a['stages'] == b['stages'])) for a, b in pairs])
+    return ari, agreement
+
+def evaluate(k_values, seeds, sample_size=10000, workers=None, db_path=None):
+    """
+    Fits every (k, seed) candidate in a process pool and reports, per k, the sampled silhouette
+    (higher is better) and Davies-Bouldin index (lower is better), the fit time and the stability
+    of the cluster labels and of the stage mapping across seeds. Nothing is written to the database.
+    """
+    df_id, df_transacoes, df_maturidade = classification.load_data(db_path or classification.DB_PATH)
+    if df_id.empty:
+        raise ValueError("Could not load the data to evaluate.")
+    df_features = classification.create_features(df_id, df_transacoes)
+    current_k = df_maturidade['MATU'].nunique()
+    sample = stratified_sample(df_features, sample_size)
+    candidates = [(k, seed) for k in k_values for seed in seeds]
+    workers = min(workers or os.cpu_count() or 1, len(candidates))
+    print(f"Evaluating {len(candidates)} fits (k={list(k_values)}, seeds={list(seeds)}) on {len(df_features)} companies "
+          f"with {workers} worker processes, scoring on a sample of {len(sample)}...")
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(df_features, sample)) as pool:
+        fits = list(pool.map(_fit_candidate, candidates))
+    wall_seconds = time.perf_counter() - started
+
+    report = {
+        'companies': len(df_features),
+        'sampleSize': int(len(sample)),
+        'workers': workers,
+        'currentK': int(current_k),
+        'wallSeconds': wall_seconds,
+        'fitSecondsTotal': sum(f['fitSeconds'] + f['scoreSeconds'] for f in fits),
+        'byK': []
+    }
+    for k in k_values:
+        k_fits = [f for f in fits if f['k'] == k]
+        ari, agreement = _stability(k_fits)
+        report['byK'].append({
+            'k': k,
+            'silhouette': _mean([f['silhouette'] for f in k_fits]),
+            'silhouetteStd': float(np.std([f['silhouette'] for f in k_fits if f['silhouette'] is not None] or [0])),
+            'daviesBouldin': _mean([f['daviesBouldin'] for f in k_fits]),
+            'fitSeconds': _mean([f['fitSeconds'] for f in k_fits]),
+            'labelAri': ari,
+            'stageAgreement': agreement,
+            'unmappedShare': _mean([f['unmappedShare'] for f in k_fits]),
+            'fits': [{key: value for key, value in f.items() if key not in ('labels', 'stages')} for f in k_fits]
+        })
+    return report
+
+def _format(value, digits=3):
+    return f"{value:.{digits}f}" if value is not None else "-"
+
+def print_report(report):
+    print(f"\n{'k':>3}{'silhouette':>12}{'± std':>8}{'Davies-B.':>11}{'fit s':>8}{'label ARI':>11}{'same stage':>12}{'unmapped':>10}")
+    for row in report['byK']:
+        marker = '  <- current' if row['k'] == report['currentK'] else ''
+        print(f"{row['k']:>3}{_format(row['silhouette']):>12}{_format(row['silhouetteStd']):>8}"
+              f"{_format(row['daviesBouldin']):>11}{_format(row['fitSeconds'], 2):>8}"
+              f"{_format(row['labelAri']):>11}{_format(row['stageAgreement']):>12}"
+              f"{_format(row['unmappedShare']):>10}{marker}")
+
+    scored = [row for row in report['byK'] if row['silhouette'] is not None]
+    if scored:
+        best_silhouette = max(scored, key=lambda row: row['silhouette'])
+        best_davies_bouldin = min(scored, key=lambda row: row['daviesBouldin'])
+        print(f"\nBest k by silhouette: {best_silhouette['k']}; by Davies-Bouldin: {best_davies_bouldin['k']}.")
+    print(f"Wall time {report['wallSeconds']:.1f}s for {report['fitSecondsTotal']:.1f}s of fitting and scoring "
+          f"({report['fitSecondsTotal'] / report['wallSeconds']:.1f}x with {report['workers']} workers).")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweeps K-Means k and seeds for the maturity classification and scores each fit.")
+    parser.add_argument('--k', default='2,3,4,5,6', help="Comma-separated k values.")
+    parser.add_argument('--seeds', type=int, default=5, help="Seeds per k (42, 43, ...; 42 is the one the classification uses).")
+    parser.add_argument('--sample', type=int, default=10000, help="Companies in the stratified scoring sample.")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per core).")
+    parser.add_argument('--db', help="Database to read (default: banco.db).")
+    parser.add_argument('--output', help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    k_values = [int(k) for k in args.k.split(',')]
+    report = evaluate(k_values, range(42, 42 + args.seeds), args.sample, args.workers, args.db)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from scripts import deadlines, profiling
+
+# Default latency buckets, in seconds (same spirit as the Prometheus client defaults).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Response size buckets, in bytes.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_registry = []
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (f'{k}="{_escape_label_value(v)}"' for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+def _escape_label_value(value):
+    # The exposition format only allows \\, \" and \n inside a label value
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in items)
+        return lines
+
+class Gauge(Counter):
+    """Value that can go up and down (e.g., requests in flight)."""
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def collect(self):
+        lines = super().collect()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, optionally split by labels."""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                # One slot per bucket plus +Inf, then the running sum
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def collect(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, ('le', bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def render():
+    """Renders every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+# --- HTTP metrics (recorded by the hooks in main.py) ---
+
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Time spent handling each request.', ('endpoint', 'method'))
+http_requests = Counter(
+    'http_requests_total', 'Requests handled, by status code.', ('endpoint', 'method', 'status'))
+http_response_size = Histogram(
+    'http_response_size_bytes', 'Size of non-streamed response bodies.', ('endpoint',), buckets=SIZE_BUCKETS)
+http_in_flight = Gauge(
+    'http_requests_in_flight', 'Requests being handled (admitted past the in-flight limit).')
+http_shed_requests = Counter(
+    'http_shed_requests_total', 'Requests rejected with 503 because the in-flight limit was reached.', ('endpoint',))
+http_deadline_exceeded = Counter(
+    'http_deadline_exceeded_total', 'Requests answered 503 because their queries ran past the time budget.', ('endpoint',))
+
+# --- SQLite metrics (recorded by InstrumentedConnection) ---
+
+sqlite_statement_duration = Histogram(
+    'sqlite_statement_duration_seconds',
+    'Time spent executing statements and fetching their rows, by calling function.',
+    ('caller', 'phase'))
+sqlite_statements = Counter(
+    'sqlite_statements_total', 'SQL statements executed, by calling function.', ('caller',))
+sqlite_slow_statements = Counter(
+    'sqlite_slow_statements_total', 'Statements slower than the slow-query threshold.', ('caller',))
+sqlite_interrupted_statements = Counter(
+    'sqlite_interrupted_statements_total', 'Statements interrupted at their request deadline.', ('caller',))
+
+# --- OpenAI metrics (recorded by llm_gateway.Gateway) ---
+
+openai_request_duration = Histogram(
+    'openai_request_duration_seconds', 'Latency of OpenAI chat completion calls.', ('model',))
+openai_requests = Counter(
+    'openai_requests_total', 'OpenAI chat completion calls, by outcome.', ('model', 'status'))
+openai_tokens = Counter(
+    'openai_tokens_total', 'Tokens consumed by OpenAI calls.', ('model', 'type'))
+openai_retries = Counter(
+    'openai_retries_total', 'OpenAI calls retried after a retryable failure, by cause.', ('model', 'reason'))
+openai_coalesced = Counter(
+    'openai_coalesced_total', 'Requests served by an identical call already in flight.', ('model',))
+openai_queue_depth = Gauge(
+    'openai_queue_depth', 'OpenAI calls waiting for a free concurrency slot.')
+openai_in_flight = Gauge(
+    'openai_in_flight', 'OpenAI calls holding a concurrency slot.')
+openai_queue_wait = Histogram(
+    'openai_queue_wait_seconds', 'Time OpenAI calls waited for a concurrency slot.')
+
+
+def _caller(depth):
+    """Returns 'module.function' of the code that issued a statement, e.g. 'transactions.get_transactions_list'."""
+    frame = sys._getframe(depth)
+    module = frame.f_globals.get('__name__', '?').rsplit('.', 1)[-1]
+    return f"{module}.{frame.f_code.co_name}"
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that counts and times every statement and fetch. The time of a statement
+    (execute + all its fetches) is checked against the slow-query threshold once the
+    statement is finished: rows exhausted, next execute, or connection closed.
+    """
+
+    _caller_name = '?'
+    _statement = None
+
+    def _start_statement(self, sql, parameters, depth):
+        self._finish_statement()
+        self._caller_name = _caller(depth + 1)
+        self._statement = [sql, parameters, 0.0]
+        sqlite_statements.inc(self._caller_name)
+
+    def _finish_statement(self):
+        statement, self._statement = self._statement, None
+        if statement is None:
+            return
+        sql, parameters, elapsed = statement
+        if elapsed * 1000 >= profiling.SLOW_QUERY_MS:
+            sqlite_slow_statements.inc(self._caller_name)
+            profiling.record_slow_query(self._caller_name, sql, parameters, elapsed * 1000, self._explain(sql, parameters))
+
+    def _explain(self, sql, parameters):
+        """Returns the EXPLAIN QUERY PLAN lines of a statement, or None if it can't be explained."""
+        if parameters is None:
+            return None
+        try:
+            # A plain cursor, so the EXPLAIN itself is not instrumented
+            plan = sqlite3.Cursor(self.connection).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+            return [row[3] for row in plan]
+        except sqlite3.Error:
+            return None
+
+    def _timed(self, phase, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        except sqlite3.OperationalError as e:
+            if str(e) == 'interrupted' and deadlines.expired():
+                sqlite_interrupted_statements.inc(self._caller_name)
+                raise deadlines.DeadlineExceeded(f"{self._caller_name} ran past the request's time budget") from e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            sqlite_statement_duration.observe(elapsed, self._caller_name, phase)
+            if self._statement is not None:
+                self._statement[2] += elapsed
+
+    def execute(self, sql, parameters=(), _depth=2):
+        self._start_statement(sql, parameters, _depth)
+        return self._timed('execute', super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, _depth=2):
+        # No single parameter set to explain the plan with
+        self._start_statement(sql, None, _depth)
+        result = self._timed('execute', super().executemany, sql, seq_of_parameters)
+        self._finish_statement()
+        return result
+
+    def fetchone(self):
+        row = self._timed('fetch', super().fetchone)
+        if row is None:
+            self._finish_statement()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed('fetch', super().fetchmany, size)
+        if len(rows) < size:
+            self._finish_statement()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed('fetch', super().fetchall)
+        self._finish_statement()
+        return rows
+
+    def close(self):
+        self._finish_statement()
+        super().close()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors report to the SQLite metrics and the slow-query log, and whose
+    statements stop at the deadline of the request running them (see `deadlines`).
+    Use it as `sqlite3.connect(path, factory=metrics.InstrumentedConnection)`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Weak, so long-lived connections don't keep every cursor they ever opened
+        self._cursors = weakref.WeakSet()
+        deadlines.install(self)
+
+    def cursor(self, factory=InstrumentedCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, InstrumentedCursor):
+            self._cursors.add(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters, _depth=3)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters, _depth=3)
+
+    def close(self):
+        # Statements whose rows were never exhausted are only finished here
+        for cursor in list(self._cursors):
+            cursor._finish_statement()
+        self._cursors.clear()
+        super().close()
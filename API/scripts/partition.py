@@ -0,0 +1,184 @@
+# partition.py
+
+import argparse
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from scripts import counterparties, partitioning
+
+PARTITION_NAMES = {
+    'year': re.compile(r'TRANSACOES_\d{4}'),
+    'month': re.compile(r'TRANSACOES_\d{4}_\d{2}')
+}
+
+def _period_start(date, by):
+    return date.replace(month=1 if by == 'year' else date.month, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _add_months(date, months):
+    month = date.month - 1 + months
+    return date.replace(year=date.year + month // 12, month=month % 12 + 1)
+
+def _partition_name(start, by):
+    return f"TRANSACOES_{start.year}" if by == 'year' else f"TRANSACOES_{start.year}_{start.month:02d}"
+
+def _create_partition(conn, schema, table):
+    """Creates `schema.table` with the columns and indexes of TRANSACOES, if it doesn't exist."""
+    exists = conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+    if exists:
+        return
+    create_sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name='TRANSACOES'").fetchone()[0]
+    conn.execute(create_sql.replace("TRANSACOES", f"{schema}.{table}", 1))
+    for index_name, index_sql in conn.execute("""
+        SELECT name, sql FROM main.sqlite_master
+        WHERE type='index' AND tbl_name='TRANSACOES' AND sql IS NOT NULL
+    """).fetchall():
+        # An index lives in its table's schema, so the schema goes on the index name
+        index_sql = index_sql.replace(index_name, f"{schema}.{index_name.replace('TRANSACOES', table)}", 1)
+        conn.execute(index_sql.replace(" ON TRANSACOES", f" ON {table}", 1))
+
+def _without_triggers(conn, action):
+    """
+    Runs `action` in a transaction with the triggers of TRANSACOES dropped, recreating them before
+    committing. Moving rows between partitions isn't a new or deleted transaction, and the aggregates
+    the triggers maintain (CONTRAPARTES) cover archived transactions too.
+    """
+    conn.execute("BEGIN")
+    triggers = conn.execute("SELECT name, sql FROM main.sqlite_master WHERE type='trigger' AND tbl_name='TRANSACOES'").fetchall()
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    action()
+    for _, sql in triggers:
+        conn.execute(sql)
+    conn.execute("COMMIT")
+
+def partition(db_path, by='year', hot_months=12, archive_months=36, archive_dir=None, vacuum=False):
+    """
+    Moves the transactions older than the hot window (`hot_months` before the latest transaction,
+    rounded down to a partition boundary) out of TRANSACOES into one table per year or month.
+    Partitions that end more than `archive_months` before the latest transaction go to the
+    database's archive file in `archive_dir`; newer ones stay in `db_path`. Running it again moves
+    the rows and partitions that have aged since.
+    """
+    started = time.perf_counter()
+
+    # Autocommit mode: transactions are explicit, and ATTACH (not allowed inside one) happens first
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # Makes sure the counterparty aggregates exist before rows start moving around
+    counterparties._init_counterparties_if_needed(conn)
+    conn.executescript(partitioning.CATALOG_SCHEMA)
+    catalog = {row[0]: row[1:] for row in conn.execute("SELECT NM_TABE, DT_INIC, DT_FIM, NM_ARQV FROM PARTICOES_TRANSACOES")}
+    if any(not PARTITION_NAMES[by].fullmatch(table) for table in catalog):
+        raise ValueError("The database is already partitioned with a different granularity. Run with --merge first.")
+    # Once there is an archive file, later runs keep using it (whatever `archive_dir` says)
+    archive_file = next((row[2] for row in catalog.values() if row[2]), None)
+    if archive_file is None:
+        archive_dir = archive_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive')
+        os.makedirs(archive_dir, exist_ok=True)
+        db_stem = os.path.splitext(os.path.basename(db_path))[0]
+        archive_file = os.path.relpath(os.path.join(archive_dir, f"{db_stem}_arquivo.db"), os.path.dirname(os.path.abspath(db_path)))
+
+    # The hot table normally holds the newest date; partitions only cover older data
+    latest = conn.execute("SELECT MAX(DT_REFE) FROM TRANSACOES").fetchone()[0]
+    if latest is None:
+        print("No transactions left in TRANSACOES to partition.")
+        conn.close()
+        return
+    latest = datetime.strptime(latest[:19], partitioning.DATE_FORMAT)
+    hot_start = _period_start(_add_months(latest, -hot_months), by)
+    archive_before = _add_months(latest, -archive_months)
+
+    # Rows that left the hot window go to their period's partition, wherever it already lives
+    moves = []
+    for (period,) in conn.execute(f"""
+        SELECT DISTINCT {"STRFTIME('%Y', DT_REFE)" if by == 'year' else "STRFTIME('%Y-%m', DT_REFE)"}
+        FROM TRANSACOES WHERE DT_REFE < ?
+        ORDER BY 1
+    """, (hot_start.strftime(partitioning.DATE_FORMAT),)).fetchall():
+        start = datetime.strptime(period, '%Y' if by == 'year' else '%Y-%m')
+        end = _add_months(start, 12 if by == 'year' else 1)
+        table = _partition_name(start, by)
+        if table in catalog:
+            target = catalog[table][2]
+        else:
+            target = archive_file if end <= archive_before else None
+        moves.append((table, start, end, target))
+
+    # Local partitions that became cold move to the archive file
+    aging = [
+        table for table, (start, end, archive) in catalog.items()
+        if archive is None and datetime.strptime(end, partitioning.DATE_FORMAT) <= archive_before
+    ]
+
+    if aging or any(m[3] for m in moves):
+        partitioning.attach_archive(conn, archive_file)
+
+    def move():
+        for table, start, end, target in moves:
+            schema = partitioning.ARCHIVE_SCHEMA if target else 'main'
+            _create_partition(conn, schema, table)
+            bounds = (start.strftime(partitioning.DATE_FORMAT), end.strftime(partitioning.DATE_FORMAT))
+            moved = conn.execute(f"INSERT INTO {schema}.{table} SELECT * FROM main.TRANSACOES WHERE DT_REFE >= ? AND DT_REFE < ?", bounds).rowcount
+            conn.execute("DELETE FROM main.TRANSACOES WHERE DT_REFE >= ? AND DT_REFE < ?", bounds)
+            conn.execute("INSERT OR IGNORE INTO PARTICOES_TRANSACOES (NM_TABE, DT_INIC, DT_FIM, NM_ARQV) VALUES (?, ?, ?, ?)", (table,) + bounds + (target,))
+            print(f"  {table}: {moved} rows -> {target or 'local'}")
+
+        for table in aging:
+            schema = partitioning.ARCHIVE_SCHEMA
+            _create_partition(conn, schema, table)
+            moved = conn.execute(f"INSERT INTO {schema}.{table} SELECT * FROM main.{table}").rowcount
+            conn.execute(f"DROP TABLE main.{table}")
+            conn.execute("UPDATE PARTICOES_TRANSACOES SET NM_ARQV = ? WHERE NM_TABE = ?", (archive_file, table))
+            print(f"  {table}: {moved} rows archived -> {archive_file}")
+
+    print(f"Partitioning {db_path} by {by} (hot from {hot_start:%Y-%m-%d}, archive before {archive_before:%Y-%m-%d})")
+    _without_triggers(conn, move)
+    conn.execute("ANALYZE")
+    _finish(conn, db_path, vacuum)
+    print(f"Partitioned in {time.perf_counter() - started:.1f}s.")
+
+def merge(db_path, vacuum=False):
+    """Moves every partition back into TRANSACOES and drops the catalog (e.g., before resharding)."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    catalog = partitioning._catalog(conn) or []
+    sources = [(table, partitioning.attach_archive(conn, archive) if archive else 'main') for table, _, _, archive in catalog]
+
+    def move():
+        for table, schema in sources:
+            moved = conn.execute(f"INSERT INTO main.TRANSACOES SELECT * FROM {schema}.{table}").rowcount
+            conn.execute(f"DROP TABLE {schema}.{table}")
+            print(f"  {table}: {moved} rows merged back")
+        conn.execute("DROP TABLE IF EXISTS PARTICOES_TRANSACOES")
+
+    _without_triggers(conn, move)
+    _finish(conn, db_path, vacuum)
+
+def _finish(conn, db_path, vacuum):
+    """Optionally vacuums the database and its archive file; each file is compacted on its own."""
+    archives = [path for _, name, path in conn.execute("PRAGMA database_list").fetchall() if name == partitioning.ARCHIVE_SCHEMA]
+    conn.close()
+    if vacuum:
+        for path in [db_path] + archives:
+            print(f"Vacuuming {path}...")
+            target = sqlite3.connect(path)
+            target.execute("VACUUM")
+            target.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Splits TRANSACOES into time partitions and a cold archive file.")
+    parser.add_argument('--db', default=counterparties.DB_PATH, help="Database to partition.")
+    parser.add_argument('--by', choices=('year', 'month'), default='year', help="Partition granularity.")
+    parser.add_argument('--hot-months', type=int, default=12, help="Months kept in TRANSACOES, before the latest transaction.")
+    parser.add_argument('--archive-months', type=int, default=36, help="Partitions ending this many months before the latest transaction go to the archive file.")
+    parser.add_argument('--archive-dir', help="Directory of the archive file (default: 'archive' next to the database). Set on the first run that archives.")
+    parser.add_argument('--vacuum', action='store_true', help="Vacuum the database and the archive file afterwards.")
+    parser.add_argument('--merge', action='store_true', help="Move every partition back into TRANSACOES.")
+    args = parser.parse_args()
+    if args.merge:
+        merge(args.db, args.vacuum)
+    else:
+        partition(args.db, args.by, args.hot_months, args.archive_months, args.archive_dir, args.vacuum)
+
+if __name__ == '__main__':
+    main()
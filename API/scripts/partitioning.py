@@ -0,0 +1,90 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+# Catalog of the time partitions of TRANSACOES, created by `python -m scripts.partition`.
+# TRANSACOES itself stays the hot partition (new rows keep going there, and its triggers keep
+# working); older periods live in TRANSACOES_AAAA / TRANSACOES_AAAA_MM tables, either in the
+# same database or, once cold, in an archive file next to it. All the cold partitions of a database
+# share one archive file: a connection can attach at most 10 databases (SQLITE_MAX_ATTACHED), and a
+# query over the whole history reads every archived period at once.
+CATALOG_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS PARTICOES_TRANSACOES (
+        NM_TABE TEXT PRIMARY KEY,             -- Nome da tabela da partição
+        DT_INIC TEXT NOT NULL,                -- Início do período (inclusivo)
+        DT_FIM TEXT NOT NULL,                 -- Fim do período (exclusivo)
+        NM_ARQV TEXT                          -- Arquivo de arquivo morto (relativo ao banco) ou NULL se local
+    );
+"""
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Schema name the archive file is attached under.
+ARCHIVE_SCHEMA = 'arquivo'
+
+def _catalog(conn):
+    """Returns the partitions of the connection's main database, or None if it isn't partitioned."""
+    try:
+        return conn.execute("SELECT NM_TABE, DT_INIC, DT_FIM, NM_ARQV FROM PARTICOES_TRANSACOES ORDER BY DT_INIC").fetchall()
+    except sqlite3.OperationalError:
+        return None
+
+def is_partitioned(conn):
+    return bool(_catalog(conn))
+
+def _months_between(start, end):
+    """Month numbers ('01'..'12') covered by the period [start, end)."""
+    months = set()
+    current = datetime.strptime(start[:7], '%Y-%m')
+    end = datetime.strptime(end, DATE_FORMAT)
+    while current < end and len(months) < 12:
+        months.add(current.strftime('%m'))
+        current = (current + timedelta(days=32)).replace(day=1)
+    return months
+
+def _overlaps(start, end, months=None, date_from=None, date_to=None):
+    """Whether the period [start, end) can hold rows matching the month and date range filters."""
+    if date_from and end <= date_from:
+        return False
+    if date_to and start >= date_to:
+        return False
+    if months and not (_months_between(start, end) & set(months)):
+        return False
+    return True
+
+def attach_archive(conn, archive_file):
+    """
+    Attaches the archive file (path relative to the main database) as ARCHIVE_SCHEMA, once per
+    connection, and returns the schema name.
+    """
+    databases = conn.execute("PRAGMA database_list").fetchall()
+    if not any(name == ARCHIVE_SCHEMA for _, name, _ in databases):
+        main_path = next(path for _, name, path in databases if name == 'main')
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (os.path.join(os.path.dirname(main_path), archive_file),))
+    return ARCHIVE_SCHEMA
+
+def transactions_source(conn, months=None, date_from=None, date_to=None):
+    """
+    Returns what to put after FROM to read TRANSACOES on `conn`. On a partitioned database this is
+    a UNION ALL over the hot table and the partitions whose period can match the filters, attaching
+    the archive file if any of them lives there; other partitions are pruned without being opened.
+
+    `months` are zero-padded month numbers ('01'..'12'), `date_from` / `date_to` are the inclusive /
+    exclusive bounds as 'AAAA-MM-DD HH:MM:SS'. On an unpartitioned database it's just TRANSACOES.
+    """
+    catalog = _catalog(conn)
+    if not catalog:
+        return "TRANSACOES"
+
+    # The hot table is always read: it receives every new row, whatever its date
+    tables = ["main.TRANSACOES"]
+    for table, start, end, archive_file in catalog:
+        if not _overlaps(start, end, months, date_from, date_to):
+            continue
+        schema = attach_archive(conn, archive_file) if archive_file else 'main'
+        tables.append(f"{schema}.{table}")
+
+    if len(tables) == 1:
+        return tables[0]
+    # WHERE terms on the outer query are pushed down into every arm of the UNION ALL,
+    # so each partition is still searched through its own indexes
+    return "(" + " UNION ALL ".join(f"SELECT * FROM {table}" for table in tables) + ")"
@@ -0,0 +1,142 @@
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+# Statements slower than this (execute + fetch, in milliseconds) go to the slow-query log.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# How many slow queries and request profiles are kept in memory.
+SLOW_QUERY_LOG_SIZE = 200
+PROFILE_STORE_SIZE = 20
+# Interval between two stack samples of a profiled request, in seconds.
+SAMPLE_INTERVAL = 0.002
+MAX_STACK_DEPTH = 64
+
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_profiles = {}
+_profiles_order = deque()
+_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+# --- SLOW-QUERY LOG ---
+
+def record_slow_query(caller, sql, parameters, elapsed_ms, plan):
+    """Stores a statement that exceeded SLOW_QUERY_MS, with its bound parameters and query plan."""
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'caller': caller,
+        'durationMs': round(elapsed_ms, 3),
+        'sql': ' '.join(sql.split()),
+        'parameters': [p if isinstance(p, (int, float, str)) or p is None else repr(p) for p in parameters],
+        'plan': plan
+    }
+    _slow_queries.append(entry)
+    logger.warning("Slow query (%.1f ms) in %s: %s", elapsed_ms, caller, entry['sql'][:200])
+
+def get_slow_queries(limit=50):
+    """Returns the most recent slow queries, newest first."""
+    return list(reversed(_slow_queries))[:limit]
+
+# --- REQUEST PROFILING ---
+
+class SamplingProfiler:
+    """
+    Samples the stack of a single thread at a fixed interval from a background thread.
+    Cheap enough to run on one production request at a time; nothing is sampled
+    for requests that are not profiled.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.started = None
+        self.elapsed = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                stack.append(f"{module}.{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+def store_profile(profiler, method, path):
+    """Keeps a finished profile in memory and returns its ID."""
+    profile_id = uuid.uuid4().hex[:12]
+    with _lock:
+        _profiles[profile_id] = {
+            'id': profile_id,
+            'timestamp': datetime.now().isoformat(),
+            'method': method,
+            'path': path,
+            'durationMs': round(profiler.elapsed * 1000, 3),
+            'samples': sum(profiler.samples.values()),
+            'stacks': profiler.samples
+        }
+        _profiles_order.append(profile_id)
+        while len(_profiles_order) > PROFILE_STORE_SIZE:
+            _profiles.pop(_profiles_order.popleft(), None)
+    return profile_id
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    with _lock:
+        return [
+            {k: v for k, v in _profiles[pid].items() if k != 'stacks'}
+            for pid in reversed(_profiles_order)
+        ]
+
+def get_profile(profile_id, top=30):
+    """
+    Returns a stored profile with the functions that appear most often in the samples
+    (`selfSamples` counts only the innermost frame). None if the profile doesn't exist.
+    """
+    with _lock:
+        profile = _profiles.get(profile_id)
+    if profile is None:
+        return None
+
+    inclusive = Counter()
+    exclusive = Counter()
+    for stack, count in profile['stacks'].items():
+        frames = stack.split(';')
+        exclusive[frames[-1]] += count
+        for frame in set(frames):
+            inclusive[frame] += count
+
+    return {
+        **{k: v for k, v in profile.items() if k != 'stacks'},
+        'hotspots': [
+            {'frame': frame, 'samples': count, 'selfSamples': exclusive.get(frame, 0)}
+            for frame, count in inclusive.most_common(top)
+        ]
+    }
+
+def get_profile_collapsed(profile_id):
+    """Returns a stored profile in the collapsed-stack format used by flame graph tools."""
+    with _lock:
+        profile = _profiles.get(profile_id)
+    if profile is None:
+        return None
+    return ''.join(f"{stack} {count}\n" for stack, count in profile['stacks'].most_common())
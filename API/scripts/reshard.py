@@ -0,0 +1,102 @@
+# reshard.py
+
+import argparse
+import os
+import shutil
+import sqlite3
+import time
+from scripts import counterparties, cube, interning, maturity, partitioning, sharding
+
+# Tables split by client. A client's ID and MATURIDADE rows go to its shard; a transaction
+# is copied to the shards of both its payer and its receiver, so every per-client query
+# can be answered by a single shard.
+SHARDED_TABLES = {
+    'ID': "SHARD_OF(ID) = ?",
+    'MATURIDADE': "SHARD_OF(ID) = ?",
+    'TRANSACOES': "SHARD_OF(ID_PGTO) = ? OR SHARD_OF(ID_RCBE) = ?"
+}
+
+def _copy_schema(source, shard, tables):
+    """Recreates the sharded tables and their indexes in the shard, as declared in the source."""
+    rows = source.execute(f"""
+        SELECT type, sql FROM sqlite_master
+        WHERE tbl_name IN ({','.join('?' for _ in tables)})
+          AND type IN ('table', 'index') AND sql IS NOT NULL
+        ORDER BY type = 'index'
+    """, tuple(tables)).fetchall()
+    for _, sql in rows:
+        shard.execute(sql)
+
+def reshard(shard_count, source_path, shard_dir):
+    """
+    Splits the client tables of `source_path` into `shard_count` database files in `shard_dir`.
+    The shards are written to a temporary directory and swapped in at the end, so the
+    current shards keep serving until the new ones are complete.
+    """
+    if shard_count < 2:
+        raise ValueError("At least 2 shards are required.")
+
+    tmp_dir = shard_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    source = sqlite3.connect(source_path)
+    if partitioning.is_partitioned(source):
+        source.close()
+        raise ValueError("The source's TRANSACOES is partitioned. Run `python -m scripts.partition --merge` first.")
+    # On an interned source, TRANSACOES holds client codes: shards are still picked by the text ID,
+    # and each shard gets the whole dictionary (counterparties from other shards included)
+    clients = interning.load(source_path)
+    tables = dict(SHARDED_TABLES, CLIENTES="1") if clients.interned else SHARDED_TABLES
+
+    def shard_of(client, shard_count):
+        return sharding.shard_for(clients.decode(client) if isinstance(client, int) else client, shard_count)
+
+    started = time.perf_counter()
+
+    for shard in range(shard_count):
+        path = sharding.shard_path(shard, tmp_dir)
+        print(f"Building shard {shard + 1}/{shard_count}: {path}")
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.create_function('SHARD_OF', 1, lambda client: shard_of(client, shard_count), deterministic=True)
+        _copy_schema(source, conn, tables)
+
+        conn.execute("ATTACH DATABASE ? AS source", (source_path,))
+        for table, condition in tables.items():
+            params = (shard,) * condition.count('?')
+            cur = conn.execute(f"INSERT INTO main.{table} SELECT * FROM source.{table} WHERE {condition}", params)
+            print(f"  {table}: {cur.rowcount} rows")
+        conn.commit()
+        conn.execute("DETACH DATABASE source")
+        maturity.refresh_maturity_counts(conn)
+        # Each shard's cube covers its own clients only, so the fan-out sums count every client once
+        cube.refresh_cube(conn)
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.close()
+
+        # Per-client aggregates are complete in each shard, since it holds every transaction of its clients
+        counterparties.rebuild_counterparties(path)
+
+    source.close()
+
+    old_dir = shard_dir.rstrip(os.sep) + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(shard_dir):
+        os.rename(shard_dir, old_dir)
+    os.rename(tmp_dir, shard_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    print(f"Resharded into {shard_count} shards in {time.perf_counter() - started:.1f}s: {shard_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Splits banco.db into hash-sharded database files.")
+    parser.add_argument('--shards', type=int, default=sharding.SHARD_COUNT or 4, help="Number of shards.")
+    parser.add_argument('--source', default=os.path.join(sharding.PROJECT_ROOT, 'banco.db'), help="Database to split.")
+    parser.add_argument('--dest', default=sharding.SHARD_DIR, help="Directory of the shard files.")
+    args = parser.parse_args()
+    reshard(args.shards, args.source, args.dest)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import sqlite3
+import os
+import re
+import heapq
+import itertools
+from urllib.parse import urlencode
+from scripts import deadlines, metrics, sharding
+
+# Construct an absolute path to the database file.
+# This goes up two directories from `scripts` to the project root.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_PATH = os.path.join(PROJECT_ROOT, 'banco.db')
+
+# Upper bound for the `limit` parameter of the search endpoint.
+MAX_LIMIT = 50
+
+# Full-text index over the distinct CNAE descriptions of the ID table. BUSCA_CNAE_DOCS holds
+# one row per description and is the external content of the FTS5 table; the triggers on ID
+# keep it in sync, and the triggers on BUSCA_CNAE_DOCS keep the FTS5 index in sync with it.
+# `remove_diacritics 2` makes matching case- and accent-insensitive ("construcao" finds
+# "Construção") and the prefix index makes 2-3 character typeahead queries cheap.
+#
+# Company IDs are matched by prefix on the ID table's own B-tree instead: an FTS5 prefix query
+# over millions of distinct single-token IDs would have to merge every matching term's doclist.
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS BUSCA_CNAE_DOCS (
+        DOCID INTEGER PRIMARY KEY,            -- Chave técnica do documento
+        DS_CNAE TEXT UNIQUE NOT NULL          -- Descrição CNAE
+    );
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS BUSCA_CNAE USING fts5(
+        DS_CNAE,
+        content='BUSCA_CNAE_DOCS',
+        content_rowid='DOCID',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS TG_BUSCA_CNAE_DOCS_INSERT AFTER INSERT ON BUSCA_CNAE_DOCS
+    BEGIN
+        INSERT INTO BUSCA_CNAE (rowid, DS_CNAE) VALUES (NEW.DOCID, NEW.DS_CNAE);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS TG_BUSCA_CNAE_DOCS_DELETE AFTER DELETE ON BUSCA_CNAE_DOCS
+    BEGIN
+        INSERT INTO BUSCA_CNAE (BUSCA_CNAE, rowid, DS_CNAE) VALUES ('delete', OLD.DOCID, OLD.DS_CNAE);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS TG_BUSCA_ID_INSERT AFTER INSERT ON ID
+    WHEN NEW.DS_CNAE IS NOT NULL
+    BEGIN
+        INSERT OR IGNORE INTO BUSCA_CNAE_DOCS (DS_CNAE) VALUES (NEW.DS_CNAE);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS TG_BUSCA_ID_UPDATE AFTER UPDATE OF DS_CNAE ON ID
+    WHEN OLD.DS_CNAE IS NOT NEW.DS_CNAE
+    BEGIN
+        DELETE FROM BUSCA_CNAE_DOCS
+        WHERE DS_CNAE = OLD.DS_CNAE AND NOT EXISTS (SELECT 1 FROM ID WHERE DS_CNAE = OLD.DS_CNAE);
+        INSERT OR IGNORE INTO BUSCA_CNAE_DOCS (DS_CNAE) SELECT NEW.DS_CNAE WHERE NEW.DS_CNAE IS NOT NULL;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS TG_BUSCA_ID_DELETE AFTER DELETE ON ID
+    BEGIN
+        DELETE FROM BUSCA_CNAE_DOCS
+        WHERE DS_CNAE = OLD.DS_CNAE AND NOT EXISTS (SELECT 1 FROM ID WHERE DS_CNAE = OLD.DS_CNAE);
+    END;
+"""
+
+def _init_search_if_needed(conn):
+    """
+    Internal function to create the search index and its triggers if they don't exist,
+    indexing the CNAE descriptions already stored. Also rebuilds them when the triggers on ID
+    are gone (recreating ID drops them) or the index is empty while ID has CNAEs.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT
+            EXISTS (SELECT 1 FROM sqlite_master WHERE type='table' AND name='BUSCA_CNAE'),
+            EXISTS (SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='TG_BUSCA_ID_INSERT')
+    """)
+    complete = all(cur.fetchone())
+    if complete:
+        cur.execute("""
+            SELECT NOT EXISTS (SELECT 1 FROM BUSCA_CNAE_DOCS)
+               AND EXISTS (SELECT 1 FROM ID WHERE DS_CNAE IS NOT NULL)
+        """)
+        complete = not cur.fetchone()[0]
+    if not complete:
+        print("BUSCA_CNAE index not found or incomplete. Building search index...")
+        # A one-time build, even when a request with a time budget triggers it
+        with deadlines.suspended():
+            cur.executescript(SCHEMA)
+            cur.execute("INSERT OR IGNORE INTO BUSCA_CNAE_DOCS (DS_CNAE) SELECT DISTINCT DS_CNAE FROM ID WHERE DS_CNAE IS NOT NULL")
+            conn.commit()
+        print("Search index built successfully.")
+
+def get_db(path=None):
+    conn = sqlite3.connect(path or DB_PATH, factory=metrics.InstrumentedConnection)
+    # Ensure the search index exists before proceeding
+    _init_search_if_needed(conn)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _fts_query(q):
+    """
+    Turns free text into an FTS5 query where every word is a quoted prefix term,
+    e.g. 'comércio var' -> '"comércio"* "var"*' (all words must match).
+    """
+    terms = re.findall(r'\w+', q)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def _search_partial(q, limit, path=None):
+    """Returns the matching CNAEs (with their bm25 rank) and the companies whose ID starts with `q`."""
+    conn = get_db(path)
+    cur = conn.cursor()
+
+    cnaes = []
+    fts_query = _fts_query(q)
+    if fts_query:
+        cur.execute("""
+            SELECT DS_CNAE, rank
+            FROM BUSCA_CNAE
+            WHERE BUSCA_CNAE MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (fts_query, limit))
+        cnaes = [(row['rank'], row['DS_CNAE']) for row in cur.fetchall()]
+
+    # IDs are compared as-is: a range scan over the ID index, stopping after `limit` companies.
+    # The upper bound is the prefix followed by the highest code point.
+    prefix = q.strip()
+    cur.execute("""
+        SELECT DISTINCT ID
+        FROM ID
+        WHERE ID >= ? AND ID < ?
+        ORDER BY ID
+        LIMIT ?
+    """, (prefix, prefix + '\U0010ffff', limit))
+    companies = [row['ID'] for row in cur.fetchall()]
+
+    conn.close()
+    return cnaes, companies
+
+def search(q, limit=10):
+    """
+    Typeahead search over CNAE descriptions (prefix, case- and accent-insensitive, ranked by bm25)
+    and company IDs (prefix). Each result carries the URL of the endpoint that details it.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    if sharding.enabled():
+        partials = sharding.fan_out(lambda path: _search_partial(q, limit, path))
+        # The same CNAE can exist in several shards: keep its best rank
+        best_ranks = {}
+        for rank, cnae in heapq.merge(*(cnaes for cnaes, _ in partials)):
+            best_ranks.setdefault(cnae, rank)
+        cnaes = list(best_ranks)[:limit]
+        companies = list(itertools.islice(heapq.merge(*(companies for _, companies in partials)), limit))
+    else:
+        cnae_matches, companies = _search_partial(q, limit)
+        cnaes = [cnae for _, cnae in cnae_matches]
+
+    return {
+        "cnaes": [
+            {"cnae": cnae, "link": f"/cnae/list?{urlencode({'cnae': cnae})}"}
+            for cnae in cnaes
+        ],
+        "companies": [
+            {"account": company, "link": f"/transactions/overview?{urlencode({'id': company})}"}
+            for company in companies
+        ]
+    }
@@ -0,0 +1,47 @@
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from scripts import deadlines
+
+# Construct an absolute path to the database files.
+# This goes up two directories from `scripts` to the project root.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Number of shards ID, MATURIDADE and TRANSACOES are split across. 0 (default) keeps everything in banco.db.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_DIR = os.getenv("SHARD_DIR", os.path.join(PROJECT_ROOT, 'shards'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def enabled():
+    return SHARD_COUNT > 1
+
+def shard_for(client_id, shard_count=None):
+    """Stable shard number of a client ID (CRC32, so it's the same across processes and restarts)."""
+    return zlib.crc32(str(client_id).encode('utf-8')) % (shard_count or SHARD_COUNT)
+
+def shard_path(shard, shard_dir=None):
+    return os.path.join(shard_dir or SHARD_DIR, f'banco_shard_{shard:03d}.db')
+
+def shard_paths():
+    return [shard_path(shard) for shard in range(SHARD_COUNT)]
+
+def client_db_path(client_id, default):
+    """Database file that owns a client: its shard when sharding is enabled, `default` otherwise."""
+    if enabled():
+        return shard_path(shard_for(client_id))
+    return default
+
+def fan_out(partial):
+    """
+    Runs `partial(path)` on every shard concurrently and returns the results in shard order.
+    sqlite3 releases the GIL while a query runs, so shards are actually scanned in parallel.
+    Each shard query runs under the deadline of the calling request.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SHARD_COUNT, thread_name_prefix='shard')
+    return list(_executor.map(deadlines.bind(partial), shard_paths()))
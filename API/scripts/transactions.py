@@ -1,58 +1,49 @@
 import sqlite3
 import os
 import math
-from datetime import datetime
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from scripts import interning, metrics, partitioning, sharding
+
+# Number of rows pulled from the cursor per chunk when streaming an export.
+EXPORT_BATCH_SIZE = 1000
 
 # Construct an absolute path to the database file.
 # This goes up two directories from `scripts` to the project root.
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DB_PATH = os.path.join(PROJECT_ROOT, 'banco.db')
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+def get_db(id=None):
+    # With sharding enabled, a client's ID rows and all of its transactions live in its own shard
+    path = sharding.client_db_path(id, DB_PATH) if id is not None else DB_PATH
+    conn = sqlite3.connect(path, factory=metrics.InstrumentedConnection)
     conn.row_factory = sqlite3.Row
+    # Translates client IDs to what TRANSACOES stores (integer codes, once the database is interned)
+    conn.clients = interning.for_path(path)
     return conn
 
-def get_transactions_overview(id):
-    """Fetches statistics for a specific client from the database."""
-    conn = get_db()
-    cur = conn.cursor()
-    # Total de clientes que pagaram para o ID consultado
-    cur.execute('SELECT COUNT(DISTINCT ID_PGTO) as total FROM TRANSACOES WHERE ID_RCBE = ?', (id,))
-    total_clientes = cur.fetchone()['total'] or 0
-
-    # Total de transações (pago e recebido)
-    cur.execute('SELECT COUNT(*) as total FROM TRANSACOES WHERE ID_PGTO = ? OR ID_RCBE = ?', (id, id))
-    total_transacoes = cur.fetchone()['total'] or 0
+def _date_bounds(dateFrom=None, dateTo=None):
+    """Turns the inclusive dateFrom/dateTo dates into [start, end) bounds comparable with DT_REFE."""
+    start = dateFrom.strftime('%Y-%m-%d 00:00:00') if dateFrom else None
+    end = (dateTo + timedelta(days=1)).strftime('%Y-%m-%d 00:00:00') if dateTo else None
+    return start, end
 
-    # Saldo das transações (receitas - despesas)
-    query = '''
-        SELECT SUM(CASE WHEN ID_RCBE = ? THEN VL WHEN ID_PGTO = ? THEN -VL ELSE 0 END) as balance
-        FROM TRANSACOES WHERE ID_PGTO = ? OR ID_RCBE = ?
-    '''
-    cur.execute(query, (id, id, id, id))
-    transaction_balance = cur.fetchone()['balance'] or 0
-
-    conn.close()
-    return {
-        'totalClientes': total_clientes, # Clientes que pagaram para o ID
-        'totalTransacoes': total_transacoes, # Transações do ID
-        'transactionBalance': transaction_balance # Saldo do ID
-    }
-
-def get_transactions_list(id, date=None, type=None, inOut=None, customProv=None, page=1):
-    """Fetches a specific account's information and transactions."""
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM ID WHERE ID = ?', (id,))
-    cliente = cur.fetchone()
-    if not cliente:
-        conn.close()
-        return None
+def _source(conn, date=None, dateFrom=None, dateTo=None):
+    """
+    What to read TRANSACOES from: the table itself, or on a partitioned database the union of
+    the partitions that can hold rows for the month and date range filters.
+    """
+    months = [f"{m:02d}" for m in date] if date else None
+    return partitioning.transactions_source(conn, months, *_date_bounds(dateFrom, dateTo))
 
-    # Build dynamic query for transactions
+def _build_filters(clients, id, date=None, type=None, inOut=None, customProv=None, dateFrom=None, dateTo=None):
+    """Builds the WHERE clauses and parameters shared by the transaction list and export."""
     where_clauses = []
     params = []
+    id = clients.encode(id)
 
     # inOut filter
     if inOut == 1: # Income
@@ -72,6 +63,15 @@ def get_transactions_list(id, date=None, type=None, inOut=None, customProv=None,
         # Format each month as a zero-padded string (e.g., 5 -> '05') to match STRFTIME('%m')
         params.extend([f"{m:02d}" for m in date])
 
+    # date range filter (inclusive dates)
+    start, end = _date_bounds(dateFrom, dateTo)
+    if start:
+        where_clauses.append("DT_REFE >= ?")
+        params.append(start)
+    if end:
+        where_clauses.append("DT_REFE < ?")
+        params.append(end)
+
     # type filter (transaction description)
     if type:
         placeholders = ','.join('?' for _ in type)
@@ -80,13 +80,148 @@ def get_transactions_list(id, date=None, type=None, inOut=None, customProv=None,
 
     # customProv filter (customer or provider)
     if customProv:
+        # An unknown counterparty encodes to None, which matches no row
+        customProv = clients.encode(customProv)
         where_clauses.append("(ID_PGTO = ? OR ID_RCBE = ?)")
         params.extend([customProv, customProv])
 
+    return where_clauses, params
+
+def _format_transaction(row, key, clients):
+    """Converts a TRANSACOES row, of the client stored as `key`, into the shape returned to the frontend."""
+    transaction_date = datetime.strptime(row['DT_REFE'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
+
+    if row['ID_PGTO'] == key:
+        in_out_status = "Saída"
+        customer_provider = row['ID_RCBE']
+    else:
+        in_out_status = "Entrada"
+        customer_provider = row['ID_PGTO']
+
+    return {
+        "inOut": in_out_status,
+        "customProv": clients.decode(customer_provider),
+        "date": transaction_date,
+        "type": row['DS_TRAN'],
+        "value": f"R${row['VL']}"
+    }
+
+def get_transactions_overview(id):
+    """Fetches statistics for a specific client from the database."""
+    conn = get_db(id)
+    cur = conn.cursor()
+    source = _source(conn)
+    key = conn.clients.encode(id)
+    # Total de clientes que pagaram para o ID consultado
+    cur.execute(f'SELECT COUNT(DISTINCT ID_PGTO) as total FROM {source} WHERE ID_RCBE = ?', (key,))
+    total_clientes = cur.fetchone()['total'] or 0
+
+    # Total de transações (pago e recebido)
+    cur.execute(f'SELECT COUNT(*) as total FROM {source} WHERE ID_PGTO = ? OR ID_RCBE = ?', (key, key))
+    total_transacoes = cur.fetchone()['total'] or 0
+
+    # Saldo das transações (receitas - despesas)
+    query = f'''
+        SELECT SUM(CASE WHEN ID_RCBE = ? THEN VL WHEN ID_PGTO = ? THEN -VL ELSE 0 END) as balance
+        FROM {source} WHERE ID_PGTO = ? OR ID_RCBE = ?
+    '''
+    cur.execute(query, (key, key, key, key))
+    transaction_balance = cur.fetchone()['balance'] or 0
+
+    conn.close()
+    return {
+        'totalClientes': total_clientes, # Clientes que pagaram para o ID
+        'totalTransacoes': total_transacoes, # Transações do ID
+        'transactionBalance': transaction_balance # Saldo do ID
+    }
+
+def _get_facets(cur, id, date=None, type=None, inOut=None, customProv=None, dateFrom=None, dateTo=None):
+    """
+    Counts the client's transactions per month, type and direction in one grouped pass.
+    Each facet applies every active filter except its own, so its counts show how many
+    rows each option would return. Also returns the total for the full filter set.
+    """
+    # The date range isn't a facet, so it narrows every count (and the partitions read)
+    clients = cur.connection.clients
+    where_clauses, params = _build_filters(clients, id, customProv=customProv, dateFrom=dateFrom, dateTo=dateTo)
+    source = _source(cur.connection, dateFrom=dateFrom, dateTo=dateTo)
+    query = f"""
+        SELECT
+            STRFTIME('%m', DT_REFE) as month_num,
+            DS_TRAN,
+            ID_RCBE = ? as is_in,
+            ID_PGTO = ? as is_out,
+            COUNT(*) as total
+        FROM {source}
+        WHERE {' AND '.join(where_clauses)}
+        GROUP BY month_num, DS_TRAN, is_in, is_out
+    """
+    key = clients.encode(id)
+    cur.execute(query, tuple([key, key] + params))
+    groups = cur.fetchall()
+
+    months = {f"{m:02d}" for m in date} if date else None
+    types = set(type) if type else None
+
+    def matches(group, skip):
+        if skip != 'date' and months is not None and group['month_num'] not in months:
+            return False
+        if skip != 'type' and types is not None and group['DS_TRAN'] not in types:
+            return False
+        if skip != 'inOut' and inOut == 1 and not group['is_in']:
+            return False
+        if skip != 'inOut' and inOut == 2 and not group['is_out']:
+            return False
+        return True
+
+    month_counts, type_counts, in_out_counts = {}, {}, {1: 0, 2: 0}
+    total_items = 0
+    for group in groups:
+        if matches(group, 'date'):
+            month = int(group['month_num'])
+            month_counts[month] = month_counts.get(month, 0) + group['total']
+        if matches(group, 'type'):
+            type_counts[group['DS_TRAN']] = type_counts.get(group['DS_TRAN'], 0) + group['total']
+        if matches(group, 'inOut'):
+            in_out_counts[1] += group['total'] if group['is_in'] else 0
+            in_out_counts[2] += group['total'] if group['is_out'] else 0
+        if matches(group, None):
+            total_items += group['total']
+
+    facets = {
+        "date": [{"value": m, "count": c} for m, c in sorted(month_counts.items())],
+        "type": [{"value": t, "count": c} for t, c in sorted(type_counts.items(), key=lambda x: x[1], reverse=True)],
+        "inOut": [
+            {"value": 1, "label": "Entrada", "count": in_out_counts[1]},
+            {"value": 2, "label": "Saída", "count": in_out_counts[2]}
+        ]
+    }
+    return facets, total_items
+
+def get_transactions_list(id, date=None, type=None, inOut=None, customProv=None, dateFrom=None, dateTo=None, page=1, facets=False):
+    """
+    Fetches a specific account's information and transactions.
+    With `facets=True`, also returns the counts per month, type and direction.
+    """
+    conn = get_db(id)
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM ID WHERE ID = ?', (id,))
+    cliente = cur.fetchone()
+    if not cliente:
+        conn.close()
+        return None
+
+    where_clauses, params = _build_filters(conn.clients, id, date=date, type=type, inOut=inOut, customProv=customProv, dateFrom=dateFrom, dateTo=dateTo)
+    source = _source(conn, date=date, dateFrom=dateFrom, dateTo=dateTo)
+
     # --- Get total count for pagination ---
-    count_query = f"SELECT COUNT(*) as total FROM TRANSACOES WHERE {' AND '.join(where_clauses)}"
-    cur.execute(count_query, tuple(params))
-    total_items = cur.fetchone()['total']
+    if facets:
+        # The grouped pass already yields the total, so the COUNT query is skipped
+        facet_counts, total_items = _get_facets(cur, id, date=date, type=type, inOut=inOut, customProv=customProv, dateFrom=dateFrom, dateTo=dateTo)
+    else:
+        count_query = f"SELECT COUNT(*) as total FROM {source} WHERE {' AND '.join(where_clauses)}"
+        cur.execute(count_query, tuple(params))
+        total_items = cur.fetchone()['total']
 
     # Pagination logic
     items_per_page = 20
@@ -94,41 +229,82 @@ def get_transactions_list(id, date=None, type=None, inOut=None, customProv=None,
     offset = (page - 1) * items_per_page
 
     # --- Get paginated transactions ---
-    select_query = f"SELECT * FROM TRANSACOES WHERE {' AND '.join(where_clauses)} ORDER BY DT_REFE DESC LIMIT ? OFFSET ?"
+    select_query = f"SELECT * FROM {source} WHERE {' AND '.join(where_clauses)} ORDER BY DT_REFE DESC LIMIT ? OFFSET ?"
     
     # Add pagination params to the list for the final query
     paged_params = params + [items_per_page, offset]
 
     cur.execute(select_query, tuple(paged_params))
     
-    processed_transactions = []
-    for row in cur.fetchall():
-        transaction_date = datetime.strptime(row['DT_REFE'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
-
-        if row['ID_PGTO'] == id:
-            in_out_status = "Saída"
-            customer_provider = row['ID_RCBE']
-        else:
-            in_out_status = "Entrada"
-            customer_provider = row['ID_PGTO']
-
-        processed_transactions.append({
-            "inOut": in_out_status,
-            "customProv": customer_provider,
-            "date": transaction_date,
-            "type": row['DS_TRAN'],
-            "value": f"R${row['VL']}"
-        })
+    key = conn.clients.encode(id)
+    processed_transactions = [_format_transaction(row, key, conn.clients) for row in cur.fetchall()]
 
     conn.close()
-    return {
+    data = {
         "totalPages": total_pages,
         "transactions": processed_transactions
     }
+    if facets:
+        data["facets"] = facet_counts
+    return data
+
+def export_transactions(id, date=None, type=None, inOut=None, customProv=None, dateFrom=None, dateTo=None, fmt='csv', compress=False):
+    """
+    Streams every transaction matching the filters as CSV or NDJSON.
+    Returns None if the client doesn't exist, otherwise a generator of encoded chunks.
+    Rows are read from the cursor in batches, so memory stays constant regardless of result size.
+    """
+    conn = get_db(id)
+    cur = conn.cursor()
+    cur.execute('SELECT 1 FROM ID WHERE ID = ?', (id,))
+    if not cur.fetchone():
+        conn.close()
+        return None
+
+    where_clauses, params = _build_filters(conn.clients, id, date=date, type=type, inOut=inOut, customProv=customProv, dateFrom=dateFrom, dateTo=dateTo)
+    source = _source(conn, date=date, dateFrom=dateFrom, dateTo=dateTo)
+    select_query = f"SELECT * FROM {source} WHERE {' AND '.join(where_clauses)} ORDER BY DT_REFE DESC"
+    fields = ["inOut", "customProv", "date", "type", "value"]
+    key, clients = conn.clients.encode(id), conn.clients
+
+    def encode_batch(rows):
+        if fmt == 'ndjson':
+            return ''.join(json.dumps(_format_transaction(row, key, clients), ensure_ascii=False) + '\n' for row in rows)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields)
+        writer.writerows(_format_transaction(row, key, clients) for row in rows)
+        return buffer.getvalue()
+
+    def generate():
+        # wbits=31 produces a gzip container instead of a raw zlib stream
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        try:
+            cur.execute(select_query, tuple(params))
+            chunks = [','.join(fields) + '\r\n'] if fmt == 'csv' else []
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                chunks.append(encode_batch(rows))
+                data = ''.join(chunks).encode('utf-8')
+                chunks = []
+                if compressor:
+                    data = compressor.compress(data)
+                if data:
+                    yield data
+            if chunks:
+                data = ''.join(chunks).encode('utf-8')
+                yield compressor.compress(data) + compressor.flush() if compressor else data
+            elif compressor:
+                yield compressor.flush()
+        finally:
+            conn.close()
+
+    return generate()
 
 def get_transactions_barChart(id):
     """Fetches monthly income and expense data for a bar chart."""
-    conn = get_db()
+    conn = get_db(id)
     cur = conn.cursor()
 
     # A mapping of month numbers to abbreviated Portuguese names.
@@ -137,17 +313,18 @@ def get_transactions_barChart(id):
         '07': 'Jul', '08': 'Ago', '09': 'Set', '10': 'Out', '11': 'Nov', '12': 'Dez'
     }
 
-    query = """
+    query = f"""
         SELECT
             STRFTIME('%m', DT_REFE) as month_num,
             SUM(CASE WHEN ID_RCBE = ? THEN VL ELSE 0 END) as income,
             SUM(CASE WHEN ID_PGTO = ? THEN VL ELSE 0 END) as expense
-        FROM TRANSACOES
+        FROM {_source(conn)}
         WHERE ID_PGTO = ? OR ID_RCBE = ?
         GROUP BY month_num
         ORDER BY month_num;
     """
-    cur.execute(query, (id, id, id, id))
+    key = conn.clients.encode(id)
+    cur.execute(query, (key, key, key, key))
     
     chart_data = []
     for row in cur.fetchall():
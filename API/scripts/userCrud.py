@@ -2,6 +2,7 @@ import sqlite3
 import os
 import re
 from werkzeug.security import generate_password_hash, check_password_hash
+from scripts import metrics
 
 # Construct an absolute path to the database file.
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -29,7 +30,7 @@ def _init_db_if_needed(conn):
 
 def get_db_connection():
     """Establishes and returns a connection with the database."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=metrics.InstrumentedConnection)
     # Ensure the table exists before proceeding
     _init_db_if_needed(conn)
     conn.row_factory = sqlite3.Row
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import threading
+import time
+from scripts import aggregates, chat_history, counterparties, cube, interning, maturity, search, sharding, transactions, userCrud
+
+# Upper bound of database bytes read into the OS page cache at startup, per file.
+PAGE_CACHE_LIMIT_MB = int(os.getenv("WARMUP_PAGE_CACHE_MB", "512"))
+READ_CHUNK_SIZE = 1024 * 1024
+
+_state = {
+    'started': None,
+    'ready': None,
+    'tasks': {}
+}
+_state_lock = threading.Lock()
+
+def _all_database_paths():
+    return sharding.shard_paths() if sharding.enabled() else [transactions.DB_PATH]
+
+def _database_paths():
+    """The data files (main database or shards) that exist: the warm-up never creates one."""
+    return [path for path in _all_database_paths() if os.path.exists(path)]
+
+def _connect(path):
+    # mode=rw fails on a missing file instead of creating it; the schema step may still build tables
+    return sqlite3.connect(f'file:{path}?mode=rw', uri=True)
+
+def warm_schema():
+    """
+    Opens every database once and runs the init-if-needed checks, so no request pays for
+    building a derived table (counts, search index, counterparties, cube) or loading the schema.
+    """
+    for path in _database_paths():
+        conn = _connect(path)
+        counterparties._init_counterparties_if_needed(conn)
+        search._init_search_if_needed(conn)
+        maturity._init_maturity_counts_if_needed(conn)
+        cube._init_cube_if_needed(conn)
+        conn.close()
+
+    # Tables that only live in the main database
+    if os.path.exists(transactions.DB_PATH):
+        conn = _connect(transactions.DB_PATH)
+        userCrud._init_db_if_needed(conn)
+        conn.close()
+
+    # A missing history file is created by the first message instead
+    if os.path.exists(chat_history.DB_PATH):
+        conn = _connect(chat_history.DB_PATH)
+        chat_history._init_history_if_needed(conn)
+        conn.close()
+
+def warm_page_cache():
+    """Reads the database files sequentially, up to PAGE_CACHE_LIMIT_MB each, so first queries hit memory."""
+    limit = PAGE_CACHE_LIMIT_MB * 1024 * 1024
+    for path in _database_paths():
+        with open(path, 'rb', buffering=0) as db_file:
+            read = 0
+            while read < limit:
+                chunk = db_file.read(min(READ_CHUNK_SIZE, limit - read))
+                if not chunk:
+                    break
+                read += len(chunk)
+
+def warm_client_dictionaries():
+    """Loads the client ID dictionary of every interned database, so no request reads CLIENTES."""
+    for path in _database_paths():
+        interning.for_path(path)
+
+def warm_aggregates():
+    """Computes the global aggregates, once every data file exists (their queries would create a missing one)."""
+    if len(_database_paths()) == len(_all_database_paths()):
+        aggregates.refresh_all()
+
+def _run_task(name, task):
+    with _state_lock:
+        _state['tasks'][name] = {'status': 'running'}
+    started = time.perf_counter()
+    try:
+        task()
+        status = {'status': 'done'}
+    except Exception as e:
+        # A failed step doesn't block readiness: requests just do that work themselves
+        status = {'status': 'failed', 'error': str(e)}
+    status['ms'] = round((time.perf_counter() - started) * 1000, 1)
+    with _state_lock:
+        _state['tasks'][name] = status
+
+def _run(tasks, extra_tasks):
+    for name, task in tasks:
+        _run_task(name, task)
+    with _state_lock:
+        _state['ready'] = time.time()
+    for name, task in extra_tasks:
+        _run_task(name, task)
+
+def start(extra_tasks=()):
+    """
+    Runs the warm-up steps on a background thread: the schema checks, the page cache, the client
+    dictionaries and the global aggregates, after which the API reports itself ready. `extra_tasks` (pairs of name
+    and function, e.g. creating the OpenAI client) run afterwards without delaying readiness.
+    """
+    tasks = [
+        ('schema', warm_schema),
+        ('page_cache', warm_page_cache),
+        ('client_dictionaries', warm_client_dictionaries),
+        ('aggregates', warm_aggregates)
+    ]
+    extra_tasks = list(extra_tasks)
+    with _state_lock:
+        if _state['started'] is not None:
+            return
+        _state['started'] = time.time()
+        _state['tasks'] = {name: {'status': 'pending'} for name, _ in tasks + extra_tasks}
+    threading.Thread(target=_run, args=(tasks, extra_tasks), name='warmup', daemon=True).start()
+
+def status():
+    """Readiness: True once the warm-up steps finished (or if the warm-up was never started)."""
+    with _state_lock:
+        return {
+            'ready': _state['started'] is None or _state['ready'] is not None,
+            'warmupSeconds': round(_state['ready'] - _state['started'], 3) if _state['ready'] else None,
+            'tasks': {name: dict(task) for name, task in _state['tasks'].items()}
+        }
@@ -0,0 +1,9 @@
+import os
+import sys
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+# No real model or background warm-up in the tests
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ['WARMUP'] = '0'
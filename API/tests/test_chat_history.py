@@ -0,0 +1,51 @@
+import pytest
+
+from scripts import chat_history
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat_history, 'DB_PATH', str(tmp_path / 'chat_history.db'))
+    # Keep the background writer from flushing behind the test's back
+    monkeypatch.setattr(chat_history, 'FLUSH_INTERVAL', 3600)
+    chat_history.clear()
+    yield chat_history
+    chat_history.clear()
+
+
+def _stored(history):
+    conn = history.get_db()
+    total = conn.execute("SELECT COUNT(*) FROM HISTORICO_CHAT").fetchone()[0]
+    conn.close()
+    return total
+
+
+def test_page_total_matches_count_with_pending_messages(history):
+    for i in range(3):
+        history.append(f"pergunta {i}", f"resposta {i}")
+    history.flush()
+    for i in range(3, 5):
+        history.append(f"pergunta {i}", f"resposta {i}")
+
+    page = history.get_page(limit=3)
+    assert page['total'] == history.count() == 5
+    assert [m['usuario'] for m in page['historico']] == ["pergunta 2", "pergunta 3", "pergunta 4"]
+    # Reading served the pending messages from memory instead of writing them
+    assert _stored(history) == 3
+
+    older = history.get_page(before=page['nextCursor'], limit=3)
+    assert [m['usuario'] for m in older['historico']] == ["pergunta 0", "pergunta 1"]
+    assert older['nextCursor'] is None
+
+
+def test_newest_page_keeps_every_pending_message(history):
+    history.append("pergunta 0", "resposta 0")
+    history.flush()
+    for i in range(1, 4):
+        history.append(f"pergunta {i}", f"resposta {i}")
+
+    page = history.get_page(limit=2)
+    assert [m['usuario'] for m in page['historico']] == ["pergunta 1", "pergunta 2", "pergunta 3"]
+    older = history.get_page(before=page['nextCursor'], limit=2)
+    assert [m['usuario'] for m in older['historico']] == ["pergunta 0"]
+    assert older['nextCursor'] is None
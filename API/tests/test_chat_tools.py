@@ -0,0 +1,150 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from scripts import chat, chat_history, chat_tools, deadlines
+
+
+def _tool_call(name, arguments='{}', call_id='call_1'):
+    return SimpleNamespace(id=call_id, type='function', function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def _response(content=None, tool_calls=None):
+    message = SimpleNamespace(role='assistant', content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class ScriptedModel:
+    """Stand-in for the OpenAI client: answers each completion with the next scripted response."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, **kwargs):
+        self.requests.append(kwargs)
+        return self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    """No database access: fake tools, a fixed data version and an in-memory history."""
+    calls = []
+
+    def fake_overview(args):
+        calls.append(('get_transactions_overview', args))
+        return {"id": args["id"], "saldo": 100}
+
+    def fake_maturity(args):
+        calls.append(('get_maturity_overview', args))
+        return {"Madura": 3}
+
+    monkeypatch.setitem(chat_tools.TOOL_FUNCTIONS, 'get_transactions_overview', fake_overview)
+    monkeypatch.setitem(chat_tools.TOOL_FUNCTIONS, 'get_maturity_overview', fake_maturity)
+    monkeypatch.setattr(chat_tools.aggregates, 'data_version', lambda: ('v1',))
+    monkeypatch.setattr(chat_tools, '_cache', chat_tools.OrderedDict())
+
+    history = []
+    monkeypatch.setattr(chat_history, 'recent', lambda limit: [])
+    monkeypatch.setattr(chat_history, 'append', lambda pergunta, resposta: history.append((pergunta, resposta)))
+    return SimpleNamespace(calls=calls, history=history)
+
+
+def test_tool_call_then_answer(isolated):
+    model = ScriptedModel([
+        _response(tool_calls=[_tool_call('get_transactions_overview', '{"id": "CNPJ1"}')]),
+        _response(content="O saldo do cliente é 100."),
+    ])
+    agent = chat.ChatAgentSimples(client=model)
+
+    assert agent.perguntar_ia("Qual o saldo do CNPJ1?") == "O saldo do cliente é 100."
+    assert isolated.calls == [('get_transactions_overview', {"id": "CNPJ1"})]
+    assert isolated.history == [("Qual o saldo do CNPJ1?", "O saldo do cliente é 100.")]
+
+    # The second completion carries the assistant's tool call and the tool's result
+    assert len(model.requests) == 2
+    messages = model.requests[1]['messages']
+    assert messages[-2]['tool_calls'][0]['function']['name'] == 'get_transactions_overview'
+    assert messages[-1] == {"role": "tool", "tool_call_id": "call_1", "content": json.dumps({"id": "CNPJ1", "saldo": 100})}
+
+
+def test_parallel_tool_calls_keep_their_order(isolated):
+    model = ScriptedModel([
+        _response(tool_calls=[_tool_call('get_maturity_overview', call_id='a'),
+                              _tool_call('get_transactions_overview', '{"id": "CNPJ2"}', call_id='b')]),
+        _response(content="Pronto."),
+    ])
+    chat.ChatAgentSimples(client=model).perguntar_ia("Resumo")
+
+    tool_messages = [m for m in model.requests[1]['messages'] if m.get('role') == 'tool']
+    assert [m['tool_call_id'] for m in tool_messages] == ['a', 'b']
+    assert json.loads(tool_messages[1]['content']) == {"id": "CNPJ2", "saldo": 100}
+
+
+def test_tool_rounds_are_capped(isolated):
+    looping = _response(content="Ainda consultando...", tool_calls=[_tool_call('get_maturity_overview')])
+    model = ScriptedModel([looping])
+    chat.ChatAgentSimples(client=model).perguntar_ia("Maturidade?")
+
+    # MAX_TOOL_ROUNDS rounds with tools, then one without them, which has to be the answer
+    assert len(model.requests) == chat.MAX_TOOL_ROUNDS + 1
+    assert all('tools' in request for request in model.requests[:-1])
+    assert 'tools' not in model.requests[-1]
+    # Identical calls with the same data version are served from the memo
+    assert len(isolated.calls) == 1
+
+
+@pytest.mark.parametrize('name, arguments, error', [
+    ('drop_tables', {}, "Ferramenta desconhecida: drop_tables"),
+    ('get_transactions_overview', {}, "Argumento obrigatório ausente: id"),
+    ('get_transactions_overview', {"id": ""}, "Argumento obrigatório ausente: id"),
+    ('get_transactions_overview', ["CNPJ1"], "Os argumentos devem ser um objeto JSON"),
+])
+def test_bad_tool_calls_return_errors(isolated, name, arguments, error):
+    assert json.loads(chat_tools.run_tool(name, arguments)) == {"error": error}
+    assert isolated.calls == []
+
+
+def test_unparseable_arguments_return_an_error(isolated):
+    [message] = chat_tools.run_tool_calls([_tool_call('get_transactions_overview', '{"id": ')])
+    assert json.loads(message['content']) == {"error": "Argumentos inválidos"}
+    assert isolated.calls == []
+
+
+def test_tool_errors_are_returned_and_not_memoized(isolated, monkeypatch):
+    attempts = []
+
+    def failing(args):
+        attempts.append(args)
+        raise ValueError("banco indisponível")
+
+    monkeypatch.setitem(chat_tools.TOOL_FUNCTIONS, 'get_maturity_overview', failing)
+    for _ in range(2):
+        assert json.loads(chat_tools.run_tool('get_maturity_overview', {})) == {"error": "banco indisponível"}
+    assert len(attempts) == 2
+
+
+def test_memo_hits_per_arguments_and_data_version(isolated):
+    chat_tools.run_tool('get_transactions_overview', {"id": "CNPJ1"})
+    chat_tools.run_tool('get_transactions_overview', {"id": "CNPJ1"})
+    assert len(isolated.calls) == 1
+
+    chat_tools.run_tool('get_transactions_overview', {"id": "CNPJ2"})
+    assert len(isolated.calls) == 2
+
+    # A new data version invalidates the memoized result
+    chat_tools.run_tool('get_transactions_overview', {"id": "CNPJ1"}, version=('v2',))
+    assert len(isolated.calls) == 3
+
+
+def test_tool_calls_run_under_the_request_deadline(isolated, monkeypatch):
+    seen = []
+    monkeypatch.setitem(chat_tools.TOOL_FUNCTIONS, 'get_maturity_overview', lambda args: seen.append(deadlines.current()))
+    deadlines.start(5)
+    try:
+        chat_tools.run_tool_calls([_tool_call('get_maturity_overview')])
+        assert seen == [deadlines.current()]
+    finally:
+        deadlines.clear()
@@ -0,0 +1,42 @@
+import pytest
+
+from scripts import delta
+
+
+@pytest.mark.parametrize('document, patch, expected', [
+    # RFC 6902, appendix A.6: moving a value
+    ({"foo": {"bar": "baz", "waldo": "fred"}, "qux": {"corge": "grault"}},
+     [{"op": "move", "from": "/foo/waldo", "path": "/qux/thud"}],
+     {"foo": {"bar": "baz"}, "qux": {"corge": "grault", "thud": "fred"}}),
+    # A.7: moving an array element
+    ({"foo": ["all", "grass", "cows", "eat"]},
+     [{"op": "move", "from": "/foo/1", "path": "/foo/3"}],
+     {"foo": ["all", "cows", "eat", "grass"]}),
+    ({"filtros": {"regiao": "Sul"}, "lista": [1, 2]},
+     [{"op": "copy", "from": "/filtros", "path": "/anterior"}, {"op": "copy", "from": "/lista/0", "path": "/lista/-"}],
+     {"filtros": {"regiao": "Sul"}, "lista": [1, 2, 1], "anterior": {"regiao": "Sul"}}),
+    ({"a": 1}, [{"op": "move", "from": "/a", "path": "/a"}], {"a": 1}),
+])
+def test_move_and_copy(document, patch, expected):
+    assert delta.apply_patch(document, patch) == expected
+
+
+def test_copy_is_independent_of_its_source():
+    result = delta.apply_patch({"filtros": {"regiao": "Sul"}}, [
+        {"op": "copy", "from": "/filtros", "path": "/anterior"},
+        {"op": "replace", "path": "/filtros/regiao", "value": "Norte"},
+    ])
+    assert result == {"filtros": {"regiao": "Norte"}, "anterior": {"regiao": "Sul"}}
+
+
+@pytest.mark.parametrize('patch, error', [
+    ([{"op": "move", "path": "/b"}], "Operação move sem 'from' em /b"),
+    ([{"op": "copy", "from": "/ausente", "path": "/b"}], "Caminho não encontrado: /ausente"),
+    ([{"op": "move", "from": "/a", "path": "/a/filho"}], "Não é possível mover /a para dentro de si mesmo"),
+    ([{"op": "mover", "path": "/a"}], "Operação não suportada: 'mover'"),
+])
+def test_invalid_operations_leave_the_document_untouched(patch, error):
+    document = {"a": {"x": 1}}
+    with pytest.raises(delta.PatchError, match=error):
+        delta.apply_patch(document, [{"op": "add", "path": "/c", "value": 3}] + patch)
+    assert document == {"a": {"x": 1}}
@@ -0,0 +1,12 @@
+import main
+from scripts import transactions
+
+
+def test_export_filename_is_sanitized(monkeypatch):
+    monkeypatch.setattr(transactions, 'export_transactions', lambda id, **kwargs: iter(['ID_PGTO\n']))
+    client = main.app.test_client()
+
+    response = client.get('/transactions/export', query_string={'id': 'x"; filename=../../a\r\nSet-Cookie: b'})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == 'ID_PGTO\n'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="transacoes_x_filename.._.._a_Set-Cookie_b.csv"'
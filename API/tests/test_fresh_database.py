@@ -0,0 +1,63 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'benchmarks')
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import generate_data  # noqa: E402
+import run_benchmarks  # noqa: E402
+import main  # noqa: E402
+from scripts import intern  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def generated(tmp_path_factory):
+    """A small database built from definition.sql, the way a new deployment starts."""
+    db_path = str(tmp_path_factory.mktemp('fresh') / 'banco.db')
+    generate_data.generate(db_path, transactions=3000, clients=40)
+    return db_path
+
+
+@pytest.fixture(params=['text', 'interned'])
+def api(request, generated, tmp_path):
+    db_path = str(tmp_path / 'banco.db')
+    shutil.copy(generated, db_path)
+    if request.param == 'interned':
+        intern.intern_clients(db_path)
+
+    previous = {name: module.DB_PATH for name, module in sys.modules.items()
+                if name.startswith('scripts.') and hasattr(module, 'DB_PATH')}
+    run_benchmarks.point_api_at(db_path)
+    yield main.app.test_client(), run_benchmarks.pick_parameters(db_path)
+    for name, path in previous.items():
+        sys.modules[name].DB_PATH = path
+
+
+def test_cube_is_not_empty(api):
+    client, _ = api
+    data = client.get('/analytics/cube?dimensions=stage').get_json()
+    assert data['totalRows'] > 0
+    assert sum(row['companies'] for row in data['rows']) > 0
+
+
+def test_transaction_routes_are_not_empty(api):
+    client, params = api
+    assert isinstance(params['heavy'], str) and isinstance(params['counterparty'], str)
+    id = params['heavy']
+
+    listing = client.get(f'/transactions/list?id={id}')
+    assert listing.status_code == 200
+    assert listing.get_json()['transactions']
+
+    assert client.get(f'/transactions/overview?id={id}').get_json()
+    assert client.get(f'/transactions/graphs/barChart?id={id}').get_json()
+
+    counterparties = client.get(f'/transactions/counterparties?id={id}').get_json()
+    assert params['counterparty'] in [c['counterparty'] for c in counterparties]
+
+    export = client.get(f'/transactions/export?id={id}')
+    assert export.status_code == 200
+    assert len(export.get_data(as_text=True).splitlines()) > 1
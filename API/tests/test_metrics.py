@@ -0,0 +1,7 @@
+from scripts import metrics
+
+
+def test_label_values_are_escaped():
+    labels = metrics._format_labels(('route', 'error'), ('/search', 'linha 1\nlinha "2" em C:\\dados'))
+    assert labels == '{route="/search",error="linha 1\\nlinha \\"2\\" em C:\\\\dados"}'
+    assert '\n' not in labels
@@ -0,0 +1,52 @@
+import os
+import sqlite3
+
+import pytest
+
+from scripts import partition, partitioning, transactions
+
+DEFINITION_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'definition.sql')
+YEARS = range(2008, 2026)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A database with one transaction per month from 2008 to 2025 between two clients."""
+    path = str(tmp_path / 'banco.db')
+    conn = sqlite3.connect(path)
+    with open(DEFINITION_SQL, encoding='utf-8') as f:
+        conn.executescript(f.read())
+    conn.executemany("INSERT INTO ID (ID, DS_CNAE, DT_REFE) VALUES (?, 'Comércio', '2025-12-01')", [('CNPJA',), ('CNPJB',)])
+    conn.executemany(
+        "INSERT INTO TRANSACOES (ID_PGTO, ID_RCBE, VL, DS_TRAN, DT_REFE) VALUES ('CNPJB', 'CNPJA', 10, 'PIX', ?)",
+        [(f"{year}-{month:02d}-15 12:00:00",) for year in YEARS for month in range(1, 13)])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(transactions, 'DB_PATH', path)
+    return path
+
+
+def test_more_than_ten_archived_years_stay_readable(db_path):
+    partition.partition(db_path, by='year', hot_months=12, archive_months=24)
+
+    conn = sqlite3.connect(db_path)
+    archived = conn.execute("SELECT COUNT(*), COUNT(DISTINCT NM_ARQV) FROM PARTICOES_TRANSACOES WHERE NM_ARQV IS NOT NULL").fetchone()
+    assert archived[0] > 10
+    # Every archived year shares one file, so reading them all takes a single ATTACH
+    assert archived[1] == 1
+    source = partitioning.transactions_source(conn)
+    assert conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0] == 12 * len(YEARS)
+    conn.close()
+
+    overview = transactions.get_transactions_overview('CNPJA')
+    assert overview['totalTransacoes'] == 12 * len(YEARS)
+
+
+def test_later_runs_archive_into_the_same_file(db_path, tmp_path):
+    partition.partition(db_path, by='year', hot_months=12, archive_months=120)
+    partition.partition(db_path, by='year', hot_months=12, archive_months=24, archive_dir=str(tmp_path / 'outro'))
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(DISTINCT NM_ARQV) FROM PARTICOES_TRANSACOES WHERE NM_ARQV IS NOT NULL").fetchone()[0] == 1
+    conn.close()
+    assert not os.path.exists(tmp_path / 'outro')
@@ -0,0 +1,13 @@
+import logging
+
+from scripts import profiling
+
+
+def test_slow_queries_are_logged_and_kept(caplog):
+    with caplog.at_level(logging.WARNING, logger='scripts.profiling'):
+        profiling.record_slow_query('transactions.get_transactions_list', "SELECT *\n  FROM TRANSACOES WHERE ID_PGTO = ?",
+                                    ('CNPJ1',), 250.0, ['SCAN TRANSACOES'])
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "Slow query (250.0 ms) in transactions.get_transactions_list: SELECT * FROM TRANSACOES WHERE ID_PGTO = ?"]
+    assert profiling.get_slow_queries(1)[0]['parameters'] == ['CNPJ1']
@@ -0,0 +1,145 @@
+# fake_llm.py
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Tools the stub asks for when it decides to make a tool call. They take no arguments,
+# so the call is valid whatever the screen data is.
+TOOL_CALLS = ['get_maturity_overview', 'get_cnae_pieChart']
+
+class FakeModel:
+    """
+    Behaviour of the stub: each completion takes `latency_ms` ± `jitter_ms` (uniform), a share
+    of them answers 429 after that time, and a share of the requests that offer tools gets a
+    tool call instead of an answer (the follow-up request, with the tool result, gets the answer).
+    """
+
+    def __init__(self, latency_ms=800, jitter_ms=200, tool_call_rate=0.0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tool_call_rate = tool_call_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            latency = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            return latency, self._random.random(), self._random.random()
+
+    def complete(self, body):
+        """Returns (status, payload) for a chat completion request."""
+        latency, error_draw, tool_draw = self._draw()
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        if error_draw < self.error_rate:
+            return 429, {'error': {'message': 'Rate limit reached (fake)', 'type': 'rate_limit_error'}}
+
+        messages = body.get('messages', [])
+        answered_tool = any(message.get('role') == 'tool' for message in messages)
+        if body.get('tools') and not answered_tool and tool_draw < self.tool_call_rate:
+            name = TOOL_CALLS[int(tool_draw * 1000) % len(TOOL_CALLS)]
+            message = {
+                'role': 'assistant',
+                'content': None,
+                'tool_calls': [{'id': f'call_{uuid.uuid4().hex[:12]}', 'type': 'function',
+                                'function': {'name': name, 'arguments': '{}'}}]
+            }
+            finish_reason = 'tool_calls'
+        else:
+            message = {'role': 'assistant', 'content': 'Resposta simulada pelo modelo de teste.'}
+            finish_reason = 'stop'
+
+        prompt_tokens = sum(len(str(m.get('content') or '')) for m in messages) // 4
+        return 200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': 8, 'total_tokens': prompt_tokens + 8}
+        }
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'in_flight': self.in_flight, 'max_in_flight': self.max_in_flight}
+
+def make_handler(model):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status, payload, headers=()):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path.rstrip('/').endswith('/chat/completions'):
+                status, payload = model.complete(body)
+                self._send(status, payload, [('Retry-After', '1')] if status == 429 else ())
+            else:
+                self._send(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/stats'):
+                self._send(200, model.stats())
+            else:
+                self._send(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def serve(port=0, host='127.0.0.1', **model_options):
+    """Starts the stub in a background thread. Returns (server, model); the base URL is http://host:port/v1."""
+    model = FakeModel(**model_options)
+    server = ThreadingHTTPServer((host, port), make_handler(model))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, model
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible chat completions stub with tunable latency.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=float, default=800, help="Mean time per completion.")
+    parser.add_argument('--jitter-ms', type=float, default=200, help="Uniform spread around the mean.")
+    parser.add_argument('--tool-call-rate', type=float, default=0.0, help="Share of requests offering tools that get a tool call.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of completions answered with 429.")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server, _ = serve(args.port, args.host, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                      tool_call_rate=args.tool_call_rate, error_rate=args.error_rate, seed=args.seed)
+    print(f"Fake LLM on http://{args.host}:{server.server_address[1]}/v1 "
+          f"(set OPENAI_BASE_URL to it), {args.latency_ms:g} ± {args.jitter_ms:g} ms per completion", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+# generate_data.py
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SQL_FILE_PATH = os.path.join(PROJECT_ROOT, 'definition.sql')
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'API'))
+
+from scripts import counterparties, cube, maturity, search  # noqa: E402
+
+# Preset sizes for --scale, in number of transactions.
+SCALES = {
+    '1M': 1_000_000,
+    '10M': 10_000_000,
+    '100M': 100_000_000
+}
+
+# Rows generated and inserted per batch. Keeps memory flat even at 100M transactions.
+BATCH_SIZE = 500_000
+# Clients per batch; each one expands into one ID row per snapshot.
+CLIENT_BATCH_SIZE = 50_000
+
+CNAES = [
+    'Comércio varejista de mercadorias em geral',
+    'Atividades de consultoria em gestão empresarial',
+    'Cultivo de soja',
+    'Construção de edifícios',
+    'Restaurantes e similares',
+    'Transporte rodoviário de carga',
+    'Desenvolvimento de programas de computador sob encomenda',
+    'Comércio atacadista de produtos alimentícios',
+    'Atividades de atendimento hospitalar',
+    'Fabricação de móveis',
+    'Serviços de engenharia',
+    'Educação superior',
+]
+# CNAE popularity also follows a long tail: a few sectors concentrate most companies.
+CNAE_WEIGHTS = 1.0 / np.arange(1, len(CNAES) + 1)
+
+TRANSACTION_TYPES = ['PIX', 'TED', 'BOLETO', 'SISTEMICO', 'CARTAO', 'DOC']
+TRANSACTION_TYPE_WEIGHTS = [0.45, 0.2, 0.2, 0.08, 0.05, 0.02]
+
+MATURITY_STAGES = ['Iniciante', 'Expansão', 'Madura', 'Declínio']
+MATURITY_WEIGHTS = [0.3, 0.25, 0.35, 0.1]
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# definition.sql keys ID by ID: one row per client, as in production. With --snapshots N > 1 the
+# generator writes a history of monthly snapshots per client instead, which needs the table keyed
+# by (ID, DT_REFE); the API copes with both (it looks up MAX(DT_REFE) per ID), but the numbers of
+# such a database come from a bigger ID table than production's.
+ID_SNAPSHOT_SCHEMA = """
+    DROP TABLE IF EXISTS ID;
+    CREATE TABLE ID (
+        ID TEXT NOT NULL,
+        VL_FATU INTEGER,
+        VL_SLDO INTEGER,
+        DT_ABRT DATE,
+        DS_CNAE TEXT,
+        DT_REFE DATE,
+        PRIMARY KEY (ID, DT_REFE)
+    );
+"""
+
+# Written by the maturity classification in production; definition.sql doesn't declare it.
+MATURIDADE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS MATURIDADE (
+        ID TEXT PRIMARY KEY,
+        MATU TEXT
+    );
+"""
+
+# Indexes the API queries rely on. Skip with --no-indexes to benchmark a bare schema.
+INDEXES = """
+    CREATE INDEX IF NOT EXISTS IX_TRANSACOES_PGTO ON TRANSACOES (ID_PGTO, DT_REFE);
+    CREATE INDEX IF NOT EXISTS IX_TRANSACOES_RCBE ON TRANSACOES (ID_RCBE, DT_REFE);
+    CREATE INDEX IF NOT EXISTS IX_ID_CNAE ON ID (DS_CNAE, ID);
+    CREATE INDEX IF NOT EXISTS IX_MATURIDADE_MATU ON MATURIDADE (MATU, ID);
+"""
+
+def _format_dates(base, offsets_seconds):
+    """Formats an array of second offsets from `base` the way the API expects dates."""
+    return [(base + timedelta(seconds=int(s))).strftime(DATE_FORMAT) for s in offsets_seconds]
+
+def create_schema(conn, snapshots=1):
+    """Creates the tables from definition.sql, with ID replaced by the snapshot layout if `snapshots` > 1."""
+    with open(SQL_FILE_PATH, 'r', encoding='utf-8') as sql_file:
+        conn.executescript(sql_file.read())
+    if snapshots > 1:
+        conn.executescript(ID_SNAPSHOT_SCHEMA)
+    conn.executescript(MATURIDADE_SCHEMA)
+    # The counterparty and search triggers would slow the bulk load down; the aggregate table
+    # and the search index are rebuilt in one pass at the end instead.
+    conn.executescript("""
+        DROP TRIGGER IF EXISTS TG_CONTRAPARTES_INSERT;
+        DROP TRIGGER IF EXISTS TG_CONTRAPARTES_DELETE;
+        DROP TRIGGER IF EXISTS TG_BUSCA_ID_INSERT;
+        DROP TRIGGER IF EXISTS TG_BUSCA_ID_UPDATE;
+        DROP TRIGGER IF EXISTS TG_BUSCA_ID_DELETE;
+    """)
+
+def client_weights(rng, num_clients, alpha):
+    """
+    Draws a power-law activity weight per client: a few clients concentrate most of
+    the transactions, like the large accounts in production.
+    """
+    weights = rng.pareto(alpha, num_clients) + 1
+    return weights / weights.sum()
+
+def generate_clients(conn, rng, client_ids, snapshots, end_date):
+    """Inserts `snapshots` monthly ID rows per client (one by default) plus one MATURIDADE label."""
+    print(f"Generating {len(client_ids)} clients with {snapshots} monthly snapshots each...")
+    cur = conn.cursor()
+    for start in range(0, len(client_ids), CLIENT_BATCH_SIZE):
+        batch = client_ids[start:start + CLIENT_BATCH_SIZE]
+        n = len(batch)
+
+        # Opening dates spread over the last 30 years
+        opening_offsets = rng.integers(30, 365 * 30, n)
+        opening_dates = [(end_date - timedelta(days=int(d))).strftime(DATE_FORMAT) for d in opening_offsets]
+        cnaes = rng.choice(len(CNAES), n, p=CNAE_WEIGHTS / CNAE_WEIGHTS.sum())
+        base_revenue = rng.lognormal(12, 1.5, n)
+
+        rows = []
+        for month in range(snapshots):
+            ref_date = (end_date - timedelta(days=30 * month)).strftime(DATE_FORMAT)
+            # Revenue drifts from one snapshot to the next
+            revenue = (base_revenue * rng.normal(1, 0.05, n)).astype(np.int64)
+            balance = (revenue * rng.normal(0.15, 0.2, n)).astype(np.int64)
+            rows.extend(
+                (batch[i], int(revenue[i]), int(balance[i]), opening_dates[i], CNAES[cnaes[i]], ref_date)
+                for i in range(n)
+            )
+        cur.executemany("INSERT INTO ID VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        stages = rng.choice(len(MATURITY_STAGES), n, p=MATURITY_WEIGHTS)
+        cur.executemany(
+            "INSERT INTO MATURIDADE (ID, MATU) VALUES (?, ?)",
+            ((batch[i], MATURITY_STAGES[stages[i]]) for i in range(n))
+        )
+        conn.commit()
+
+def generate_transactions(conn, rng, client_ids, weights, total, end_date, days):
+    """Inserts `total` transactions whose payer and receiver follow the power-law weights."""
+    print(f"Generating {total} transactions...")
+    cur = conn.cursor()
+    cumulative = np.cumsum(weights)
+    start_date = end_date - timedelta(days=days)
+    ids = np.array(client_ids)
+    generated = 0
+    started = time.perf_counter()
+
+    while generated < total:
+        n = min(BATCH_SIZE, total - generated)
+        payers = np.searchsorted(cumulative, rng.random(n))
+        receivers = np.searchsorted(cumulative, rng.random(n))
+        # Avoid self-transfers by shifting the receiver to the next client
+        same = payers == receivers
+        receivers[same] = (receivers[same] + 1) % len(client_ids)
+        payers = np.minimum(payers, len(client_ids) - 1)
+        receivers = np.minimum(receivers, len(client_ids) - 1)
+
+        values = np.maximum(rng.lognormal(6.5, 1.6, n), 1).astype(np.int64)
+        types = rng.choice(len(TRANSACTION_TYPES), n, p=TRANSACTION_TYPE_WEIGHTS)
+        dates = _format_dates(start_date, rng.integers(0, days * 86400, n))
+
+        cur.executemany(
+            "INSERT INTO TRANSACOES (ID_PGTO, ID_RCBE, VL, DS_TRAN, DT_REFE) VALUES (?, ?, ?, ?, ?)",
+            zip(ids[payers].tolist(), ids[receivers].tolist(), values.tolist(),
+                (TRANSACTION_TYPES[t] for t in types), dates)
+        )
+        conn.commit()
+        generated += n
+        elapsed = time.perf_counter() - started
+        print(f"  {generated}/{total} transactions ({generated / elapsed:,.0f} rows/s)")
+
+def generate(db_path, transactions, clients=None, snapshots=1, alpha=1.2, days=365, seed=42, indexes=True):
+    """Creates a fresh synthetic database at `db_path`."""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    clients = clients or max(transactions // 100, 10)
+    rng = np.random.default_rng(seed)
+    end_date = datetime(2025, 12, 31)
+    client_ids = [f"CNPJ{i:010d}" for i in range(clients)]
+
+    conn = sqlite3.connect(db_path)
+    # Durability is irrelevant for a throwaway benchmark database
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    create_schema(conn, snapshots)
+
+    started = time.perf_counter()
+    generate_clients(conn, rng, client_ids, snapshots, end_date)
+    generate_transactions(conn, rng, client_ids, client_weights(rng, clients, alpha), transactions, end_date, days)
+
+    if indexes:
+        print("Creating indexes...")
+        conn.executescript(INDEXES)
+    print("Building maturity counts...")
+    maturity.refresh_maturity_counts(conn)
+    conn.commit()
+    # The search triggers were dropped for the load; the index is built once ID is loaded
+    print("Building the search index...")
+    search._init_search_if_needed(conn)
+    conn.execute("ANALYZE")
+    conn.close()
+
+    print("Building counterparty aggregates...")
+    counterparties.rebuild_counterparties(db_path)
+    print("Building the analytics cube...")
+    cube.rebuild_cube(db_path)
+    print(f"Done in {time.perf_counter() - started:.1f}s: {db_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic banco.db for benchmarks.")
+    parser.add_argument('--db', default=os.path.join(PROJECT_ROOT, 'bench.db'), help="Output database path.")
+    parser.add_argument('--scale', choices=SCALES.keys(), default='1M', help="Preset number of transactions.")
+    parser.add_argument('--transactions', type=int, help="Exact number of transactions (overrides --scale).")
+    parser.add_argument('--clients', type=int, help="Number of clients (defaults to transactions / 100).")
+    parser.add_argument('--snapshots', type=int, default=1, help="Monthly ID snapshots per client. Above 1, ID is keyed by (ID, DT_REFE), unlike definition.sql.")
+    parser.add_argument('--alpha', type=float, default=1.2, help="Pareto shape of client activity (lower = more skewed).")
+    parser.add_argument('--days', type=int, default=365, help="Time span of the transactions, in days.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-indexes', action='store_true', help="Don't create the indexes used by the API.")
+    args = parser.parse_args()
+
+    generate(
+        args.db,
+        transactions=args.transactions or SCALES[args.scale],
+        clients=args.clients,
+        snapshots=args.snapshots,
+        alpha=args.alpha,
+        days=args.days,
+        seed=args.seed,
+        indexes=not args.no_indexes
+    )
+
+if __name__ == '__main__':
+    main()
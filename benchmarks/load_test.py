@@ -0,0 +1,350 @@
+# load_test.py
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'API'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmarks import BENCH_LOGIN, BENCH_PASSWORD, percentile, pick_parameters  # noqa: E402
+
+# Routes the scenarios are made of. `{client}` is a client drawn per session from a sample of
+# the database, `{heavy}` / `{cnae}` as in run_benchmarks.py and `{question}` a chat question.
+ROUTES = {
+    'cnae_pie_chart': ('GET', '/cnae/graphs/pieChart', None),
+    'maturity_overview': ('GET', '/maturity/overview', None),
+    'maturity_crosstab': ('GET', '/maturity/crosstab', None),
+    'overview': ('GET', '/transactions/overview?id={client}', None),
+    'overview_heavy': ('GET', '/transactions/overview?id={heavy}', None),
+    'list': ('GET', '/transactions/list?id={client}', None),
+    'list_filtered': ('GET', '/transactions/list?id={client}&inOut=1&type=PIX,TED&facets=1', None),
+    'bar_chart': ('GET', '/transactions/graphs/barChart?id={client}', None),
+    'counterparties': ('GET', '/transactions/counterparties?id={client}&top=10', None),
+    'cnae_list': ('GET', '/cnae/list?cnae={cnae}', None),
+    'cube_stage_month': ('GET', '/analytics/cube?dimensions=stage,month', None),
+    'cube_cnae_cohort': ('GET', '/analytics/cube?dimensions=cnae,cohort', None),
+    'search': ('GET', '/search?q={search}', None),
+    'auth_login': ('POST', '/auth/login', {'login': BENCH_LOGIN, 'password': BENCH_PASSWORD}),
+    'chat_status': ('GET', '/api/status', None),
+    'chat': ('POST', '/api/chat', {'pergunta': '{question}'}),
+}
+
+# A session runs the steps of one scenario in order; scenarios are drawn by weight. Load your
+# own with --scenarios (a JSON file with the same structure).
+SCENARIOS = {
+    'dashboard': {'weight': 8, 'steps': ['cnae_pie_chart', 'maturity_overview', 'overview', 'bar_chart',
+                                         'list', 'counterparties']},
+    'analyst': {'weight': 2, 'steps': ['maturity_crosstab', 'cube_stage_month', 'cube_cnae_cohort',
+                                       'cnae_list', 'search', 'list_filtered']},
+    'login': {'weight': 1, 'steps': ['auth_login']},
+    'chat': {'weight': 1, 'steps': ['chat_status', 'chat']},
+}
+
+QUESTIONS = [
+    "Qual o estágio de maturidade mais comum?",
+    "Como está a distribuição por setor?",
+    "Resuma a visão geral do cliente.",
+    "Quais setores concentram mais empresas?",
+    "O que significa o estágio Declínio?",
+]
+
+# Clients drawn from for {client}: a sample, so sessions spread over many clients like real users.
+CLIENT_SAMPLE = 500
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def serve(db_path, port):
+    """Child process: the API on a threaded WSGI server, pointed at the benchmark database."""
+    os.environ['WARMUP'] = '0'
+    import main as api
+    from run_benchmarks import point_api_at
+    from werkzeug.serving import make_server
+    point_api_at(db_path)
+    # One log line per request would cost the server more than some of the routes
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # The warm-up is started by hand, once the API points at the benchmark database
+    api.warmup.start([('openai_client', lambda: api.chat_agent.client)])
+    # Make sure the login scenario exercises a real password check
+    api.app.test_client().post('/auth/signUp', json={'login': BENCH_LOGIN, 'password': BENCH_PASSWORD})
+    make_server('127.0.0.1', port, api.app, threaded=True).serve_forever()
+
+def start_api(db_path, llm_url):
+    port = _free_port()
+    env = dict(os.environ, OPENAI_BASE_URL=llm_url, OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY', 'benchmark'))
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', '--db', db_path, '--port', str(port)],
+                               env=env, stdout=subprocess.DEVNULL)
+    return process, f'http://127.0.0.1:{port}'
+
+def wait_ready(base_url, timeout=300):
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            status, _ = request(base_url, 'GET', '/ready', None, timeout=5)
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{base_url} wasn't ready after {timeout}s")
+
+def request(base_url, method, path, body, timeout=60):
+    """One HTTP request on a new connection. Returns (status, latency in ms) with the body fully read."""
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    headers = {'Content-Type': 'application/json'} if data is not None else {}
+    started = time.perf_counter()
+    try:
+        conn.request(method, path, body=data, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, (time.perf_counter() - started) * 1000
+    finally:
+        conn.close()
+
+def sample_parameters(db_path, rng):
+    """Parameters fixed for the run plus the pool {client} is drawn from."""
+    parameters = pick_parameters(db_path)
+    conn = sqlite3.connect(db_path)
+    clients = [row[0] for row in conn.execute("SELECT DISTINCT ID FROM ID")]
+    conn.close()
+    parameters['clients'] = rng.sample(clients, min(CLIENT_SAMPLE, len(clients)))
+    parameters['search'] = parameters['cnae'].split()[0][:4]
+    return parameters
+
+def _format_body(body, values):
+    if body is None:
+        return None
+    return {key: value.format(**values) if isinstance(value, str) else value for key, value in body.items()}
+
+class VirtualUser(threading.Thread):
+    """
+    A closed-loop user: runs one session after another, each request waiting for the previous
+    response (plus the think time), until `stop` is set. Samples are (route, status, latency ms, end).
+    """
+
+    def __init__(self, index, base_url, scenarios, parameters, think_ms, stop, seed, timeout):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.scenarios = scenarios
+        self.parameters = parameters
+        self.think_ms = think_ms
+        self.stop = stop
+        self.rng = random.Random(seed * 1000 + index)
+        self.timeout = timeout
+        self.samples = []
+
+    def run(self):
+        names = list(self.scenarios)
+        weights = [self.scenarios[name]['weight'] for name in names]
+        while not self.stop.is_set():
+            scenario = self.scenarios[self.rng.choices(names, weights)[0]]
+            values = dict(self.parameters, client=self.rng.choice(self.parameters['clients']),
+                          question=self.rng.choice(QUESTIONS))
+            query_values = {key: quote(str(value), safe='') for key, value in values.items()}
+            for route in scenario['steps']:
+                if self.stop.is_set():
+                    return
+                method, path, body = ROUTES[route]
+                try:
+                    status, latency = request(self.base_url, method, path.format(**query_values),
+                                              _format_body(body, values), self.timeout)
+                except OSError:
+                    status, latency = 0, None
+                self.samples.append((route, status, latency, time.perf_counter()))
+                if self.think_ms:
+                    self.stop.wait(self.rng.expovariate(1000 / self.think_ms))
+
+def _latency_stats(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2)
+    }
+
+def run_level(base_url, concurrency, scenarios, parameters, duration, warmup, think_ms, seed, timeout):
+    """Runs `concurrency` users for `warmup + duration` seconds; only the last `duration` is measured."""
+    stop = threading.Event()
+    users = [VirtualUser(i, base_url, scenarios, parameters, think_ms, stop, seed, timeout) for i in range(concurrency)]
+    started = time.perf_counter()
+    for user in users:
+        user.start()
+    window_start = started + warmup
+    time.sleep(warmup + duration)
+    window_end = time.perf_counter()
+    stop.set()
+    for user in users:
+        user.join()
+
+    samples = [s for user in users for s in user.samples if window_start <= s[3] <= window_end]
+    ok = [s for s in samples if 200 <= s[1] < 400]
+    errors = {}
+    for _, status, _, _ in samples:
+        if not 200 <= status < 400:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    routes = {}
+    for route in sorted({s[0] for s in samples}):
+        route_samples = [s for s in samples if s[0] == route]
+        stats = _latency_stats([s[2] for s in route_samples if 200 <= s[1] < 400])
+        stats['errors'] = sum(1 for s in route_samples if not 200 <= s[1] < 400)
+        routes[route] = stats
+
+    return {
+        'concurrency': concurrency,
+        'seconds': round(window_end - window_start, 2),
+        'throughput_rps': round(len(ok) / (window_end - window_start), 2),
+        'error_rate': round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        'errors': errors,
+        'latency': _latency_stats([s[2] for s in ok]),
+        'routes': routes
+    }
+
+def saturation(levels, ratio):
+    """
+    The saturation point: the lowest concurrency whose throughput reaches `ratio` of the peak.
+    Past it, more users mostly add queueing (latency grows with users while throughput stays flat).
+    Also the Little's-law knee, peak throughput x the response time of one user alone.
+    """
+    peak = max(levels, key=lambda level: level['throughput_rps'])
+    reached = next(level for level in levels if level['throughput_rps'] >= ratio * peak['throughput_rps'])
+    single = next((level for level in levels if level['concurrency'] == 1), None)
+    knee = None
+    if single and single['latency'].get('mean_ms'):
+        knee = round(peak['throughput_rps'] * single['latency']['mean_ms'] / 1000, 1)
+    return {
+        'peak_throughput_rps': peak['throughput_rps'],
+        'peak_concurrency': peak['concurrency'],
+        'saturation_concurrency': reached['concurrency'],
+        'littles_law_knee': knee
+    }
+
+def print_report(levels, summary):
+    print(f"\n{'users':>6}{'req/s':>9}{'mean ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for level in levels:
+        latency = level['latency']
+        print(f"{level['concurrency']:>6}{level['throughput_rps']:>9.1f}{latency.get('mean_ms', 0):>10.1f}"
+              f"{latency.get('p50_ms', 0):>9.1f}{latency.get('p95_ms', 0):>9.1f}{latency.get('p99_ms', 0):>9.1f}"
+              f"{level['error_rate']:>8.1%}")
+
+    routes = sorted({route for level in levels for route in level['routes']})
+    print(f"\np99 ms per route (errors in brackets)\n{'route':<20}" + ''.join(f"{level['concurrency']:>11}" for level in levels))
+    for route in routes:
+        cells = []
+        for level in levels:
+            stats = level['routes'].get(route)
+            cell = f"{stats['p99_ms']:.0f}" if stats and stats['count'] else '-'
+            if stats and stats['errors']:
+                cell += f" [{stats['errors']}]"
+            cells.append(f"{cell:>11}")
+        print(f"{route:<20}" + ''.join(cells))
+
+    print(f"\nPeak {summary['peak_throughput_rps']:.1f} req/s at {summary['peak_concurrency']} users; "
+          f"saturated from {summary['saturation_concurrency']} users", end='')
+    if summary['littles_law_knee'] is not None:
+        print(f" (Little's law knee: {summary['littles_law_knee']:g} users).")
+    else:
+        print(".")
+
+def main():
+    parser = argparse.ArgumentParser(description="Closed-loop mixed-workload load test of the API against a fake LLM.")
+    parser.add_argument('--db', default=os.path.join(PROJECT_ROOT, 'bench.db'), help="Database created by generate_data.py.")
+    parser.add_argument('--url', help="Test an API that is already running (it must use the fake LLM through OPENAI_BASE_URL).")
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32', help="Comma-separated numbers of users, one level each.")
+    parser.add_argument('--duration', type=float, default=20, help="Measured seconds per level.")
+    parser.add_argument('--warmup', type=float, default=3, help="Unmeasured seconds at the start of each level.")
+    parser.add_argument('--think-ms', type=float, default=0, help="Mean think time between a user's requests (exponential).")
+    parser.add_argument('--scenarios', help="JSON file of scenarios, replacing the built-in mix.")
+    parser.add_argument('--mix', help="Scenario weights, e.g. dashboard=8,login=1,chat=1 (others get 0).")
+    parser.add_argument('--llm-port', type=int, default=0, help="Port of the fake LLM (default: any free port).")
+    parser.add_argument('--llm-latency-ms', type=float, default=800)
+    parser.add_argument('--llm-jitter-ms', type=float, default=200)
+    parser.add_argument('--llm-tool-call-rate', type=float, default=0.3)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--saturation-ratio', type=float, default=0.9, help="Share of the peak throughput that counts as saturated.")
+    parser.add_argument('--timeout', type=float, default=60, help="Per-request timeout, in seconds.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Also write the results as JSON to this path.")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.db, args.port)
+        return
+    if not os.path.exists(args.db):
+        sys.exit(f"Database not found: {args.db}. Run benchmarks/generate_data.py first.")
+
+    scenarios = SCENARIOS
+    if args.scenarios:
+        with open(args.scenarios, 'r', encoding='utf-8') as f:
+            scenarios = json.load(f)
+    if args.mix:
+        weights = {name: float(weight) for name, weight in (item.split('=') for item in args.mix.split(','))}
+        scenarios = {name: dict(scenario, weight=weights.get(name, 0)) for name, scenario in scenarios.items()}
+    unknown = {step for scenario in scenarios.values() for step in scenario['steps']} - set(ROUTES)
+    if unknown:
+        sys.exit(f"Unknown routes in the scenarios: {', '.join(sorted(unknown))}")
+
+    import fake_llm
+    llm, model = fake_llm.serve(args.llm_port, latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                                tool_call_rate=args.llm_tool_call_rate, error_rate=args.llm_error_rate, seed=args.seed)
+    llm_url = f"http://127.0.0.1:{llm.server_address[1]}/v1"
+    print(f"Fake LLM on {llm_url}: {args.llm_latency_ms:g} ± {args.llm_jitter_ms:g} ms per completion")
+
+    process = None
+    base_url = args.url
+    if not base_url:
+        process, base_url = start_api(args.db, llm_url)
+    try:
+        print(f"Waiting for {base_url}/ready...")
+        wait_ready(base_url)
+        parameters = sample_parameters(args.db, random.Random(args.seed))
+
+        levels = []
+        for concurrency in (int(c) for c in args.concurrency.split(',')):
+            level = run_level(base_url, concurrency, scenarios, parameters, args.duration, args.warmup,
+                              args.think_ms, args.seed, args.timeout)
+            levels.append(level)
+            print(f"  {concurrency:>3} users: {level['throughput_rps']:.1f} req/s, "
+                  f"p99 {level['latency'].get('p99_ms', 0):.0f} ms, errors {level['error_rate']:.1%}")
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        llm.shutdown()
+
+    summary = saturation(levels, args.saturation_ratio)
+    print_report(levels, summary)
+    print(f"Fake LLM: {model.stats()['calls']} completions, at most {model.stats()['max_in_flight']} at once.")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'levels': levels, 'saturation': summary, 'scenarios': scenarios,
+                       'llm': {'latency_ms': args.llm_latency_ms, 'jitter_ms': args.llm_jitter_ms,
+                               'tool_call_rate': args.llm_tool_call_rate, 'error_rate': args.llm_error_rate}},
+                      f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+# run_benchmarks.py
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'API'))
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+BENCH_LOGIN = 'benchmark@example.com'
+BENCH_PASSWORD = 'benchmark-password'
+
+# Every read route of main.py that can run offline. `{heavy}` / `{light}` are replaced by the
+# most and least active clients, `{cnae}` by the most common CNAE, `{counterparty}` by the heavy
+# client's main counterparty and `{cnae_prefix}` / `{id_prefix}` by prefixes of the CNAE and of
+# the heavy client's ID. Left out: /api/chat, which calls OpenAI; the routes that write (sign-up,
+# /api/atualizar-dados, /api/configurar-sistema, /api/limpar-historico); /admin/*, which needs
+# ADMIN_TOKEN. Routes added to main.py get an entry here.
+ROUTES = [
+    ('overview_heavy', 'GET', '/transactions/overview?id={heavy}', None),
+    ('overview_light', 'GET', '/transactions/overview?id={light}', None),
+    ('list_heavy', 'GET', '/transactions/list?id={heavy}', None),
+    ('list_heavy_deep_page', 'GET', '/transactions/list?id={heavy}&page=200', None),
+    ('list_heavy_filtered', 'GET', '/transactions/list?id={heavy}&inOut=1&date=1,2,3&type=PIX,TED', None),
+    ('list_heavy_counterparty', 'GET', '/transactions/list?id={heavy}&customProv={counterparty}', None),
+    ('list_heavy_facets', 'GET', '/transactions/list?id={heavy}&facets=1', None),
+    ('list_light', 'GET', '/transactions/list?id={light}', None),
+    ('export_heavy', 'GET', '/transactions/export?id={heavy}&inOut=1', None),
+    ('export_heavy_gzip', 'GET', '/transactions/export?id={heavy}&format=ndjson&gzip=1', None),
+    ('counterparties_heavy', 'GET', '/transactions/counterparties?id={heavy}&top=10', None),
+    ('bar_chart_heavy', 'GET', '/transactions/graphs/barChart?id={heavy}', None),
+    ('bar_chart_light', 'GET', '/transactions/graphs/barChart?id={light}', None),
+    ('cnae_pie_chart', 'GET', '/cnae/graphs/pieChart', None),
+    ('cnae_list', 'GET', '/cnae/list?cnae={cnae}', None),
+    ('cnae_list_deep_page', 'GET', '/cnae/list?cnae={cnae}&page=50', None),
+    ('maturity_overview', 'GET', '/maturity/overview', None),
+    ('maturity_list', 'GET', '/maturity/list', None),
+    ('maturity_list_state', 'GET', '/maturity/list?state=Madura&page=10', None),
+    ('maturity_crosstab', 'GET', '/maturity/crosstab', None),
+    ('maturity_crosstab_cnae', 'GET', '/maturity/crosstab?cnae={cnae}', None),
+    ('cube_stage_month', 'GET', '/analytics/cube?dimensions=stage,month', None),
+    ('cube_cnae_cohort', 'GET', '/analytics/cube?dimensions=cnae,cohort&stage=Madura', None),
+    ('search_cnae', 'GET', '/search?q={cnae_prefix}', None),
+    ('search_id', 'GET', '/search?q={id_prefix}', None),
+    ('auth_login', 'POST', '/auth/login', {'login': BENCH_LOGIN, 'password': BENCH_PASSWORD}),
+    ('chat_status', 'GET', '/api/status', None),
+    ('chat_history', 'GET', '/api/historico', None),
+    ('metrics', 'GET', '/metrics', None),
+    ('ready', 'GET', '/ready', None),
+]
+
+class QueryCounter:
+    """Counts every SQL statement executed through sqlite3 connections opened by the API."""
+
+    def __init__(self):
+        self.count = 0
+        self._connect = sqlite3.connect
+
+    def _trace(self, statement):
+        self.count += 1
+
+    def install(self):
+        counter = self
+
+        def connect(*args, **kwargs):
+            conn = counter._connect(*args, **kwargs)
+            conn.set_trace_callback(counter._trace)
+            return conn
+
+        sqlite3.connect = connect
+
+def point_api_at(db_path):
+    """
+    Points every `scripts` module that owns a DB_PATH at the benchmark database, except the
+    chat history, which gets its own file next to it (as chat_history.db is next to banco.db).
+    """
+    history_path = os.path.splitext(db_path)[0] + '_chat_history.db'
+    for name, module in list(sys.modules.items()):
+        if name.startswith('scripts.') and hasattr(module, 'DB_PATH'):
+            module.DB_PATH = history_path if name == 'scripts.chat_history' else db_path
+
+def pick_parameters(db_path):
+    """Chooses the clients, CNAE and counterparty the routes are exercised with."""
+    conn = sqlite3.connect(db_path)
+    heavy, light = conn.execute("""
+        SELECT
+            (SELECT ID_CLIE FROM CONTRAPARTES GROUP BY ID_CLIE ORDER BY SUM(QT_ENTR + QT_SAID) DESC LIMIT 1),
+            (SELECT ID_CLIE FROM CONTRAPARTES GROUP BY ID_CLIE ORDER BY SUM(QT_ENTR + QT_SAID) ASC LIMIT 1)
+    """).fetchone()
+    cnae = conn.execute("SELECT DS_CNAE FROM ID GROUP BY DS_CNAE ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    counterparty = conn.execute(
+        "SELECT ID_CTPT FROM CONTRAPARTES WHERE ID_CLIE = ? ORDER BY QT_ENTR + QT_SAID DESC LIMIT 1", (heavy,)
+    ).fetchone()[0]
+    conn.close()
+    # On an interned database CONTRAPARTES holds client codes; the routes take the text IDs
+    from scripts import interning
+    clients = interning.load(db_path)
+    heavy, light, counterparty = clients.decode(heavy), clients.decode(light), clients.decode(counterparty)
+    return {'heavy': heavy, 'light': light, 'cnae': cnae, 'counterparty': counterparty,
+            'cnae_prefix': cnae.split()[0][:4], 'id_prefix': heavy[:-3]}
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def run_route(client, counter, method, path, body, iterations, warmup):
+    """Calls a route `warmup + iterations` times and returns its latency and query statistics."""
+    latencies = []
+    queries = []
+    for i in range(warmup + iterations):
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        # Consume streamed bodies so exports are measured end to end
+        response.get_data()
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries.append(counter.count)
+
+    latencies.sort()
+    return {
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'queries_per_request': sum(queries) / len(queries)
+    }
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """
+    Returns the list of regressions of `results` against `baseline`. Latency changes
+    smaller than `min_delta_ms` are ignored so sub-millisecond routes don't flap.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if (current[metric] > previous[metric] * (1 + threshold)
+                    and current[metric] - previous[metric] > min_delta_ms):
+                regressions.append(f"{name}: {metric} {previous[metric]:.2f} -> {current[metric]:.2f}")
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(
+                f"{name}: queries/request {previous['queries_per_request']:g} -> {current['queries_per_request']:g}"
+            )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks every API route against a synthetic database.")
+    parser.add_argument('--db', default=os.path.join(PROJECT_ROOT, 'bench.db'), help="Database created by generate_data.py.")
+    parser.add_argument('--iterations', type=int, default=30, help="Measured requests per route.")
+    parser.add_argument('--warmup', type=int, default=3, help="Unmeasured requests per route.")
+    parser.add_argument('--only', help="Comma-separated route names to run.")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline JSON to compare against.")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed relative latency regression (0.2 = 20%%).")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help="Ignore latency changes smaller than this.")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline.")
+    parser.add_argument('--output', help="Also write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"Database not found: {args.db}. Run benchmarks/generate_data.py first.")
+
+    counter = QueryCounter()
+    counter.install()
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    # The startup warm-up would compete with the measured requests (see startup_benchmark.py)
+    os.environ['WARMUP'] = '0'
+    import main as api
+    point_api_at(args.db)
+    api.app.testing = True
+    client = api.app.test_client()
+
+    # Make sure the login benchmark exercises a real password check
+    client.post('/auth/signUp', json={'login': BENCH_LOGIN, 'password': BENCH_PASSWORD})
+
+    parameters = pick_parameters(args.db)
+    selected = set(args.only.split(',')) if args.only else None
+
+    results = {}
+    print(f"{'route':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}")
+    for name, method, path, body in ROUTES:
+        if selected and name not in selected:
+            continue
+        stats = run_route(client, counter, method, path.format(**parameters), body, args.iterations, args.warmup)
+        results[name] = stats
+        print(f"{name:<28}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['queries_per_request']:>9g}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# startup_benchmark.py
+
+import argparse
+import json
+import os
+from statistics import median
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'API'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Routes a dashboard hits first. `{heavy}` is replaced by the most active client.
+FIRST_ROUTES = [
+    ('cnae_pie_chart', '/cnae/graphs/pieChart'),
+    ('maturity_overview', '/maturity/overview'),
+    ('overview_heavy', '/transactions/overview?id={heavy}'),
+]
+
+def evict_page_cache(db_path):
+    """Drops the database file from the OS page cache (Linux), so every run starts cold."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for path in (db_path, db_path + '-wal'):
+        if os.path.exists(path):
+            fd = os.open(path, os.O_RDONLY)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            os.close(fd)
+
+def child(mode, db_path, heavy):
+    """
+    One measured process start. `cold` serves the first requests right after import;
+    `warm` runs the warm-up, waits for /ready, then serves them.
+    """
+    evict_page_cache(db_path)
+    started = time.perf_counter()
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    # The warm-up is started by hand below, once the API points at the benchmark database
+    os.environ['WARMUP'] = '0'
+    import main as api
+    from run_benchmarks import point_api_at
+    import_ms = (time.perf_counter() - started) * 1000
+    point_api_at(db_path)
+    client = api.app.test_client()
+
+    result = {'import_ms': import_ms, 'ready_ms': None, 'routes': {}}
+    if mode == 'warm':
+        api.warmup.start([('openai_client', lambda: api.chat_agent.client)])
+        while client.get('/ready').status_code != 200:
+            time.sleep(0.005)
+        result['ready_ms'] = (time.perf_counter() - started) * 1000
+
+    for name, path in FIRST_ROUTES:
+        request_started = time.perf_counter()
+        response = client.get(path.format(heavy=heavy))
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        now = time.perf_counter()
+        result['routes'][name] = {
+            'latency_ms': (now - request_started) * 1000,
+            'since_start_ms': (now - started) * 1000
+        }
+
+    if mode == 'cold':
+        # What an eager `import openai` used to add to every start
+        openai_started = time.perf_counter()
+        import openai  # noqa: F401
+        result['openai_import_ms'] = (time.perf_counter() - openai_started) * 1000
+
+    print(json.dumps(result))
+
+def run(mode, db_path, heavy):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, '--db', db_path, '--heavy', heavy],
+        check=True, capture_output=True, text=True).stdout
+    # Init messages printed by the API come before the result line
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures import time and time to first good response of the API.")
+    parser.add_argument('--db', default=os.path.join(PROJECT_ROOT, 'bench.db'), help="Database generated by generate_data.py.")
+    parser.add_argument('--runs', type=int, default=5, help="Process starts per mode (the median is reported).")
+    parser.add_argument('--child', choices=('cold', 'warm'), help=argparse.SUPPRESS)
+    parser.add_argument('--heavy', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"Database not found: {args.db}. Run benchmarks/generate_data.py first.")
+
+    if args.child:
+        child(args.child, args.db, args.heavy)
+        return
+
+    from run_benchmarks import pick_parameters
+    heavy = pick_parameters(args.db)['heavy']
+    runs = {mode: [run(mode, args.db, heavy) for _ in range(args.runs)] for mode in ('cold', 'warm')}
+
+    cold, warm = runs['cold'], runs['warm']
+    print(f"import main (openai deferred):   {median([r['import_ms'] for r in cold]):>9.1f} ms")
+    print(f"import openai (now deferred):    {median([r['openai_import_ms'] for r in cold]):>9.1f} ms")
+    print(f"warm-up until /ready:            {median([r['ready_ms'] for r in warm]):>9.1f} ms")
+    print()
+    print(f"{'route':<22}{'cold first ms':>15}{'warm first ms':>15}{'cold since start':>18}{'warm since start':>18}")
+    for name, _ in FIRST_ROUTES:
+        print(f"{name:<22}"
+              f"{median([r['routes'][name]['latency_ms'] for r in cold]):>15.1f}"
+              f"{median([r['routes'][name]['latency_ms'] for r in warm]):>15.1f}"
+              f"{median([r['routes'][name]['since_start_ms'] for r in cold]):>18.1f}"
+              f"{median([r['routes'][name]['since_start_ms'] for r in warm]):>18.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -24,3 +24,149 @@ CREATE TABLE IF NOT EXISTS USERS (
     login TEXT UNIQUE NOT NULL,           -- Login do usuário (e.g., email)
     pwd TEXT NOT NULL                     -- Senha hash
 );
+
+-- Agregados por par (cliente, contraparte), mantidos pelos triggers abaixo
+CREATE TABLE IF NOT EXISTS CONTRAPARTES (
+    ID_CLIE TEXT NOT NULL,                -- ID do cliente
+    ID_CTPT TEXT NOT NULL,                -- ID da contraparte (cliente ou fornecedor)
+    VL_ENTR INTEGER NOT NULL DEFAULT 0,   -- Total recebido da contraparte
+    VL_SAID INTEGER NOT NULL DEFAULT 0,   -- Total pago à contraparte
+    QT_ENTR INTEGER NOT NULL DEFAULT 0,   -- Quantidade de recebimentos
+    QT_SAID INTEGER NOT NULL DEFAULT 0,   -- Quantidade de pagamentos
+    DT_ULTM DATE,                         -- Data da última transação entre os dois
+    PRIMARY KEY (ID_CLIE, ID_CTPT)
+);
+
+CREATE INDEX IF NOT EXISTS IX_CONTRAPARTES_TOTAL ON CONTRAPARTES (ID_CLIE, (VL_ENTR + VL_SAID) DESC);
+CREATE INDEX IF NOT EXISTS IX_CONTRAPARTES_ENTR ON CONTRAPARTES (ID_CLIE, VL_ENTR DESC);
+CREATE INDEX IF NOT EXISTS IX_CONTRAPARTES_SAID ON CONTRAPARTES (ID_CLIE, VL_SAID DESC);
+
+CREATE TRIGGER IF NOT EXISTS TG_CONTRAPARTES_INSERT AFTER INSERT ON TRANSACOES
+BEGIN
+    INSERT INTO CONTRAPARTES (ID_CLIE, ID_CTPT, VL_ENTR, QT_ENTR, DT_ULTM)
+    VALUES (NEW.ID_RCBE, NEW.ID_PGTO, NEW.VL, 1, NEW.DT_REFE)
+    ON CONFLICT (ID_CLIE, ID_CTPT) DO UPDATE SET
+        VL_ENTR = VL_ENTR + excluded.VL_ENTR,
+        QT_ENTR = QT_ENTR + 1,
+        DT_ULTM = MAX(COALESCE(DT_ULTM, ''), excluded.DT_ULTM);
+
+    INSERT INTO CONTRAPARTES (ID_CLIE, ID_CTPT, VL_SAID, QT_SAID, DT_ULTM)
+    VALUES (NEW.ID_PGTO, NEW.ID_RCBE, NEW.VL, 1, NEW.DT_REFE)
+    ON CONFLICT (ID_CLIE, ID_CTPT) DO UPDATE SET
+        VL_SAID = VL_SAID + excluded.VL_SAID,
+        QT_SAID = QT_SAID + 1,
+        DT_ULTM = MAX(COALESCE(DT_ULTM, ''), excluded.DT_ULTM);
+END;
+
+-- DT_ULTM is not rolled back on delete; run `rebuild_counterparties` after bulk deletes.
+CREATE TRIGGER IF NOT EXISTS TG_CONTRAPARTES_DELETE AFTER DELETE ON TRANSACOES
+BEGIN
+    UPDATE CONTRAPARTES SET VL_ENTR = VL_ENTR - OLD.VL, QT_ENTR = QT_ENTR - 1
+    WHERE ID_CLIE = OLD.ID_RCBE AND ID_CTPT = OLD.ID_PGTO;
+
+    UPDATE CONTRAPARTES SET VL_SAID = VL_SAID - OLD.VL, QT_SAID = QT_SAID - 1
+    WHERE ID_CLIE = OLD.ID_PGTO AND ID_CTPT = OLD.ID_RCBE;
+
+    DELETE FROM CONTRAPARTES
+    WHERE ID_CLIE IN (OLD.ID_PGTO, OLD.ID_RCBE) AND ID_CTPT IN (OLD.ID_PGTO, OLD.ID_RCBE)
+      AND QT_ENTR <= 0 AND QT_SAID <= 0;
+END;
+
+-- Contagens de empresas por estágio e por (CNAE, estágio), recalculadas a cada classificação
+CREATE TABLE IF NOT EXISTS MATURIDADE_CONTAGEM (
+    MATU TEXT PRIMARY KEY,                -- Estágio de maturidade
+    QT_EMPR INTEGER NOT NULL              -- Quantidade de empresas no estágio
+);
+
+CREATE TABLE IF NOT EXISTS MATURIDADE_CNAE (
+    DS_CNAE TEXT NOT NULL,                -- Descrição CNAE (do registro mais recente da empresa)
+    MATU TEXT NOT NULL,                   -- Estágio de maturidade
+    QT_EMPR INTEGER NOT NULL,             -- Quantidade de empresas
+    PRIMARY KEY (DS_CNAE, MATU)
+);
+
+-- Cubo analítico CNAE x estágio x coorte de abertura x mês, reconstruído a cada classificação e carga
+CREATE TABLE IF NOT EXISTS CUBO_TRANSACOES (
+    DS_CNAE TEXT,                         -- Descrição CNAE
+    MATU TEXT,                            -- Estágio de maturidade
+    AA_COORT TEXT,                        -- Ano de abertura da empresa (coorte)
+    AA_MES TEXT NOT NULL,                 -- Mês das transações (AAAA-MM)
+    VL_ENTR INTEGER NOT NULL,             -- Valor recebido pelas empresas da célula
+    VL_SAID INTEGER NOT NULL,             -- Valor pago pelas empresas da célula
+    QT_ENTR INTEGER NOT NULL,             -- Quantidade de transações recebidas
+    QT_SAID INTEGER NOT NULL,             -- Quantidade de transações pagas
+    QT_EMPR_ATIV INTEGER NOT NULL         -- Empresas com alguma transação no mês
+);
+
+CREATE INDEX IF NOT EXISTS IX_CUBO_TRANSACOES_MES ON CUBO_TRANSACOES (AA_MES);
+
+CREATE TABLE IF NOT EXISTS CUBO_EMPRESAS (
+    DS_CNAE TEXT,                         -- Descrição CNAE
+    MATU TEXT,                            -- Estágio de maturidade
+    AA_COORT TEXT,                        -- Ano de abertura da empresa (coorte)
+    QT_EMPR INTEGER NOT NULL              -- Quantidade de empresas
+);
+
+CREATE TABLE IF NOT EXISTS CUBO_CONSTRUCAO (
+    DT_CONS TEXT NOT NULL,                -- Data e hora da última construção
+    QT_LINH INTEGER NOT NULL,             -- Linhas de CUBO_TRANSACOES
+    MS_CONS REAL NOT NULL                 -- Duração da construção, em milissegundos
+);
+
+-- Índice de busca (FTS5) sobre as descrições CNAE, mantido pelos triggers em ID
+CREATE TABLE IF NOT EXISTS BUSCA_CNAE_DOCS (
+    DOCID INTEGER PRIMARY KEY,            -- Chave técnica do documento
+    DS_CNAE TEXT UNIQUE NOT NULL          -- Descrição CNAE
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS BUSCA_CNAE USING fts5(
+    DS_CNAE,
+    content='BUSCA_CNAE_DOCS',
+    content_rowid='DOCID',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS TG_BUSCA_CNAE_DOCS_INSERT AFTER INSERT ON BUSCA_CNAE_DOCS
+BEGIN
+    INSERT INTO BUSCA_CNAE (rowid, DS_CNAE) VALUES (NEW.DOCID, NEW.DS_CNAE);
+END;
+
+CREATE TRIGGER IF NOT EXISTS TG_BUSCA_CNAE_DOCS_DELETE AFTER DELETE ON BUSCA_CNAE_DOCS
+BEGIN
+    INSERT INTO BUSCA_CNAE (BUSCA_CNAE, rowid, DS_CNAE) VALUES ('delete', OLD.DOCID, OLD.DS_CNAE);
+END;
+
+CREATE TRIGGER IF NOT EXISTS TG_BUSCA_ID_INSERT AFTER INSERT ON ID
+WHEN NEW.DS_CNAE IS NOT NULL
+BEGIN
+    INSERT OR IGNORE INTO BUSCA_CNAE_DOCS (DS_CNAE) VALUES (NEW.DS_CNAE);
+END;
+
+CREATE TRIGGER IF NOT EXISTS TG_BUSCA_ID_UPDATE AFTER UPDATE OF DS_CNAE ON ID
+WHEN OLD.DS_CNAE IS NOT NEW.DS_CNAE
+BEGIN
+    DELETE FROM BUSCA_CNAE_DOCS
+    WHERE DS_CNAE = OLD.DS_CNAE AND NOT EXISTS (SELECT 1 FROM ID WHERE DS_CNAE = OLD.DS_CNAE);
+    INSERT OR IGNORE INTO BUSCA_CNAE_DOCS (DS_CNAE) SELECT NEW.DS_CNAE WHERE NEW.DS_CNAE IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS TG_BUSCA_ID_DELETE AFTER DELETE ON ID
+BEGIN
+    DELETE FROM BUSCA_CNAE_DOCS
+    WHERE DS_CNAE = OLD.DS_CNAE AND NOT EXISTS (SELECT 1 FROM ID WHERE DS_CNAE = OLD.DS_CNAE);
+END;
+
+-- O histórico do chat (HISTORICO_CHAT) fica em chat_history.db, criado por scripts/chat_history.py:
+-- gravá-lo aqui mudaria a versão dos dados a cada mensagem e invalidaria os agregados em cache.
+
+CREATE TABLE IF NOT EXISTS PARTICOES_TRANSACOES (
+    NM_TABE TEXT PRIMARY KEY,             -- Nome da tabela da partição
+    DT_INIC TEXT NOT NULL,                -- Início do período (inclusivo)
+    DT_FIM TEXT NOT NULL,                 -- Fim do período (exclusivo)
+    NM_ARQV TEXT                          -- Arquivo de arquivo morto (relativo ao banco) ou NULL se local
+);
+
+-- O dicionário de clientes (CLIENTES) não é criado aqui: `python -m scripts.intern` o cria ao
+-- migrar o banco, e então TRANSACOES.ID_PGTO/ID_RCBE e CONTRAPARTES.ID_CLIE/ID_CTPT passam a
+-- guardar CD_CLIE (INTEGER). Ver scripts/interning.py.